@@ -0,0 +1,23 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+return new class extends Migration
+{
+    public function up(): void
+    {
+        Schema::table('patients', function (Blueprint $table) {
+            // sha256 of the feature vector last_risk_score was computed from (set by FastAPI)
+            $table->char('risk_feature_hash', 64)->nullable()->after('last_predicted_at');
+        });
+    }
+
+    public function down(): void
+    {
+        Schema::table('patients', function (Blueprint $table) {
+            $table->dropColumn('risk_feature_hash');
+        });
+    }
+};
@@ -0,0 +1,89 @@
+"""Semantic cache of RAG answers, matched by query-embedding similarity."""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """Cache of RAG answers looked up by query-embedding similarity.
+
+    Entries live in namespaces derived from the endpoint, prompt template,
+    LLM model and (for patient-specific prompts) a hash of the patient dict,
+    so an answer is only ever reused for the same kind of prompt about the
+    same patient. Within a namespace the best match with cosine similarity
+    >= ``threshold`` is returned. Entries expire after ``ttl`` seconds and the
+    least recently used are evicted beyond ``max_entries``.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 86400.0, threshold: float = 0.95):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: OrderedDict[int, tuple[str, np.ndarray, dict, float]] = OrderedDict()
+        self._by_namespace: dict[str, set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def namespace(endpoint: str, template: str, model: str, patient: dict | None = None) -> str:
+        payload = json.dumps([endpoint, template, model, patient], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, namespace: str, vector) -> dict | None:
+        q = np.asarray(vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        now = time.monotonic()
+        with self._lock:
+            ids = list(self._by_namespace.get(namespace, ()))
+            live = []
+            for entry_id in ids:
+                if self._entries[entry_id][3] <= now:
+                    self._drop(entry_id)
+                    self._stats["expired"] += 1
+                else:
+                    live.append(entry_id)
+            if live:
+                sims = np.stack([self._entries[i][1] for i in live]) @ q
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self._entries.move_to_end(live[best])
+                    self._stats["hits"] += 1
+                    return dict(self._entries[live[best]][2], similarity=round(float(sims[best]), 4))
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, namespace: str, vector, answer: dict) -> None:
+        v = np.asarray(vector, dtype=np.float32)
+        v = v / (np.linalg.norm(v) or 1.0)
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, v, dict(answer), time.monotonic() + self.ttl)
+            self._by_namespace.setdefault(namespace, set()).add(entry_id)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _drop(self, entry_id: int) -> None:
+        namespace = self._entries.pop(entry_id)[0]
+        ids = self._by_namespace.get(namespace)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._by_namespace[namespace]
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s["hits"] + s["misses"]
+            s["size"] = len(self._entries)
+            s["max_entries"] = self.max_entries
+            s["threshold"] = self.threshold
+            s["hit_ratio"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+            return s
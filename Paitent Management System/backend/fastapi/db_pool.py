@@ -0,0 +1,196 @@
+"""Pooled MySQL connections to the Laravel database.
+
+``MySQLPool.connection()`` hands out reusable connections (see the class
+docstring for sizing, recycling and health checks); ``connect_mysql`` opens
+one from the ``DB_*`` environment settings. Pool events and checkout times
+are counted in metrics.py as they happen; the connection gauges are set from
+``stats()`` when metrics are collected.
+"""
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import Error
+
+import metrics
+
+
+def connect_mysql():
+    """Connect to Laravel MySQL database"""
+    try:
+        conn = mysql.connector.connect(
+            host=os.getenv("DB_HOST", "localhost"),
+            port=int(os.getenv("DB_PORT", "3306")),
+            user=os.getenv("DB_USERNAME", "root"),
+            password=os.getenv("DB_PASSWORD", ""),
+            database=os.getenv("DB_DATABASE", "laravel"),
+            connection_timeout=int(os.getenv("DB_CONNECT_TIMEOUT", "10")),
+            # Pooled connections live across requests; without autocommit a
+            # reused connection would keep reading its first REPEATABLE READ
+            # snapshot and never see scores written by Laravel.
+            autocommit=True,
+        )
+        return conn
+    except Error as e:
+        print(f"MySQL connection error: {e}")
+        return None
+
+
+class MySQLPool:
+    """Bounded pool of reusable MySQL connections.
+
+    Connections are created on demand up to ``size``; callers beyond that wait
+    up to ``timeout`` seconds for one to be returned. Idle connections older
+    than ``recycle`` seconds are replaced, and ones idle longer than
+    ``ping_after`` seconds are pinged (with reconnect) before being handed out.
+    """
+
+    def __init__(self, size: int = 5, timeout: float = 5.0, recycle: float = 1800.0, ping_after: float = 30.0,
+                 connect=None):
+        self.connect = connect or connect_mysql
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: queue.LifoQueue = queue.LifoQueue()  # (conn, created_at, last_used)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._open = 0
+        self._stats = {
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "checkout_ms_total": 0.0,
+            "checkout_ms_max": 0.0,
+        }
+
+    def _bump(self, key: str, n: float = 1) -> None:
+        with self._lock:
+            self._stats[key] += n
+        metrics.DB_POOL_EVENTS.inc(n, event=key)
+
+    def _checkout_healthy(self):
+        """Pop an idle connection (or open a new one) and make sure it is alive."""
+        now = time.monotonic()
+        while True:
+            try:
+                conn, created_at, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if now - created_at > self.recycle:
+                self._discard(conn)
+                continue
+            if now - last_used > self.ping_after:
+                try:
+                    conn.ping(reconnect=False)
+                except Error:
+                    try:
+                        conn.reconnect(attempts=1, delay=0)
+                        self._bump("reconnects")
+                        created_at = now
+                    except Error:
+                        self._discard(conn)
+                        continue
+            return conn, created_at
+
+        conn = self.connect()
+        if conn is None:
+            return None, now
+        with self._lock:
+            self._open += 1
+            self._stats["connects"] += 1
+        metrics.DB_POOL_EVENTS.inc(event="connects")
+        return conn, now
+
+    def _discard(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._open -= 1
+            self._stats["discarded"] += 1
+        metrics.DB_POOL_EVENTS.inc(event="discarded")
+
+    @contextmanager
+    def connection(self):
+        """Yield a pooled connection, or ``None`` if MySQL is unavailable.
+
+        The connection is returned to the pool on exit. If the block raises a
+        MySQL error the connection is dropped instead, so a broken socket is
+        never reused.
+        """
+        start = time.perf_counter()
+        if not self._slots.acquire(blocking=False):
+            self._bump("waits")
+            if not self._slots.acquire(timeout=self.timeout):
+                self._bump("timeouts")
+                print(f"MySQL pool exhausted after {self.timeout}s wait")
+                yield None
+                return
+
+        conn = None
+        created_at = time.monotonic()
+        try:
+            conn, created_at = self._checkout_healthy()
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            with self._lock:
+                self._in_use += 1
+                self._stats["checkouts"] += 1
+                self._stats["checkout_ms_total"] += elapsed_ms
+                self._stats["checkout_ms_max"] = max(self._stats["checkout_ms_max"], elapsed_ms)
+            metrics.DB_POOL_EVENTS.inc(event="checkouts")
+            metrics.DB_POOL_CHECKOUT.observe(elapsed_ms / 1000.0)
+        except Exception:
+            self._slots.release()
+            raise
+
+        healthy = conn is not None
+        try:
+            yield conn
+        except Error:
+            healthy = False
+            raise
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            if conn is not None:
+                if healthy:
+                    self._idle.put((conn, created_at, time.monotonic()))
+                else:
+                    self._discard(conn)
+            self._slots.release()
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                conn, _, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(conn)
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            checkouts = s["checkouts"] or 1
+            return {
+                "size": self.size,
+                "open": self._open,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "checkouts": s["checkouts"],
+                "waits": s["waits"],
+                "timeouts": s["timeouts"],
+                "connects": s["connects"],
+                "reconnects": s["reconnects"],
+                "discarded": s["discarded"],
+                "checkout_ms_avg": round(s["checkout_ms_total"] / checkouts, 3),
+                "checkout_ms_max": round(s["checkout_ms_max"], 3),
+            }
@@ -0,0 +1,98 @@
+"""Cache of OpenAI query embeddings used by retrieval (memory LRU, optional sqlite)."""
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """Content-addressed cache of query embeddings.
+
+    Keys are a hash of the embedding model name and the whitespace-normalized
+    query text, so the templated chatbot prompts and repeated questions map to
+    the same entry. Memory is an LRU bounded by ``max_entries``; when
+    ``sqlite_path`` is set vectors are also persisted (as float32 blobs) and
+    survive restarts.
+    """
+
+    def __init__(self, max_entries: int = 2048, sqlite_path: str | None = None):
+        self.max_entries = max(1, max_entries)
+        self._lru: OrderedDict[str, list[float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+        self._sqlite = None
+        if sqlite_path:
+            try:
+                self._sqlite = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._sqlite.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS embedding_cache (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        vector BLOB NOT NULL,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                self._sqlite.commit()
+            except sqlite3.Error as e:
+                print(f"Embedding cache sqlite disabled: {e}")
+                self._sqlite = None
+
+    @staticmethod
+    def make_key(text: str, model: str) -> str:
+        normalized = " ".join(unicodedata.normalize("NFKC", text).split())
+        return hashlib.sha256(f"{model}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> list[float] | None:
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self._stats["hits"] += 1
+                return vec
+            if self._sqlite is not None:
+                try:
+                    row = self._sqlite.execute("SELECT vector FROM embedding_cache WHERE key = ?", (key,)).fetchone()
+                except sqlite3.Error:
+                    row = None
+                if row:
+                    vec = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._put(key, vec)
+                    self._stats["disk_hits"] += 1
+                    return vec
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, vector: list[float], model: str) -> None:
+        with self._lock:
+            self._put(key, list(vector))
+            if self._sqlite is not None:
+                try:
+                    self._sqlite.execute(
+                        "INSERT OR REPLACE INTO embedding_cache (key, model, vector) VALUES (?, ?, ?)",
+                        (key, model, np.asarray(vector, dtype=np.float32).tobytes()),
+                    )
+                    self._sqlite.commit()
+                except sqlite3.Error:
+                    pass
+
+    def _put(self, key: str, vector: list[float]) -> None:
+        self._lru[key] = vector
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s["hits"] + s["disk_hits"] + s["misses"]
+            s["size"] = len(self._lru)
+            s["max_entries"] = self.max_entries
+            s["disk_enabled"] = self._sqlite is not None
+            s["hit_ratio"] = round((s["hits"] + s["disk_hits"]) / lookups, 4) if lookups else 0.0
+            return s
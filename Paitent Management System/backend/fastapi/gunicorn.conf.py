@@ -0,0 +1,70 @@
+"""Multi-worker production server: gunicorn managing uvicorn workers.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+``preload_app`` imports main.py once in the master, ``when_ready`` loads the
+fork-safe models there (main.preload_for_fork), and every worker is forked
+from that state, so N workers cost far less than N copies of the models.
+Plain ``uvicorn --workers N`` spawns fresh interpreters instead and each one
+loads its own copy, apart from the memory-mapped artifacts.
+
+State that lives in a worker, with more than one of them:
+    /metrics          merged across workers through METRICS_MULTIPROC_DIR (see
+                      metrics.py); set here to a fresh temp directory if unset
+    caches            per worker, keyed by content (features + model version +
+                      patient), so they never need invalidating across workers;
+                      PREDICTION_CACHE_SQLITE / EMBEDDING_CACHE_SQLITE are shared
+    /risk-summary     per worker, reads other workers' saved scores back from
+                      MySQL every RISK_SUMMARY_SYNC_SECONDS
+    /health/*         the answering worker only
+
+Environment:
+    WEB_CONCURRENCY       number of workers, or "auto" for one per CPU (default 1)
+    PORT                  listen port (default 8000)
+    WORKER_TIMEOUT        seconds before a silent worker is restarted (default 120)
+    METRICS_MULTIPROC_DIR shared metrics directory, emptied at start
+"""
+import multiprocessing
+import os
+import tempfile
+
+_workers = os.getenv("WEB_CONCURRENCY", "1").strip().lower()
+workers = multiprocessing.cpu_count() if _workers == "auto" else max(1, int(_workers))
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+preload_app = True
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+accesslog = "-"
+
+if workers > 1 and not os.getenv("METRICS_MULTIPROC_DIR"):
+    # Without it every scrape would see a single worker's metrics
+    os.environ["METRICS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="fastapi-metrics-")
+
+
+def on_starting(server):
+    import metrics
+
+    if metrics.multiprocess_dir():
+        os.makedirs(metrics.multiprocess_dir(), exist_ok=True)
+        metrics.clear_multiprocess_dir()
+
+
+def when_ready(server):
+    import main
+    import metrics
+
+    loaded = main.preload_for_fork()
+    if metrics.multiprocess_dir():
+        # Load timings etc. recorded here count once; workers clear the copies they inherit
+        metrics.write_snapshot()
+        metrics.mark_process_dead(os.getpid())
+    server.log.info("Preloaded before fork: %s (%d workers)", ", ".join(loaded) or "nothing", workers)
+
+
+def child_exit(server, worker):
+    import metrics
+
+    if metrics.multiprocess_dir():
+        metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,383 @@
+"""Offline ingestion of medical books into the RAG vector index.
+
+Replaces the notebook flow in ``Lifestyle Guidance Model/Chatbot_using_RAG.ipynb``
+(read whole PDF -> split words -> embed -> upsert) with a streaming pipeline:
+
+* pages are read one at a time from the PDF (PyMuPDF),
+* chunks are cut per page with word overlap, the first chunk of a page
+  carrying the previous page's tail. Editing a page changes its own chunks
+  and, when the edit touches its last ``overlap`` words, the first chunk of
+  the next page; every other page keeps its chunks,
+* every chunk is identified by a hash of its text; hashes already recorded in
+  the state database are skipped, which makes re-ingestion incremental and
+  lets an interrupted run resume where it stopped,
+* embedding + upsert run in parallel batches with a bounded number in flight.
+
+Re-ingesting never deletes on its own, so two kinds of leftovers can stay
+in the index next to the current chunks:
+
+* ``--prune`` deletes chunks of the ingested books that this run no longer
+  produced (edited pages, the next page's first chunk, a changed
+  ``--chunk-size``),
+* ``--purge-legacy`` deletes the ``chunk-<n>`` vectors the notebook
+  uploaded, once this run has ingested the books under hash ids.
+
+Alternatively ``--namespace`` ingests into a fresh Pinecone namespace, which
+the service reads once ``PINECONE_NAMESPACE`` points at it, leaving the old
+vectors untouched until the namespace they live in is deleted. The local
+target rebuilds its whole index from its own staging area, so it never holds
+legacy ids.
+
+Needs PyMuPDF (``pip install pymupdf``) in addition to the service
+requirements; it is an offline tool and is not installed in the API image.
+
+Usage:
+
+    python ingest_books.py MIMS.pdf formulary.pdf --target pinecone --index medicalbooks-1536 --purge-legacy
+    python ingest_books.py MIMS.pdf formulary.pdf --target pinecone --namespace books-v2
+    python ingest_books.py MIMS.pdf --target local --out vector_index --prune
+"""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from vector_store import write_index
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+MAX_UPSERT_BYTES = 4 * 1024 * 1024  # Pinecone request size limit
+MAX_DELETE_IDS = 1000  # Pinecone ids per delete request
+LEGACY_ID_PREFIX = "chunk-"  # ids written by the notebook: chunk-0, chunk-1, ...
+
+
+def iter_pages(path: str):
+    """Yield ``(page_number, text)`` one page at a time."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(path) as doc:
+        for i, page in enumerate(doc):
+            yield i + 1, page.get_text()
+
+
+def iter_chunks(pages, source: str, chunk_size: int = 300, overlap: int = 50):
+    """Cut ``chunk_size``-word windows with ``overlap`` words of overlap.
+
+    Windows restart at each page (prefixed with the last ``overlap`` words of
+    the previous page), so chunk boundaries of unchanged pages are stable
+    between runs; a page's first chunk also changes when the previous page's
+    tail does.
+    """
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be smaller than chunk_size")
+    step = chunk_size - overlap
+    carry: list[str] = []
+    for page_no, text in pages:
+        words = carry + text.split()
+        if not text.split():
+            continue
+        for start in range(0, max(len(words) - overlap, 1), step):
+            window = words[start:start + chunk_size]
+            chunk = " ".join(window)
+            yield {
+                "id": hashlib.sha256(chunk.encode("utf-8")).hexdigest()[:32],
+                "text": chunk,
+                "metadata": {"text": chunk, "source": os.path.basename(source), "page": page_no},
+            }
+        carry = words[-overlap:] if overlap else []
+
+
+class IngestState:
+    """Checkpoint store: which chunk hashes have already been embedded and upserted."""
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ingested_chunks (
+                id TEXT NOT NULL,
+                target TEXT NOT NULL,
+                source TEXT,
+                page INTEGER,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (id, target)
+            )
+            """
+        )
+        self.conn.commit()
+
+    def done(self, chunk_id: str, target: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM ingested_chunks WHERE id = ? AND target = ?", (chunk_id, target)
+        ).fetchone()
+        return row is not None
+
+    def mark(self, chunks: list[dict], target: str) -> None:
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO ingested_chunks (id, source, page, target) VALUES (?, ?, ?, ?)",
+            [(c["id"], c["metadata"]["source"], c["metadata"]["page"], target) for c in chunks],
+        )
+        self.conn.commit()
+
+    def ids(self, target: str, source: str) -> set[str]:
+        rows = self.conn.execute(
+            "SELECT id FROM ingested_chunks WHERE target = ? AND source = ?", (target, source)
+        ).fetchall()
+        return {row[0] for row in rows}
+
+    def forget(self, chunk_ids: list[str], target: str) -> None:
+        self.conn.executemany(
+            "DELETE FROM ingested_chunks WHERE id = ? AND target = ?", [(i, target) for i in chunk_ids]
+        )
+        self.conn.commit()
+
+
+def embed_batch(client, texts: list[str], retries: int = 5) -> list[list[float]]:
+    delay = 1.0
+    for attempt in range(retries):
+        try:
+            response = client.embeddings.create(model=EMBEDDING_MODEL, input=texts)
+            return [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        except Exception as e:
+            if attempt == retries - 1:
+                raise
+            print(f"Embedding batch failed ({e}); retrying in {delay:.0f}s")
+            time.sleep(delay)
+            delay *= 2
+    return []
+
+
+class PineconeSink:
+    name = "pinecone"
+
+    def __init__(self, index_name: str, namespace: str = ""):
+        from pinecone import Pinecone
+
+        api_key = os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise SystemExit("PINECONE_API_KEY not set")
+        self.index = Pinecone(api_key=api_key).Index(index_name)
+        self.namespace = namespace
+        # The namespace is part of the checkpoint target: a fresh namespace is ingested in full
+        self.name = f"pinecone:{index_name}" + (f"/{namespace}" if namespace else "")
+
+    def upsert(self, chunks: list[dict], vectors: list[list[float]]) -> None:
+        batch, size = [], 0
+        for chunk, vec in zip(chunks, vectors):
+            item = (chunk["id"], vec, chunk["metadata"])
+            item_size = len(json.dumps(item))
+            if batch and size + item_size > MAX_UPSERT_BYTES:
+                self.index.upsert(vectors=batch, namespace=self.namespace)
+                batch, size = [], 0
+            batch.append(item)
+            size += item_size
+        if batch:
+            self.index.upsert(vectors=batch, namespace=self.namespace)
+
+    def delete(self, chunk_ids: list[str]) -> None:
+        for start in range(0, len(chunk_ids), MAX_DELETE_IDS):
+            self.index.delete(ids=chunk_ids[start:start + MAX_DELETE_IDS], namespace=self.namespace)
+
+    def legacy_ids(self) -> list[str]:
+        ids: list[str] = []
+        for page in self.index.list(prefix=LEGACY_ID_PREFIX, namespace=self.namespace):
+            ids.extend(page)
+        return ids
+
+    def finalize(self) -> None:
+        pass
+
+
+class LocalSink:
+    """Appends vectors to a staging area, then rebuilds the local index from it.
+
+    The staging area (``<out>.staging``) is the persistent corpus: raw float32
+    vectors plus a metadata JSONL, appended to as new chunks arrive. Deletions
+    are appended to the JSONL as ``{"id": ..., "deleted": true}`` lines with no
+    vector. The rebuild streams both files, so the corpus never has to fit in
+    memory.
+    """
+
+    def __init__(self, out: str, ivf_lists: int = 0):
+        self.out = out
+        self.ivf_lists = ivf_lists
+        self.staging = out + ".staging"
+        os.makedirs(self.staging, exist_ok=True)
+        self.name = f"local:{os.path.abspath(out)}"
+        self._lock = threading.Lock()
+        self._dirty = False
+
+    def upsert(self, chunks: list[dict], vectors: list[list[float]]) -> None:
+        arr = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            dim_path = os.path.join(self.staging, "dimension")
+            if not os.path.exists(dim_path):
+                with open(dim_path, "w", encoding="utf-8") as f:
+                    f.write(str(arr.shape[1]))
+            with open(os.path.join(self.staging, "vectors.f32"), "ab") as f:
+                f.write(arr.tobytes())
+            with open(os.path.join(self.staging, "metadata.jsonl"), "a", encoding="utf-8") as f:
+                for chunk in chunks:
+                    f.write(json.dumps({"id": chunk["id"], "metadata": chunk["metadata"]}, ensure_ascii=False) + "\n")
+            self._dirty = True
+
+    def delete(self, chunk_ids: list[str]) -> None:
+        with self._lock:
+            with open(os.path.join(self.staging, "metadata.jsonl"), "a", encoding="utf-8") as f:
+                for chunk_id in chunk_ids:
+                    f.write(json.dumps({"id": chunk_id, "deleted": True}) + "\n")
+            self._dirty = True
+
+    def legacy_ids(self) -> list[str]:
+        return []  # rebuilt from staging only
+
+    def _staged(self):
+        """``(vector_row, record)`` per staged line; deletions have no vector row (None)."""
+        row = 0
+        with open(os.path.join(self.staging, "metadata.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("deleted"):
+                    yield None, record
+                else:
+                    yield row, record
+                    row += 1
+
+    def finalize(self) -> None:
+        if not self._dirty and os.path.isdir(self.out):
+            return
+        if not os.path.exists(os.path.join(self.staging, "metadata.jsonl")):
+            return
+        with open(os.path.join(self.staging, "dimension"), encoding="utf-8") as f:
+            dim = int(f.read())
+        vectors_path = os.path.join(self.staging, "vectors.f32")
+        n_rows = os.path.getsize(vectors_path) // (4 * dim)
+        # A crash between staging and checkpointing can stage a chunk twice (keep the last copy)
+        # or stage a vector without its metadata line, or the other way round (skip it)
+        last: dict[str, int] = {}
+        for row, record in self._staged():
+            if row is None:
+                last.pop(record["id"], None)
+            elif row < n_rows:
+                last[record["id"]] = row
+        keep = sorted(last.values())
+        if not keep:
+            return
+        kept = set(keep)
+        vectors = np.memmap(vectors_path, dtype=np.float32, mode="r", shape=(n_rows, dim))
+        write_index(
+            self.out,
+            [record["id"] for row, record in self._staged() if row in kept],
+            vectors,
+            (record["metadata"] for row, record in self._staged() if row in kept),
+            EMBEDDING_MODEL,
+            self.ivf_lists,
+            rows=keep,
+        )
+        print(f"Local index rebuilt with {len(keep)} chunks at {self.out}")
+
+
+def ingest(paths: list[str], sink, state: IngestState, chunk_size: int, overlap: int,
+           batch_size: int, workers: int, prune: bool = False, purge_legacy: bool = False) -> dict:
+    """Ingest ``paths`` into ``sink``; the cleanup steps only run once every batch has been written."""
+    from openai import OpenAI
+
+    client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    counts = {"seen": 0, "skipped": 0, "ingested": 0, "pruned": 0, "purged_legacy": 0}
+    seen: set[str] = set()
+
+    def work(batch: list[dict]) -> list[dict]:
+        vectors = embed_batch(client, [c["text"] for c in batch])
+        sink.upsert(batch, vectors)
+        return batch
+
+    def batches():
+        pending: list[dict] = []
+        queued: set[str] = set()
+        for path in paths:
+            for chunk in iter_chunks(iter_pages(path), path, chunk_size, overlap):
+                counts["seen"] += 1
+                seen.add(chunk["id"])
+                if chunk["id"] in queued or state.done(chunk["id"], sink.name):
+                    counts["skipped"] += 1
+                    continue
+                queued.add(chunk["id"])
+                pending.append(chunk)
+                if len(pending) >= batch_size:
+                    yield pending
+                    pending = []
+        if pending:
+            yield pending
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        in_flight = set()
+        for batch in batches():
+            in_flight.add(pool.submit(work, batch))
+            # Keep memory bounded: never more than 2 batches per worker outstanding
+            if len(in_flight) >= workers * 2:
+                finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    done_batch = fut.result()
+                    state.mark(done_batch, sink.name)
+                    counts["ingested"] += len(done_batch)
+        for fut in in_flight:
+            done_batch = fut.result()
+            state.mark(done_batch, sink.name)
+            counts["ingested"] += len(done_batch)
+
+    if prune:
+        # Chunks recorded for these books that this run did not produce (the same text may be in two books)
+        for source in sorted({os.path.basename(p) for p in paths}):
+            stale = sorted(state.ids(sink.name, source) - seen)
+            if stale:
+                sink.delete(stale)
+                state.forget(stale, sink.name)
+                counts["pruned"] += len(stale)
+    if purge_legacy:
+        legacy = sink.legacy_ids()
+        if legacy:
+            sink.delete(legacy)
+        counts["purged_legacy"] = len(legacy)
+    sink.finalize()
+    return counts
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Ingest PDF books into the RAG vector index.")
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--target", choices=["pinecone", "local"], default="pinecone")
+    parser.add_argument("--index", default="medicalbooks-1536", help="Pinecone index name")
+    parser.add_argument("--namespace", default="", help="Pinecone namespace (set PINECONE_NAMESPACE to serve it)")
+    parser.add_argument("--out", default="vector_index", help="local index directory")
+    parser.add_argument("--ivf-lists", type=int, default=0, help="local index IVF lists (0 = exact)")
+    parser.add_argument("--state", default="ingest_state.sqlite", help="checkpoint database")
+    parser.add_argument("--chunk-size", type=int, default=300)
+    parser.add_argument("--overlap", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--prune", action="store_true",
+                        help="delete chunks of these books that this run no longer produces")
+    parser.add_argument("--purge-legacy", action="store_true",
+                        help=f"delete the notebook's {LEGACY_ID_PREFIX}<n> vectors after ingesting")
+    args = parser.parse_args(argv)
+
+    if args.target == "pinecone":
+        sink = PineconeSink(args.index, args.namespace)
+    else:
+        sink = LocalSink(args.out, args.ivf_lists)
+    counts = ingest(
+        args.pdfs, sink, IngestState(args.state),
+        args.chunk_size, args.overlap, args.batch_size, args.workers,
+        prune=args.prune, purge_legacy=args.purge_legacy,
+    )
+    print(f"Chunks seen: {counts['seen']}, skipped (already ingested): {counts['skipped']}, "
+          f"ingested: {counts['ingested']}, pruned: {counts['pruned']}, legacy purged: {counts['purged_legacy']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""Pure-NumPy scorer for the Ridge risk model.
+
+``export`` reads the fitted estimator (a bare linear regressor or a Pipeline
+of scalers followed by one) and folds everything into a single weight vector
+and intercept, written to a small ``.npz`` artifact:
+
+    format_version, model_type, feature_names, feature_schema, sklearn_version, source_sha256
+    coef (n_features,), intercept ()
+    probe_X (n, n_features), probe_y (n,)   sklearn's own predictions at export
+
+``LinearScorer`` serves that artifact with one dot product and no
+scikit-learn import. On load it re-scores the probe rows and refuses to start
+if they drift from what sklearn produced; when the original pickle and
+scikit-learn are both available it also compares against a live sklearn
+predict.
+
+    python linear_model.py export ridge_best_model_1.pkl --out ridge_best_model_1.npz
+"""
+import argparse
+import hashlib
+import json
+import os
+import warnings
+
+import numpy as np
+
+from patient_features import FEATURE_SCHEMA_VERSION
+
+FORMAT_VERSION = 1
+PROBE_ROWS = 64
+TOLERANCE = 1e-6  # absolute, in HbA1c units; folding a scaler changes rounding only
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def fold_estimator(estimator) -> tuple[np.ndarray, float]:
+    """Collapse ``[scalers...] -> linear regressor`` into ``(coef, intercept)``.
+
+    Supported steps are the affine scalers (StandardScaler, MinMaxScaler,
+    MaxAbsScaler, RobustScaler) and any single-output regressor exposing
+    ``coef_`` and ``intercept_``; anything else raises ``ValueError``.
+    """
+    steps = [s for _, s in estimator.steps] if hasattr(estimator, "steps") else [estimator]
+    steps = [s for s in steps if s is not None and s != "passthrough"]
+    *transforms, regressor = steps
+    if not hasattr(regressor, "coef_"):
+        raise ValueError(f"{type(regressor).__name__} is not a linear model")
+    coef = np.asarray(regressor.coef_, dtype=np.float64)
+    if coef.ndim != 1:
+        raise ValueError("Only single-output linear models can be exported")
+    intercept = float(np.asarray(regressor.intercept_, dtype=np.float64).reshape(-1)[0])
+
+    # Walk the transforms backwards: y = w.(x*scale + offset) + b
+    #   => y = (w*scale).x + (w.offset + b)
+    for t in reversed(transforms):
+        scale, offset = _affine(t, coef.shape[0])
+        intercept += float(coef @ offset)
+        coef = coef * scale
+    return coef, intercept
+
+
+def _affine(transform, n_features: int) -> tuple[np.ndarray, np.ndarray]:
+    """``(scale, offset)`` such that ``transform(x) == x * scale + offset``."""
+    name = type(transform).__name__
+    ones, zeros = np.ones(n_features), np.zeros(n_features)
+    if name == "StandardScaler":
+        scale = 1.0 / transform.scale_ if transform.scale_ is not None else ones
+        mean = transform.mean_ if transform.mean_ is not None else zeros
+        return scale, -mean * scale
+    if name == "MinMaxScaler":
+        return np.asarray(transform.scale_), np.asarray(transform.min_)
+    if name == "MaxAbsScaler":
+        return 1.0 / transform.scale_, zeros
+    if name == "RobustScaler":
+        scale = 1.0 / transform.scale_ if transform.scale_ is not None else ones
+        center = transform.center_ if transform.center_ is not None else zeros
+        return scale, -center * scale
+    raise ValueError(f"Cannot fold {name} into a linear scorer")
+
+
+def _probe_rows(n_features: int, estimator) -> np.ndarray:
+    """Deterministic inputs spread around the training distribution if known."""
+    rng = np.random.default_rng(0)
+    mean, spread = np.zeros(n_features), np.full(n_features, 10.0)
+    for _, step in getattr(estimator, "steps", []):
+        if type(step).__name__ == "StandardScaler" and step.mean_ is not None:
+            mean, spread = step.mean_, step.scale_ * 3
+            break
+    return mean + rng.standard_normal((PROBE_ROWS, n_features)) * spread
+
+
+def _sklearn_predict(estimator, X: np.ndarray) -> np.ndarray:
+    # Probe rows are plain arrays; the model may have been fitted on a DataFrame
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=r"X does not have valid feature names")
+        return np.asarray(estimator.predict(X), dtype=np.float64).reshape(-1)
+
+
+def export(estimator, out: str, source_path: str | None = None) -> dict:
+    """Write ``estimator`` as a LinearScorer artifact; returns its manifest."""
+    import sklearn
+
+    coef, intercept = fold_estimator(estimator)
+    names = [str(n) for n in getattr(estimator, "feature_names_in_", [])]
+    probe_X = _probe_rows(coef.shape[0], estimator)
+    probe_y = _sklearn_predict(estimator, probe_X)
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "model_type": type(estimator).__name__,
+        "feature_names": names,
+        "feature_schema": FEATURE_SCHEMA_VERSION,
+        "sklearn_version": sklearn.__version__,
+        "source_sha256": _sha256(source_path) if source_path else None,
+    }
+    tmp = out + ".tmp.npz"
+    np.savez(tmp, manifest=json.dumps(manifest), coef=coef, intercept=np.float64(intercept),
+             probe_X=probe_X, probe_y=probe_y)
+    os.replace(tmp, out)
+
+    drift = float(np.max(np.abs(probe_X @ coef + intercept - probe_y)))
+    if drift > TOLERANCE:
+        raise ValueError(f"Exported scorer differs from sklearn by {drift:.3g}")
+    return manifest
+
+
+class LinearScorer:
+    """``predict(X) = X @ coef + intercept``; drop-in for the sklearn model."""
+
+    def __init__(self, path: str):
+        with np.load(path, allow_pickle=False) as data:
+            self.manifest = json.loads(str(data["manifest"]))
+            if self.manifest.get("format_version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported linear model format in {path}")
+            self.coef = np.ascontiguousarray(data["coef"], dtype=np.float64)
+            self.intercept = float(data["intercept"])
+            self._probe_X = data["probe_X"]
+            self._probe_y = data["probe_y"]
+        self.path = path
+        self.n_features_in_ = int(self.coef.shape[0])
+        self.feature_names = self.manifest.get("feature_names") or []
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(
+                f"X has {X.shape[-1]} features, but the risk model is expecting {self.n_features_in_} features as input."
+            )
+        return X @ self.coef + self.intercept
+
+    def verify(self, reference=None) -> float:
+        """Max absolute difference vs. export-time sklearn output (and ``reference``).
+
+        Raises ``ValueError`` beyond ``TOLERANCE``.
+        """
+        drift = float(np.max(np.abs(self.predict(self._probe_X) - self._probe_y)))
+        if reference is not None:
+            live = _sklearn_predict(reference, self._probe_X)
+            drift = max(drift, float(np.max(np.abs(self.predict(self._probe_X) - live))))
+        if drift > TOLERANCE:
+            raise ValueError(f"{self.path} disagrees with sklearn by {drift:.3g}; re-export it")
+        return drift
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Export a fitted linear sklearn model to a NumPy artifact.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="pickle -> .npz")
+    exp.add_argument("pickle")
+    exp.add_argument("--out", help="defaults to the pickle path with .npz")
+    check = sub.add_parser("verify", help="check an artifact against its probe rows (and the pickle if given)")
+    check.add_argument("artifact")
+    check.add_argument("--pickle")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        import joblib
+
+        out = args.out or os.path.splitext(args.pickle)[0] + ".npz"
+        manifest = export(joblib.load(args.pickle), out, source_path=args.pickle)
+        print(f"Wrote {out}: {manifest['model_type']} with {len(LinearScorer(out).coef)} features")
+    else:
+        reference = None
+        if args.pickle:
+            import joblib
+
+            reference = joblib.load(args.pickle)
+        drift = LinearScorer(args.artifact).verify(reference)
+        print(f"OK, max drift {drift:.3g}")
+
+
+if __name__ == "__main__":
+    main()
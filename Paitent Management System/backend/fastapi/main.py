@@ -1,51 +1,121 @@
+import time
+_IMPORT_STARTED = time.perf_counter()  # for the PROFILE_STARTUP report
 import os
-import mysql.connector
-from mysql.connector import Error
-
-# ---- MySQL connection helper ----
-def _get_mysql_conn():
-    """Connect to Laravel MySQL database"""
-    try:
-        conn = mysql.connector.connect(
-            host=os.getenv("DB_HOST", "localhost"),
-            port=int(os.getenv("DB_PORT", "3306")),
-            user=os.getenv("DB_USERNAME", "root"),
-            password=os.getenv("DB_PASSWORD", ""),
-            database=os.getenv("DB_DATABASE", "laravel")
-        )
-        return conn
-    except Error as e:
-        print(f"MySQL connection error: {e}")
-        return None
+import sys
+import asyncio
+import threading
+import hashlib
+import hmac
+import json
+from typing import NamedTuple
+
+import metrics
+from db_pool import MySQLPool
+from metrics import stage, timed
+from prediction_cache import PredictionCache
+from singleflight import SingleFlight, digest
+
+# ---- MySQL connection pool (see db_pool.py) ----
+_mysql_pool = None
+_mysql_pool_lock = threading.Lock()
+
+
+def get_mysql_pool() -> MySQLPool:
+    global _mysql_pool
+    if _mysql_pool is None:
+        with _mysql_pool_lock:
+            if _mysql_pool is None:
+                _mysql_pool = MySQLPool(
+                    size=int(os.getenv("DB_POOL_SIZE", "5")),
+                    timeout=float(os.getenv("DB_POOL_TIMEOUT", "5")),
+                    recycle=float(os.getenv("DB_POOL_RECYCLE", "1800")),
+                    ping_after=float(os.getenv("DB_POOL_PING_AFTER", "30")),
+                )
+    return _mysql_pool
 
 # ---- Read from Laravel patients table ----
-def latest_get(patient_id: int | None, model_version: str = "risk_v1") -> float | None:
-    """Get last_risk_score from patients table in Laravel database"""
-    if patient_id is None:
-        return None
+class StoredScore(NamedTuple):
+    """A patient's saved risk score plus what is needed to judge its freshness."""
+    score: float
+    age_seconds: float | None  # since last_predicted_at, measured by MySQL
+    feature_hash: str | None  # hash of the features it was computed from (None if unknown)
 
-    try:
-        conn = _get_mysql_conn()
-        if conn is None:
-            return None
 
+def feature_hash(features: list[float]) -> str:
+    payload = json.dumps([round(float(f), 6) for f in features], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Saved scores older than this (seconds; 0 = no limit) are served stale and recomputed
+RISK_SCORE_MAX_AGE = float(os.getenv("RISK_SCORE_MAX_AGE", "604800"))
+
+
+def is_stale(stored: StoredScore, features: list[float]) -> bool:
+    """True if ``stored`` was computed from other features or is older than RISK_SCORE_MAX_AGE."""
+    if _feature_hash_column is not False and stored.feature_hash != feature_hash(features):
+        return True
+    if RISK_SCORE_MAX_AGE > 0:
+        return stored.age_seconds is None or stored.age_seconds > RISK_SCORE_MAX_AGE
+    return False
+
+
+# patients.risk_feature_hash is added by migration 2026_10_18_000001. Until it has run,
+# scores are read and written without it and judged stale by age only.
+_feature_hash_column: bool | None = None  # None until checked
+
+
+def has_feature_hash_column(conn) -> bool:
+    """Whether ``patients.risk_feature_hash`` exists; checked once per process, loudly if missing."""
+    global _feature_hash_column
+    if _feature_hash_column is None:
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT last_risk_score, risk_model_version FROM patients WHERE id = %s",
-            (patient_id,)
-        )
-        row = cursor.fetchone()
+        try:
+            cursor.execute("SHOW COLUMNS FROM patients LIKE 'risk_feature_hash'")
+            found = cursor.fetchone() is not None
+        finally:
+            cursor.close()
+        if not found:
+            print("⚠️ [MYSQL] patients.risk_feature_hash is missing: run the 2026_10_18_000001 migration "
+                  "(php artisan migrate). Until then risk scores are saved without it and judged stale by age only.")
+        _feature_hash_column = found
+    return _feature_hash_column
 
-        if row:
-            score, db_model_version = row
-            if score is not None and (db_model_version == model_version or db_model_version is None):
-                cursor.close()
-                conn.close()
-                return float(score)
 
-        cursor.close()
-        conn.close()
+def _stored_score_columns(conn) -> str:
+    fhash = "risk_feature_hash" if has_feature_hash_column(conn) else "NULL"
+    return f"last_risk_score, risk_model_version, TIMESTAMPDIFF(SECOND, last_predicted_at, NOW()), {fhash}"
+
+
+def _stored_score(row, model_version: str) -> StoredScore | None:
+    score, db_model_version, age, fhash = row
+    if score is not None and (db_model_version == model_version or db_model_version is None):
+        return StoredScore(float(score), float(age) if age is not None else None, fhash)
+    return None
+
+
+@timed("mysql_lookup")
+def latest_get(patient_id: int | None, model_version: str = "risk_v1") -> StoredScore | None:
+    """Get last_risk_score (and its age and feature hash) from the Laravel patients table"""
+    if patient_id is None:
         return None
+
+    try:
+        with get_mysql_pool().connection() as conn:
+            if conn is None:
+                return None
+
+            columns = _stored_score_columns(conn)
+            cursor = conn.cursor()
+            try:
+                cursor.execute(
+                    f"SELECT {columns} FROM patients WHERE id = %s",
+                    (patient_id,)
+                )
+                row = cursor.fetchone()
+            finally:
+                cursor.close()
+
+        return _stored_score(row, model_version) if row else None
     except Exception:
         return None
 
@@ -54,50 +124,215 @@ def latest_set(patient_id: int | None, value: float, model_version: str = "risk_
     # No-op: Laravel handles the database write
     pass
 
-# ---- Write to Laravel patients table ----
-def save_latest_to_mysql(patient_id: int, value: float, label: str, model_version: str = "risk_v1") -> None:
+# ---- Batched reads and writes (every score write goes through write_latest_many_to_mysql) ----
+_MYSQL_BATCH = 500  # keep IN (...) / CASE lists well under max_allowed_packet
+
+
+@timed("mysql_lookup_many")
+def latest_get_many(patient_ids: list[int], model_version: str = "risk_v1") -> dict[int, StoredScore]:
+    """Fetch cached last_risk_score for many patients with one SELECT per chunk.
+
+    Returns only the ids whose cached score matches ``model_version`` (or has no
+    version recorded), mirroring :func:`latest_get`.
+    """
+    ids = sorted({int(pid) for pid in patient_ids if pid is not None})
+    if not ids:
+        return {}
+
+    found: dict[int, StoredScore] = {}
     try:
-        conn = _get_mysql_conn()
+        with get_mysql_pool().connection() as conn:
+            if conn is None:
+                return {}
+            columns = _stored_score_columns(conn)
+            cursor = conn.cursor()
+            try:
+                for start in range(0, len(ids), _MYSQL_BATCH):
+                    chunk = ids[start:start + _MYSQL_BATCH]
+                    placeholders = ", ".join(["%s"] * len(chunk))
+                    cursor.execute(
+                        f"SELECT id, {columns} FROM patients WHERE id IN ({placeholders})",
+                        tuple(chunk),
+                    )
+                    for pid, *row in cursor.fetchall():
+                        stored = _stored_score(row, model_version)
+                        if stored is not None:
+                            found[int(pid)] = stored
+            finally:
+                cursor.close()
+    except Exception:
+        return found
+    return found
+
+
+@timed("mysql_write_many")
+def write_latest_many_to_mysql(rows: list[tuple[int, float, str, str, str | None]]) -> None:
+    """Persist many ``(patient_id, score, label, model_version, feature_hash)`` rows.
+
+    Each chunk is written as a single multi-row ``UPDATE ... CASE`` statement and
+    committed once, instead of one UPDATE + commit per patient. Raises on
+    failure; see :func:`save_latest_many_to_mysql` for the best-effort variant.
+    """
+    if not rows:
+        return
+    with get_mysql_pool().connection() as conn:
         if conn is None:
-            return
+            raise RuntimeError("MySQL unavailable")
+        with_hash = has_feature_hash_column(conn)
         cursor = conn.cursor()
-        cursor.execute(
-            """
-            UPDATE patients
-            SET last_risk_score = %s,
-                last_risk_label = %s,
-                risk_model_version = %s,
-                last_predicted_at = NOW()
-            WHERE id = %s
-            """,
-            (float(value), str(label), str(model_version), int(patient_id))
-        )
-        conn.commit()
-        cursor.close()
-        conn.close()
+        try:
+            for start in range(0, len(rows), _MYSQL_BATCH):
+                chunk = rows[start:start + _MYSQL_BATCH]
+                cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+                placeholders = ", ".join(["%s"] * len(chunk))
+                params: list = []
+                params += [v for pid, score, *_ in chunk for v in (int(pid), float(score))]
+                params += [v for pid, _, label, *_ in chunk for v in (int(pid), str(label))]
+                params += [v for pid, _, _, version, _ in chunk for v in (int(pid), str(version))]
+                if with_hash:
+                    params += [v for pid, *_, fhash in chunk for v in (int(pid), fhash)]
+                params += [int(pid) for pid, *_ in chunk]
+                hash_case = f"risk_feature_hash = CASE id {cases} END," if with_hash else ""
+                cursor.execute(
+                    f"""
+                    UPDATE patients
+                    SET last_risk_score = CASE id {cases} END,
+                        last_risk_label = CASE id {cases} END,
+                        risk_model_version = CASE id {cases} END,
+                        {hash_case}
+                        last_predicted_at = NOW()
+                    WHERE id IN ({placeholders})
+                    """,
+                    tuple(params),
+                )
+            conn.commit()
+        finally:
+            cursor.close()
+
+
+def save_latest_many_to_mysql(rows: list[tuple[int, float, str, str, str | None]]) -> None:
+    try:
+        write_latest_many_to_mysql(rows)
     except Exception:
-        # silent fail; caller will still return the computed value
+        # silent fail; callers still return the computed values
         pass
 
-# Deprecated cache functions (no longer used)
+
+# ---- Write-behind persistence of fresh scores (see write_behind.py) ----
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() in ("1", "true", "yes")
+_score_writer = None
+_score_writer_lock = threading.Lock()
+
+
+def get_score_writer():
+    global _score_writer
+    if _score_writer is None:
+        with _score_writer_lock:
+            if _score_writer is None:
+                from write_behind import WriteBehindQueue
+                _score_writer = WriteBehindQueue(
+                    write_latest_many_to_mysql,
+                    max_size=int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000")),
+                    batch_size=int(os.getenv("WRITE_BEHIND_BATCH", str(_MYSQL_BATCH))),
+                    flush_interval=float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5")),
+                    max_retries=int(os.getenv("WRITE_BEHIND_RETRIES", "5")),
+                )
+    return _score_writer
+
+
+def persist_risk_scores(rows: list[tuple[int, float, str, str, str | None]]) -> None:
+    """Queue ``(patient_id, score, label, model_version, feature_hash)`` rows for MySQL, or write them now if disabled."""
+    note_risk_scores(rows)
+    if not WRITE_BEHIND_ENABLED:
+        save_latest_many_to_mysql(rows)
+        return
+    writer = get_score_writer()
+    for row in rows:
+        writer.put(row)
+
+# ---- In-process prediction cache (in front of latest_get) ----
+_prediction_cache = None
+_prediction_cache_lock = threading.Lock()
+
+
+def get_prediction_cache() -> PredictionCache:
+    global _prediction_cache
+    if _prediction_cache is None:
+        with _prediction_cache_lock:
+            if _prediction_cache is None:
+                _prediction_cache = PredictionCache(
+                    max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "4096")),
+                    ttl=float(os.getenv("PREDICTION_CACHE_TTL", "3600")),
+                    sqlite_path=os.getenv("PREDICTION_CACHE_SQLITE") or None,
+                )
+    return _prediction_cache
+
+
+def cache_lookup(features: list[float], patient_id: int | None = None,
+                 model_version: str = "risk_v1") -> tuple[float | None, bool]:
+    """Look up a risk score: in-memory/sqlite cache first, then MySQL via latest_get.
+
+    Returns ``(score, stale)``. A MySQL score is stale when it was computed
+    from different features or is older than RISK_SCORE_MAX_AGE (see
+    :func:`is_stale`); fresh ones are copied into the in-process cache so the
+    next identical request does not touch the database. Cache entries are
+    scoped to ``patient_id``, so a hit is always this patient's own saved (or
+    just computed and persisted) score.
+    """
+    cache = get_prediction_cache()
+    key = PredictionCache.make_key(features, model_version, patient_id)
+    value = cache.get(key)
+    if value is not None:
+        return value, False
+    stored = latest_get(patient_id, model_version)
+    if stored is None:
+        return None, False
+    if is_stale(stored, features):
+        return stored.score, True
+    cache.set(key, stored.score, patient_id=patient_id)
+    return stored.score, False
+
 def cache_get(features: list[float], patient_id: int | None = None, model_version: str = "risk_v1"):
-    """Deprecated: Now reads from MySQL via latest_get"""
-    return latest_get(patient_id, model_version)
+    """Fresh cached score or None (stale MySQL scores count as a miss)."""
+    value, stale = cache_lookup(features, patient_id, model_version)
+    return None if stale else value
 
 def cache_set(features: list[float], value: float, patient_id: int | None = None, model_version: str = "risk_v1"):
-    """Deprecated: Laravel handles writes"""
-    pass
-
-from fastapi import FastAPI, HTTPException, Request
+    """Record a freshly computed score, replacing anything cached for the patient."""
+    cache = get_prediction_cache()
+    if patient_id is not None:
+        cache.invalidate(patient_id=patient_id)
+    cache.set(PredictionCache.make_key(features, model_version, patient_id), value, patient_id=patient_id)
+
+def cache_invalidate(features: list[float] | None = None, patient_id: int | None = None, model_version: str = "risk_v1"):
+    """Explicitly drop cached scores, e.g. for ``force=true`` recomputes."""
+    key = PredictionCache.make_key(features, model_version, patient_id) if features is not None else None
+    get_prediction_cache().invalidate(key=key, patient_id=patient_id)
+
+from fastapi import FastAPI, Header, HTTPException, Request
 from pydantic import BaseModel
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 import warnings
 import numpy as np
-import pandas as pd
+
+import patient_features
+from answer_cache import SemanticAnswerCache
+from embedding_cache import EmbeddingCache
+from therapy_model import THERAPY_INPUT_FIELDS, THERAPY_VISITS, TherapyModel, patient_inputs
 
 load_dotenv()
 
+# Optional feature groups served by this instance (FEATURES=risk,therapy,rag).
+# Routes of disabled groups are not registered, and their heavy dependencies
+# (e.g. the RAG clients) are never imported, so a risk-only image can be
+# built from requirements-risk.txt alone.
+ALL_FEATURES = ("risk", "therapy", "rag")
+ENABLED_FEATURES = {
+    f.strip() for f in os.getenv("FEATURES", ",".join(ALL_FEATURES)).lower().split(",") if f.strip()
+} & set(ALL_FEATURES)
+
 # Initialize FastAPI
 app = FastAPI()
 
@@ -113,6 +348,24 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def _record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.inc()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_IN_FLIGHT.dec()
+        # Label by route template (/predict), not raw path, to keep cardinality bounded
+        route = getattr(request.scope.get("route"), "path", None) or "unmatched"
+        metrics.HTTP_REQUESTS.inc(route=route, method=request.method, status=str(status))
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=route, method=request.method)
+
+
 # Suppress noisy sklearn warning about feature names mismatch
 warnings.filterwarnings(
     "ignore",
@@ -120,28 +373,208 @@ warnings.filterwarnings(
 )
 
 # --- Lazy-loaded resources ---
-_ridge_model = None
-_therapy_pathline_model = None
+_model_registry = None
+_model_registry_lock = threading.Lock()
 _pinecone_client = None
 _pinecone_index = None
 _groq_client = None
 _embedder = None
+_async_groq_client = None
+_async_openai_client = None
+_retriever = None
+_rag_semaphore = None
+
+# RAG pipeline limits (seconds / concurrent requests)
+RAG_EMBED_TIMEOUT = float(os.getenv("RAG_EMBED_TIMEOUT", "10"))
+RAG_QUERY_TIMEOUT = float(os.getenv("RAG_QUERY_TIMEOUT", "10"))
+RAG_LLM_TIMEOUT = float(os.getenv("RAG_LLM_TIMEOUT", "60"))
+RAG_MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))
+
+
+RIDGE_PICKLE = os.getenv("RIDGE_MODEL_PATH", "ridge_best_model_1.pkl")
+RIDGE_ARTIFACT = os.getenv("RIDGE_ARTIFACT_PATH", "ridge_best_model_1.npz")
+
+
+def _load_ridge_model(artifact: str = RIDGE_ARTIFACT, pickle_path: str = RIDGE_PICKLE):
+    """NumPy scorer from ``artifact`` if exported, else the sklearn pickle.
+
+    The artifact is checked against the sklearn predictions recorded at export
+    time, and against the live pickle too when it and scikit-learn are present.
+    """
+    if os.path.exists(artifact):
+        from linear_model import LinearScorer
+        scorer = LinearScorer(artifact)
+        reference = None
+        if os.path.exists(pickle_path) and os.getenv("RIDGE_VERIFY_SKLEARN", "true").lower() in ("1", "true", "yes"):
+            try:
+                import joblib
+                reference = joblib.load(pickle_path)
+            except ImportError:
+                pass
+        drift = scorer.verify(reference)
+        print(f"[MODEL] ridge: NumPy scorer {artifact} (max drift {drift:.2g}"
+              f"{', checked against sklearn' if reference is not None else ''})")
+        return scorer
+    import joblib
+    return joblib.load(pickle_path)
+
+
+THERAPY_PICKLE = os.getenv("THERAPY_MODEL_PATH", "therapy_effectiveness_model.pkl")
+THERAPY_FOREST = os.getenv("THERAPY_FOREST_PATH", "therapy_forest")
+
+
+def _load_therapy_model(forest_path: str = THERAPY_FOREST, pickle_path: str = THERAPY_PICKLE) -> "TherapyModel":
+    """Compiled forest from ``forest_path`` if present (pickle kept for SHAP), else the pickle."""
+    pipeline = None
+    if os.path.exists(pickle_path) and (
+        not os.path.isdir(forest_path) or os.getenv("THERAPY_LOAD_PICKLE", "true").lower() in ("1", "true", "yes")
+    ):
+        try:
+            import joblib
+            pipeline = joblib.load(pickle_path)
+        except ImportError:
+            pass
+    if os.path.isdir(forest_path):
+        from forest_model import CompiledForest
+        forest = CompiledForest(forest_path)
+        drift = forest.verify(pipeline.named_steps['classifier'] if pipeline is not None else None)
+        print(f"[MODEL] therapy: compiled forest {forest_path} (max drift {drift:.2g}"
+              f"{', checked against sklearn' if pipeline is not None else ''})")
+        return TherapyModel(pipeline, forest=forest)
+    if pipeline is None:
+        raise RuntimeError(f"Neither {forest_path}/ nor {pickle_path} could be loaded")
+    return TherapyModel(pipeline)
+
+
+# ---- Versioned models (see model_registry.py) ----
+DEFAULT_MODEL_VERSIONS = {"risk": "risk_v1", "therapy": "therapy_v1"}
+
+
+def _load_risk_version(version: str, path: str | None):
+    # path is None for the legacy top-level files (no registry directory yet)
+    with metrics.MODEL_LOAD_SECONDS.time(resource=version):
+        if path is None:
+            model = _load_ridge_model()
+        else:
+            model = _load_ridge_model(os.path.join(path, "model.npz"), os.path.join(path, "model.pkl"))
+    patient_features.check_model("risk", model, getattr(model, "manifest", None))
+    return model
+
+
+def _load_therapy_version(version: str, path: str | None) -> "TherapyModel":
+    with metrics.MODEL_LOAD_SECONDS.time(resource=version):
+        if path is None:
+            model = _load_therapy_model()
+        else:
+            model = _load_therapy_model(os.path.join(path, "forest"), os.path.join(path, "model.pkl"))
+    patient_features.check_model("therapy", model, model.forest.manifest if model.forest is not None else None)
+    return model
+
+
+def get_model_registry():
+    global _model_registry
+    if _model_registry is None:
+        with _model_registry_lock:
+            if _model_registry is None:
+                from model_registry import ModelRegistry
+                _model_registry = ModelRegistry(
+                    os.getenv("MODEL_REGISTRY_DIR", "model_registry"),
+                    loaders={"risk": _load_risk_version, "therapy": _load_therapy_version},
+                    memory_budget_bytes=int(float(os.getenv("MODEL_MEMORY_BUDGET_MB", "1024")) * 1024 * 1024),
+                    poll_seconds=float(os.getenv("MODEL_REGISTRY_POLL_SECONDS", "5")),
+                    fallback=DEFAULT_MODEL_VERSIONS,
+                )
+    return _model_registry
+
+
+_unknown_versions_seen: set[tuple[str, str]] = set()
+
+
+def resolve_model_version(kind: str, requested: str | None = None, routing_key=None) -> str:
+    """Registry version for a request.
+
+    ``model_version`` used to be a free-form label, so a version the registry
+    does not know is served by the routed version (with a warning) instead of
+    being rejected.
+    """
+    from model_registry import UnknownModelVersion
+    registry = get_model_registry()
+    try:
+        version = registry.resolve(kind, requested, routing_key)
+    except UnknownModelVersion as e:
+        version = registry.resolve(kind, None, routing_key)
+        if (kind, requested) not in _unknown_versions_seen and len(_unknown_versions_seen) < 1000:
+            _unknown_versions_seen.add((kind, requested))
+            print(f"⚠️ [REGISTRY] {e}; serving {version} instead")
+    metrics.MODEL_REQUESTS.inc(kind=kind, version=version)
+    return version
+
+
+def get_ridge_model(version: str | None = None):
+    registry = get_model_registry()
+    return registry.get_model(version or registry.default_version("risk"))
+
+
+def get_therapy_model(version: str | None = None) -> "TherapyModel":
+    registry = get_model_registry()
+    return registry.get_model(version or registry.default_version("therapy"))
+
+
+# ---- Micro-batching of single-row risk predictions (see microbatch.py) ----
+MICROBATCH_ENABLED = os.getenv("MICROBATCH_ENABLED", "false").lower() in ("1", "true", "yes")
+_risk_batcher = None
+_risk_batcher_lock = threading.Lock()
+
+
+def _predict_risk_rows(version: str, X: np.ndarray) -> np.ndarray:
+    m = get_ridge_model(version)
+    with stage("model_predict"):
+        return m.predict(X)
+
+
+def get_risk_batcher():
+    global _risk_batcher
+    if _risk_batcher is None:
+        with _risk_batcher_lock:
+            if _risk_batcher is None:
+                from microbatch import MicroBatcher
+                _risk_batcher = MicroBatcher(
+                    _predict_risk_rows,
+                    window_ms=float(os.getenv("MICROBATCH_WINDOW_MS", "3")),
+                    max_rows=int(os.getenv("MICROBATCH_MAX_ROWS", "64")),
+                    idle_ms=float(os.getenv("MICROBATCH_IDLE_MS", "0.5")),
+                )
+    return _risk_batcher
 
 
-def get_ridge_model():
-    global _ridge_model
-    if _ridge_model is None:
-        import joblib
-        _ridge_model = joblib.load("ridge_best_model_1.pkl")
-    return _ridge_model
+def predict_risk_row(features: list[float], model_version: str) -> float:
+    """Risk score for one feature row, micro-batched with concurrent callers when enabled."""
+    if MICROBATCH_ENABLED:
+        return get_risk_batcher().submit(model_version, features)
+    row = np.array(features, dtype=float).reshape(1, -1)
+    return float(_predict_risk_rows(model_version, row)[0])
 
 
-def get_therapy_model():
-    global _therapy_pathline_model
-    if _therapy_pathline_model is None:
-        import joblib
-        _therapy_pathline_model = joblib.load("therapy_effectiveness_model.pkl")
-    return _therapy_pathline_model
+# ---- Request coalescing of identical in-flight work (see singleflight.py) ----
+SINGLEFLIGHT_ENABLED = os.getenv("SINGLEFLIGHT_ENABLED", "true").lower() in ("1", "true", "yes")
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight()
+    return _single_flight
+
+
+def coalesce(key: tuple, fn):
+    """Run ``fn()`` once for all concurrent callers with the same ``key``."""
+    if not SINGLEFLIGHT_ENABLED:
+        return fn()
+    return get_single_flight().do(key, fn)
 
 
 def get_pinecone_client():
@@ -163,6 +596,27 @@ def get_pinecone_index():
     return _pinecone_index
 
 
+def get_retriever():
+    """Vector search backend for retrieve_context.
+
+    ``RETRIEVER_BACKEND=local`` serves queries from the memory-mapped index in
+    ``LOCAL_INDEX_DIR`` (see vector_store.py); anything else uses Pinecone.
+    """
+    global _retriever
+    if _retriever is None:
+        from vector_store import LocalVectorIndex, PineconeRetriever
+        with metrics.MODEL_LOAD_SECONDS.time(resource="retriever"):
+            if os.getenv("RETRIEVER_BACKEND", "pinecone").lower() == "local":
+                _retriever = LocalVectorIndex(
+                    os.getenv("LOCAL_INDEX_DIR", "vector_index"),
+                    nprobe=int(os.getenv("LOCAL_INDEX_NPROBE", "8")),
+                    model=EMBEDDING_MODEL,
+                )
+            else:
+                _retriever = PineconeRetriever(get_pinecone_index(), namespace=os.getenv("PINECONE_NAMESPACE", ""))
+    return _retriever
+
+
 def get_groq_client():
     global _groq_client
     if _groq_client is None:
@@ -183,53 +637,428 @@ def get_openai_client():
     return openai
 
 
+def get_async_groq_client():
+    global _async_groq_client
+    if _async_groq_client is None:
+        from groq import AsyncGroq
+        api_key = os.getenv("GROQ_API_KEY")
+        if not api_key:
+            raise RuntimeError("GROQ_API_KEY not set")
+        _async_groq_client = AsyncGroq(api_key=api_key, timeout=RAG_LLM_TIMEOUT)
+    return _async_groq_client
+
+
+def get_async_openai_client():
+    global _async_openai_client
+    if _async_openai_client is None:
+        from openai import AsyncOpenAI
+        _async_openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=RAG_EMBED_TIMEOUT)
+    return _async_openai_client
+
+
+def get_rag_semaphore() -> asyncio.Semaphore:
+    # Created lazily so it binds to the running event loop
+    global _rag_semaphore
+    if _rag_semaphore is None:
+        _rag_semaphore = asyncio.Semaphore(RAG_MAX_CONCURRENCY)
+    return _rag_semaphore
+
+
 def get_embedder():
     global _embedder
     if _embedder is None:
         # Lazy import to avoid pulling torch/transformers at startup
         from sentence_transformers import SentenceTransformer
-        _embedder = SentenceTransformer("all-MiniLM-L6-v2")
+        with metrics.MODEL_LOAD_SECONDS.time(resource="embedder"):
+            _embedder = SentenceTransformer("all-MiniLM-L6-v2")
     return _embedder
 
 
+def _warm_mysql():
+    with get_mysql_pool().connection() as conn:
+        if conn is None:
+            raise RuntimeError("MySQL unavailable")
+        has_feature_hash_column(conn)  # report a missing migration at startup
+
+
+def _warm_groq():
+    get_groq_client()
+    get_async_groq_client()
+
+
+# Resources that can be preloaded at startup (WARMUP_RESOURCES, comma-separated)
+WARMUP_LOADERS = {
+    "ridge": get_ridge_model,
+    "therapy": get_therapy_model,
+    "embedder": get_embedder,
+    "retriever": get_retriever,
+    "pinecone": get_pinecone_index,
+    "groq": _warm_groq,
+    "openai": get_async_openai_client,
+    "mysql": _warm_mysql,
+}
+
+# Preloaded by default when their feature group is enabled
+WARMUP_DEFAULTS = {"ridge": "risk", "therapy": "therapy"}
+
+_warmup = {"started": False, "done": False, "resources": {}}
+_warmup_lock = threading.Lock()
+
+
+def _warm_one(name: str) -> None:
+    entry = _warmup["resources"][name]
+    start = time.perf_counter()
+    entry["status"] = "loading"
+    try:
+        WARMUP_LOADERS[name]()
+        entry["status"] = "ready"
+    except Exception as e:
+        entry["status"] = "failed"
+        entry["error"] = str(e)
+        print(f"[WARMUP] {name} failed: {e}")
+    entry["seconds"] = round(time.perf_counter() - start, 3)
+    print(f"[WARMUP] {name}: {entry['status']} in {entry['seconds']}s")
+
+
+def run_warmup(names: list[str], parallel: bool = True) -> None:
+    """Load the selected lazy resources now instead of on the first request."""
+    with _warmup_lock:
+        _warmup["resources"] = {n: {"status": "pending"} for n in names}
+        _warmup["started"] = True
+        _warmup["done"] = False
+    start = time.perf_counter()
+    if parallel and len(names) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="warmup") as pool:
+            list(pool.map(_warm_one, names))
+    else:
+        for name in names:
+            _warm_one(name)
+    _warmup["seconds"] = round(time.perf_counter() - start, 3)
+    _warmup["done"] = True
+    if os.getenv("PROFILE_STARTUP", "").lower() in ("1", "true", "yes"):
+        print_startup_report()
+
+
+HEAVY_MODULES = ("pandas", "sklearn", "scipy", "torch", "transformers", "sentence_transformers",
+                 "groq", "openai", "pinecone", "shap", "mysql.connector")
+
+
+def print_startup_report() -> None:
+    """Boot-time summary: main.py import cost, warm-up load times, heavy modules loaded."""
+    print("[STARTUP] features:", ",".join(sorted(ENABLED_FEATURES)))
+    print(f"[STARTUP] main.py import: {_MAIN_IMPORT_SECONDS:.3f}s")
+    for name, r in _warmup["resources"].items():
+        print(f"[STARTUP] load {name:<10} {r.get('seconds', 0):>7.3f}s  {r['status']}")
+    loaded = [m for m in HEAVY_MODULES if m in sys.modules]
+    print("[STARTUP] heavy modules imported:", ", ".join(loaded) or "none")
+    print("[STARTUP] for per-module import cost run: python main.py --profile-startup")
+
+
+def _warmup_names() -> list[str]:
+    default = ",".join(n for n, group in WARMUP_DEFAULTS.items() if group in ENABLED_FEATURES)
+    names = [n.strip() for n in (os.getenv("WARMUP_RESOURCES") or default).split(",") if n.strip()]
+    unknown = [n for n in names if n not in WARMUP_LOADERS]
+    if unknown:
+        print(f"[WARMUP] Ignoring unknown resources: {', '.join(unknown)}")
+    return [n for n in names if n in WARMUP_LOADERS]
+
+
+# Resources that hold no sockets, threads or event-loop state and can therefore
+# be loaded in the gunicorn master and inherited by forked workers.
+FORK_SAFE_RESOURCES = ("ridge", "therapy", "embedder")
+
+
+def preload_for_fork() -> list[str]:
+    """Load fork-safe models in the master process before workers are forked.
+
+    Called from gunicorn.conf.py (``preload_app``). Workers inherit the loaded
+    models copy-on-write; the compiled forest / local vector index are
+    memory-mapped files, so their pages are shared through the page cache
+    whatever the process model. ``gc.freeze()`` then keeps the collector from
+    touching (and so un-sharing) the inherited objects. MySQL, Groq and
+    OpenAI clients are left for each worker to create after the fork.
+    """
+    import gc
+
+    fork_safe = set(FORK_SAFE_RESOURCES)
+    if os.getenv("RETRIEVER_BACKEND", "pinecone").lower() == "local":
+        fork_safe.add("retriever")
+    names = [n for n in _warmup_names() if n in fork_safe]
+    run_warmup(names, parallel=False)
+    gc.collect()
+    gc.freeze()
+    return names
+
+
+@app.on_event("startup")
+def _start_warmup():
+    names = _warmup_names()
+    parallel = os.getenv("WARMUP_PARALLEL", "true").lower() in ("1", "true", "yes")
+    # Run in the background so /health answers immediately; /ready reports progress
+    threading.Thread(target=run_warmup, args=(names, parallel), name="warmup", daemon=True).start()
+
+
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 only once every warm-up resource has loaded.
+
+    Resources listed in WARMUP_OPTIONAL may fail without blocking readiness.
+    """
+    optional = {n.strip() for n in os.getenv("WARMUP_OPTIONAL", "").split(",") if n.strip()}
+    resources = _warmup["resources"]
+    failed = [n for n, r in resources.items() if r["status"] == "failed" and n not in optional]
+    is_ready = _warmup["done"] and not failed
+    body = {
+        "status": "ready" if is_ready else ("failed" if failed else "warming"),
+        "resources": resources,
+        "seconds": _warmup.get("seconds"),
+    }
+    if not is_ready:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+
+@app.get("/health/db-pool")
+def db_pool_stats():
+    return get_mysql_pool().stats()
+
+
+@app.get("/health/prediction-cache", tags=["risk"])
+def prediction_cache_stats():
+    return get_prediction_cache().stats()
+
+
+@app.get("/health/microbatch", tags=["risk"])
+def microbatch_stats():
+    if not MICROBATCH_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_risk_batcher().stats()}
+
+
+@app.get("/health/singleflight")
+def singleflight_stats():
+    return {"enabled": SINGLEFLIGHT_ENABLED, **get_single_flight().stats()}
+
+
+@app.get("/health/write-behind", tags=["risk"])
+def write_behind_stats():
+    if not WRITE_BEHIND_ENABLED:
+        return {"enabled": False}
+    return {"enabled": True, **get_score_writer().stats()}
+
+
+@app.get("/health/risk-refresh", tags=["risk"])
+def risk_refresh_stats():
+    """Stale-while-revalidate counters next to the write-behind drops that can keep scores stale."""
+    with _risk_refresh_lock:
+        stats = {**_risk_refresh_stats, "in_flight": len(_risk_refreshing)}
+    stats["cooldown_seconds"] = RISK_REFRESH_COOLDOWN
+    stats["write_behind_dropped"] = _score_writer.stats()["dropped"] if _score_writer is not None else 0
+    return {"enabled": RISK_SWR_ENABLED, **stats}
+
+
+@app.get("/health/embedding-cache", tags=["rag"])
+def embedding_cache_stats():
+    return get_embedding_cache().stats()
+
+
+@app.get("/health/answer-cache", tags=["rag"])
+def answer_cache_stats():
+    return get_answer_cache().stats()
+
+
+class RoutingUpdate(BaseModel):
+    default: str
+    canary: str | None = None
+    canary_percent: float = 0.0
+
+
+def _check_admin_token(token: str | None) -> None:
+    # Fail closed: without a configured token the admin routes are disabled, not open
+    expected = os.getenv("MODEL_ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=503, detail="Model admin API is disabled (MODEL_ADMIN_TOKEN is not set)")
+    if not token or not hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+@app.get("/models")
+def model_registry_stats():
+    return get_model_registry().stats()
+
+
+@app.post("/models/reload")
+def reload_model_registry(x_admin_token: str | None = Header(default=None)):
+    """Re-read registry.json now instead of waiting for the next poll."""
+    _check_admin_token(x_admin_token)
+    return {"routing": get_model_registry().reload()}
+
+
+@app.put("/models/{kind}/routing")
+def update_model_routing(kind: str, update: RoutingUpdate, x_admin_token: str | None = Header(default=None)):
+    """Swap the default and/or canary version of ``kind`` (``risk`` or ``therapy``)."""
+    _check_admin_token(x_admin_token)
+    from model_registry import ModelLoadError, UnknownModelVersion
+    try:
+        entry = get_model_registry().set_routing(kind, update.default, update.canary, update.canary_percent)
+    except (ValueError, UnknownModelVersion, ModelLoadError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"kind": kind, **entry}
+
+
+def _collect_cache_metrics() -> None:
+    # Only report caches that exist; scraping should not instantiate them
+    caches = {
+        "prediction": (_prediction_cache, ("hits", "l2_hits", "misses")),
+        "embedding": (_embedding_cache, ("hits", "disk_hits", "misses")),
+        "answer": (_answer_cache, ("hits", "misses")),
+    }
+    for name, (cache, results) in caches.items():
+        if cache is None:
+            continue
+        s = cache.stats()
+        metrics.CACHE_HIT_RATIO.set(s["hit_ratio"], cache=name)
+        metrics.CACHE_ENTRIES.set(s["size"], cache=name)
+        for result in results:
+            metrics.CACHE_LOOKUPS.set(s[result], cache=name, result=result)
+
+
+def _collect_pool_metrics() -> None:
+    if _mysql_pool is None:
+        return
+    s = _mysql_pool.stats()
+    for state in ("size", "open", "in_use", "idle"):
+        metrics.DB_POOL_CONNECTIONS.set(s[state], state=state)
+
+
+metrics.add_collector(_collect_cache_metrics)
+metrics.add_collector(_collect_pool_metrics)
+
+
+@app.on_event("startup")
+def _start_metrics_sync():
+    # Multi-worker gunicorn: share this worker's metrics through METRICS_MULTIPROC_DIR
+    metrics.start_multiprocess_sync()
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.on_event("shutdown")
+def _close_mysql_pool():
+    # Queued risk scores go out before the connections are closed
+    if _score_writer is not None:
+        _score_writer.close()
+    if _mysql_pool is not None:
+        _mysql_pool.close_all()
+    if metrics.multiprocess_dir():
+        metrics.write_snapshot()  # final values; gunicorn's child_exit then drops the gauges
+
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+
+# ---- RAG caches (see embedding_cache.py, answer_cache.py) ----
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache(
+                    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "2048")),
+                    sqlite_path=os.getenv("EMBEDDING_CACHE_SQLITE") or None,
+                )
+    return _embedding_cache
+
+
+_answer_cache = None
+_answer_cache_lock = threading.Lock()
+
+# Bump when the corresponding prompt text changes so stale answers are not reused
+RAG_LLM_MODEL = "llama-3.3-70b-versatile"
+RAG_PROMPT_VERSION = "rag-v1"
+CHATBOT_PROMPT_VERSION = "chatbot-v1"
+
+
+def get_answer_cache() -> SemanticAnswerCache:
+    global _answer_cache
+    if _answer_cache is None:
+        with _answer_cache_lock:
+            if _answer_cache is None:
+                _answer_cache = SemanticAnswerCache(
+                    max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "1024")),
+                    ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "86400")),
+                    threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+                )
+    return _answer_cache
+
+
+def answer_cache_scope(endpoint: str, text: str, template: str, patient: dict | None = None,
+                       enabled: bool = True) -> dict | None:
+    """Describe how a RAG call may use the semantic answer cache.
+
+    ``text`` is what gets embedded for the similarity match (the user's
+    question, not the full templated prompt). Returns None when caching is
+    off for this request or for the endpoint (``SEMANTIC_CACHE_DISABLED``,
+    comma-separated endpoint names, or ``SEMANTIC_CACHE_DISABLED=all``).
+    """
+    disabled = {e.strip() for e in os.getenv("SEMANTIC_CACHE_DISABLED", "").split(",") if e.strip()}
+    if not enabled or endpoint in disabled or "all" in disabled:
+        return None
+    return {"text": text, "namespace": SemanticAnswerCache.namespace(endpoint, template, RAG_LLM_MODEL, patient)}
+
+
 def get_openai_embedding(text: str) -> list:
+    cache = get_embedding_cache()
+    key = EmbeddingCache.make_key(text, EMBEDDING_MODEL)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
     try:
         openai = get_openai_client()
-        response = openai.embeddings.create(
-            model="text-embedding-3-small",
-            input=[text]
-        )
-        return response.data[0].embedding
+        with stage("embedding"):
+            response = openai.embeddings.create(
+                model=EMBEDDING_MODEL,
+                input=[text]
+            )
+        embedding = response.data[0].embedding
+        cache.set(key, embedding, EMBEDDING_MODEL)
+        return embedding
     except Exception as e:
         print("❌ OpenAI Embedding Error:", e)
         raise
 
-def retrieve_context(query, top_k=3):
-    query_vec = get_openai_embedding(query)
-    index = get_pinecone_index()
-    results = index.query(vector=query_vec, top_k=top_k, include_metadata=True)
-
+def _context_chunks(results) -> list[str]:
     context_chunks = []
     for match in results.get("matches", []):
         metadata = match.get("metadata", {})
         if "text" in metadata:
             context_chunks.append(metadata["text"])
-    
     return context_chunks
 
-def generate_rag_response(user_query, patient_context=""):
-    try:
-        context_chunks = retrieve_context(user_query)
-        print("[RAG] Retrieved context:", context_chunks)
+@timed("retrieve_context")
+def retrieve_context(query, top_k=3):
+    query_vec = get_openai_embedding(query)
+    retriever = get_retriever()
+    with stage("vector_query"):
+        results = retriever.query(query_vec, top_k=top_k, include_metadata=True)
+    return _context_chunks(results)
 
-        all_context = f"Patient Info:\n{patient_context}\n\nMedical Book Context:\n" + "\n".join(context_chunks)
+def _build_rag_prompt(user_query, patient_context, context_chunks):
+    all_context = f"Patient Info:\n{patient_context}\n\nMedical Book Context:\n" + "\n".join(context_chunks)
 
-        prompt = f"""
+    prompt = f"""
 You are a clinical AI. Only use the information in the provided context.
 
 Context:
@@ -243,13 +1072,22 @@ Instructions:
 - If context lacks a specific answer, say so.
 - Mention insulin regimen (e.g. PBD) only if clearly stated in the context.
 """.strip()
+    return prompt, all_context
+
+def generate_rag_response(user_query, patient_context=""):
+    try:
+        context_chunks = retrieve_context(user_query)
+        print("[RAG] Retrieved context:", context_chunks)
+
+        prompt, all_context = _build_rag_prompt(user_query, patient_context, context_chunks)
 
         groq_client = get_groq_client()
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.7
-        )
+        with stage("llm_completion"):
+            response = groq_client.chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.7
+            )
 
         return {
             "response": response.choices[0].message.content,
@@ -263,6 +1101,289 @@ Instructions:
             "context_used": ""
         }
 
+# ---- Async RAG pipeline (used by the async route handlers) ----
+async def get_openai_embedding_async(text: str) -> list:
+    cache = get_embedding_cache()
+    key = EmbeddingCache.make_key(text, EMBEDDING_MODEL)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        client = get_async_openai_client()
+        with stage("embedding"):
+            response = await asyncio.wait_for(
+                client.embeddings.create(model=EMBEDDING_MODEL, input=[text]),
+                timeout=RAG_EMBED_TIMEOUT,
+            )
+        embedding = response.data[0].embedding
+        cache.set(key, embedding, EMBEDDING_MODEL)
+        return embedding
+    except Exception as e:
+        print("❌ OpenAI Embedding Error:", e)
+        raise
+
+@timed("retrieve_context")
+async def retrieve_context_async(query, top_k=3, query_vec=None):
+    """Top-k book chunks for ``query``; pass ``query_vec`` if it has already been embedded."""
+    if query_vec is None:
+        query_vec = await get_openai_embedding_async(query)
+    # The Pinecone client is synchronous; run it (and its first-use setup) in a
+    # worker thread so the event loop keeps serving other requests. The local
+    # index answers in-process in well under a millisecond.
+    retriever = _retriever or await asyncio.to_thread(get_retriever)
+    with stage("vector_query"):
+        if not retriever.blocking:
+            return _context_chunks(retriever.query(query_vec, top_k=top_k, include_metadata=True))
+        results = await asyncio.wait_for(
+            asyncio.to_thread(retriever.query, query_vec, top_k=top_k, include_metadata=True),
+            timeout=RAG_QUERY_TIMEOUT,
+        )
+    return _context_chunks(results)
+
+@timed("llm_completion")
+async def _groq_complete_async(messages: list[dict], **kwargs) -> str:
+    client = get_async_groq_client()
+    response = await asyncio.wait_for(
+        client.chat.completions.create(model=RAG_LLM_MODEL, messages=messages, **kwargs),
+        timeout=RAG_LLM_TIMEOUT,
+    )
+    return response.choices[0].message.content
+
+async def _answer_cache_lookup(cache_scope: dict | None):
+    """Embed the scope text and look it up; returns ``(vector, cached_answer)``."""
+    if cache_scope is None:
+        return None, None
+    vector = await get_openai_embedding_async(cache_scope["text"])
+    return vector, get_answer_cache().lookup(cache_scope["namespace"], vector)
+
+async def _retrieve_for(retrieval_query, cache_scope: dict | None, cache_vec):
+    # The scope text is usually the retrieval query too; its vector is then not embedded twice
+    same = cache_vec is not None and cache_scope["text"] == retrieval_query
+    return await retrieve_context_async(retrieval_query, query_vec=cache_vec if same else None)
+
+async def generate_rag_response_async(user_query, patient_context="", cache_scope: dict | None = None,
+                                      retrieval_query: str | None = None):
+    """Non-blocking equivalent of :func:`generate_rag_response`.
+
+    At most ``RAG_MAX_CONCURRENCY`` pipelines run at once; each stage has its
+    own timeout. Identical concurrent calls share one pipeline (single-flight);
+    cancellation (e.g. client disconnect) propagates to the in-flight HTTP
+    calls once no caller is waiting any more. With a ``cache_scope`` (see
+    answer_cache_scope) a semantically matching earlier answer is returned
+    without retrieval or LLM. Book chunks are retrieved for
+    ``retrieval_query`` (default: ``user_query``).
+    """
+    retrieval_query = retrieval_query or user_query
+    if not SINGLEFLIGHT_ENABLED:
+        return await _generate_rag_response_async(user_query, patient_context, cache_scope, retrieval_query)
+    key = ("rag", digest(user_query, patient_context, cache_scope and cache_scope["namespace"], retrieval_query))
+    return await get_single_flight().do_async(
+        key, lambda: _generate_rag_response_async(user_query, patient_context, cache_scope, retrieval_query)
+    )
+
+async def _generate_rag_response_async(user_query, patient_context="", cache_scope: dict | None = None,
+                                       retrieval_query: str | None = None):
+    try:
+        cache_vec, cached = await _answer_cache_lookup(cache_scope)
+        if cached is not None:
+            return {"response": cached["response"], "context_used": cached["context_used"], "cached": True}
+
+        async with get_rag_semaphore():
+            context_chunks = await _retrieve_for(retrieval_query or user_query, cache_scope, cache_vec)
+            print("[RAG] Retrieved context:", context_chunks)
+
+            prompt, all_context = _build_rag_prompt(user_query, patient_context, context_chunks)
+            content = await _groq_complete_async([{"role": "user", "content": prompt}], temperature=0.7)
+
+        result = {
+            "response": content,
+            "context_used": all_context
+        }
+        if cache_vec is not None:
+            get_answer_cache().store(cache_scope["namespace"], cache_vec, result)
+        return result
+
+    except asyncio.CancelledError:
+        raise
+    except asyncio.TimeoutError:
+        print("[RAG ERROR] timed out")
+        return {
+            "response": "❌ AI backend error: request timed out",
+            "context_used": ""
+        }
+    except Exception as e:
+        print("[RAG ERROR]", str(e))
+        return {
+            "response": "❌ AI backend error: " + str(e),
+            "context_used": ""
+        }
+
+async def _cancel_on_disconnect(request: Request, coro, poll_interval: float = 0.5):
+    """Await ``coro`` but cancel it as soon as the client goes away."""
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                print("[RAG] Client disconnected; cancelled generation")
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+class ThinkStripper:
+    """Incrementally remove ``<think>...</think>`` blocks from streamed text.
+
+    Tags may be split across chunks, so a possible partial tag at the end of
+    the buffer is held back until the next chunk arrives. Leading and trailing
+    whitespace of the visible answer is dropped, matching the non-streaming
+    ``.strip()``: whitespace is only sent once more text follows it.
+    """
+
+    OPEN = "<think>"
+    CLOSE = "</think>"
+
+    def __init__(self):
+        self._buf = ""
+        self._in_think = False
+        self._started = False
+        self._space = ""  # trailing whitespace not sent yet
+
+    @staticmethod
+    def _partial_tag_len(text: str, tag: str) -> int:
+        for k in range(min(len(tag) - 1, len(text)), 0, -1):
+            if text.endswith(tag[:k]):
+                return k
+        return 0
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        text = self._space + text
+        visible = text.rstrip()
+        self._space = text[len(visible):]
+        return visible
+
+    def feed(self, chunk: str) -> str:
+        self._buf += chunk
+        out = []
+        while True:
+            if self._in_think:
+                end = self._buf.find(self.CLOSE)
+                if end == -1:
+                    keep = self._partial_tag_len(self._buf, self.CLOSE)
+                    self._buf = self._buf[len(self._buf) - keep:]
+                    break
+                self._buf = self._buf[end + len(self.CLOSE):]
+                self._in_think = False
+            else:
+                start = self._buf.find(self.OPEN)
+                if start == -1:
+                    keep = self._partial_tag_len(self._buf, self.OPEN)
+                    out.append(self._buf[:len(self._buf) - keep])
+                    self._buf = self._buf[len(self._buf) - keep:]
+                    break
+                out.append(self._buf[:start])
+                self._buf = self._buf[start + len(self.OPEN):]
+                self._in_think = True
+        return self._emit("".join(out))
+
+    def flush(self) -> str:
+        rest, self._buf = ("" if self._in_think else self._buf), ""
+        text, self._space = self._emit(rest), ""
+        return text
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _sse_response(events) -> StreamingResponse:
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Disable proxy buffering (nginx/Azure) so tokens reach the browser immediately
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def _groq_stream_async(messages: list[dict], **kwargs):
+    client = get_async_groq_client()
+    start = time.perf_counter()
+    first_token = True
+    with stage("llm_stream"):
+        stream = await asyncio.wait_for(
+            client.chat.completions.create(model=RAG_LLM_MODEL, messages=messages, stream=True, **kwargs),
+            timeout=RAG_LLM_TIMEOUT,
+        )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if first_token:
+                    metrics.STAGE_LATENCY.observe(time.perf_counter() - start, stage="llm_first_token")
+                    first_token = False
+                yield delta
+
+
+async def _stream_completion(messages: list[dict], collected: list[str] | None = None, **kwargs):
+    """SSE ``token`` events for a Groq completion with think-blocks stripped.
+
+    If ``collected`` is given, the visible text is appended to it as it streams.
+    """
+    stripper = ThinkStripper()
+    async for delta in _groq_stream_async(messages, **kwargs):
+        text = stripper.feed(delta)
+        if text:
+            if collected is not None:
+                collected.append(text)
+            yield _sse("token", {"text": text})
+    tail = stripper.flush()
+    if tail:
+        if collected is not None:
+            collected.append(tail)
+        yield _sse("token", {"text": tail})
+
+
+async def stream_rag_response(user_query, patient_context="", cache_scope: dict | None = None,
+                              retrieval_query: str | None = None):
+    """Streaming counterpart of :func:`generate_rag_response_async`.
+
+    Yields ``token`` events as the completion arrives, then a trailing
+    ``context`` event carrying ``context_used`` and a final ``done`` event.
+    Failures are reported as an ``error`` event since headers are already sent.
+    A semantic cache hit is sent as a single ``token`` event.
+    """
+    try:
+        cache_vec, cached = await _answer_cache_lookup(cache_scope)
+        if cached is not None:
+            yield _sse("token", {"text": cached["response"]})
+            yield _sse("context", {"context_used": cached["context_used"]})
+            yield _sse("done", {"cached": True})
+            return
+
+        parts: list[str] = []
+        async with get_rag_semaphore():
+            context_chunks = await _retrieve_for(retrieval_query or user_query, cache_scope, cache_vec)
+            print("[RAG] Retrieved context:", context_chunks)
+            prompt, all_context = _build_rag_prompt(user_query, patient_context, context_chunks)
+            async for event in _stream_completion([{"role": "user", "content": prompt}], parts, temperature=0.7):
+                yield event
+        if cache_vec is not None:
+            get_answer_cache().store(
+                cache_scope["namespace"], cache_vec, {"response": "".join(parts), "context_used": all_context}
+            )
+        yield _sse("context", {"context_used": all_context})
+        yield _sse("done", {})
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        print("[RAG ERROR]", str(e))
+        yield _sse("error", {"detail": "❌ AI backend error: " + (str(e) or "request timed out")})
+
 # Data models
 class PredictionRequest(BaseModel):
     features: list[float]
@@ -271,6 +1392,7 @@ class PredictionRequest(BaseModel):
 
 class BulkPredictRequest(BaseModel):
     rows: list[list[float]]
+    model_version: str | None = None
 
 class TreatmentRequest(BaseModel):
     patient: dict
@@ -297,52 +1419,70 @@ class PatientData(BaseModel):
     dds1: float
     dds3: float
     dds_trend_1_3: float
+    model_version: str | None = None  # therapy_* registry version; routed if unset
 
 class DashboardRequest(BaseModel):
-    features: list[float]
+    features: list[float] | None = None  # built from ``patient`` when omitted
     patient_id: int | None = None
     model_version: str | None = None
-    patient: dict | None = None  # optional; used for key factor strings
+    patient: dict | None = None  # patients row; key factor strings and, if needed, the features
+
+class DashboardBulkRequest(BaseModel):
+    items: list[DashboardRequest]
+    model_version: str | None = None  # default for items that do not set one
 
 # Routes
-@app.post("/predict")
+@app.post("/predict", tags=["risk"])
 def predict(req: PredictionRequest, force: bool = False):
+    model_version = resolve_model_version("risk", req.model_version, req.patient_id)
     try:
-        model_version = req.model_version or "risk_v1"
-
-        # Check MySQL for cached prediction (unless force recompute)
-        if not force and req.patient_id:
-            cached = latest_get(req.patient_id, model_version=model_version)
-            if cached is not None:
-                return {"prediction": cached, "cached": True, "model_version": model_version}
-
-        # Compute fresh prediction
-        m = get_ridge_model()
-        input_data = np.array(req.features, dtype=float).reshape(1, -1)
-        prediction = float(m.predict(input_data)[0])
-        
-        # Laravel will save via POST /api/patients/{id}/risk
-        return {"prediction": prediction, "cached": False, "model_version": model_version}
+        key = ("predict", req.patient_id, digest(req.features), model_version, force)
+        return coalesce(key, lambda: _predict_one(req, model_version, force))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Prediction failed: {e}")
 
 
-@app.post("/predict-bulk")
+def _predict_one(req: PredictionRequest, model_version: str, force: bool) -> dict:
+    # Check local cache, then MySQL, for a cached prediction (unless force recompute)
+    if not force:
+        cached = cache_get(req.features, req.patient_id, model_version=model_version)
+        if cached is not None:
+            return {"prediction": cached, "cached": True, "model_version": model_version}
+    else:
+        cache_invalidate(req.features, req.patient_id, model_version=model_version)
+
+    # Compute fresh prediction
+    prediction = predict_risk_row(req.features, model_version)
+    cache_set(req.features, prediction, req.patient_id, model_version=model_version)
+    # A patient-scoped cache entry always has a saved score behind it, so
+    # /risk-dashboard can trust it without writing again
+    if req.patient_id:
+        persist_risk_scores([(int(req.patient_id), prediction, _risk_label(prediction), model_version,
+                              feature_hash(req.features))])
+    return {"prediction": prediction, "cached": False, "model_version": model_version}
+
+
+@app.post("/predict-bulk", tags=["risk"])
 def predict_bulk(req: BulkPredictRequest):
+    model_version = resolve_model_version("risk", req.model_version)
     try:
-        m = get_ridge_model()
+        m = get_ridge_model(model_version)
         if not req.rows:
-            return {"predictions": []}
+            return {"predictions": [], "model_version": model_version}
 
         # Compute all predictions (no caching for bulk endpoint)
         X = np.array(req.rows, dtype=float)
-        y = m.predict(X)
+        with stage("model_predict"):
+            y = m.predict(X)
         predictions = [float(val) for val in y]
 
-        return {"predictions": predictions}
+        return {"predictions": predictions, "model_version": model_version}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Bulk prediction failed: {e}")
 
+RISK_LABELS = ("Normal", "At Risk", "Moderate Risk", "Risky", "Very Risky", "Critical")  # ascending risk
+
+
 def _risk_label(val: float) -> str:
     if val < 5.7:
         return "Normal"
@@ -357,82 +1497,388 @@ def _risk_label(val: float) -> str:
     return "Critical"
 
 def _key_factors_from_patient(patient: dict | None) -> list[str]:
-    if not patient:
-        return []
-    items: list[str] = []
+    return _key_factors_many([patient])[0]
+
+
+def _key_factors_many(patients: list[dict | None]) -> list[list[str]]:
     try:
-        hba1c1 = float(patient.get("hba1c_1st_visit")) if patient.get("hba1c_1st_visit") is not None else None
-        fvg1 = float(patient.get("fvg_1")) if patient.get("fvg_1") is not None else None
-        rad = patient.get("reduction_a_per_day")
-        rad = float(rad) if rad is not None else None
-        fvg_delta_1_2 = patient.get("fvg_delta_1_2")
-        fvg_delta_1_2 = float(fvg_delta_1_2) if fvg_delta_1_2 is not None else None
-
-        if hba1c1 is not None:
-            if hba1c1 > 8:
-                items.append(f"High initial HbA1c ({hba1c1}%)")
-            elif hba1c1 < 5.7:
-                items.append(f"Normal initial HbA1c ({hba1c1}%)")
-        if fvg1 is not None and fvg1 > 130:
-            items.append(f"Elevated FVG @ V1 ({int(fvg1)} mg/dL)")
-        if rad is not None and rad < 0.01:
-            items.append(f"Low daily HbA1c drop ({rad:.3f})")
-        if fvg_delta_1_2 is not None and fvg_delta_1_2 > 0:
-            items.append(f"FVG increase between visits (+{fvg_delta_1_2})")
+        return patient_features.key_factors(patient_features.columns(p or {} for p in patients))
     except Exception:
         # Best-effort only
-        pass
-    return items[:6]
-
-@app.post("/risk-dashboard")
+        return [[] for _ in patients]
+
+
+def fill_risk_features(items: list[DashboardRequest]) -> None:
+    """Set ``features`` from ``patient`` where omitted, in one column-wise pass (422 if incomplete)."""
+    missing = [item for item in items if item.features is None]
+    if not missing:
+        return
+    if any(item.patient is None for item in missing):
+        raise HTTPException(status_code=422, detail="Each item needs features or a patient record")
+    X, complete = patient_features.risk_matrix(patient_features.columns(item.patient for item in missing))
+    if not complete.all():
+        ids = [item.patient_id for item, ok in zip(missing, complete) if not ok]
+        raise HTTPException(status_code=422, detail=f"Incomplete risk inputs for patients {ids}: "
+                                                    + ", ".join(patient_features.RISK_COLUMNS))
+    for item, row in zip(missing, X.tolist()):
+        item.features = row
+
+
+def _score_dashboard_items(items: list[DashboardRequest], versions: list[str]) -> list[float]:
+    """Fresh scores for ``items``: one vectorized predict per model version, then cache + persist."""
+    scores: list[float] = [0.0] * len(items)
+    to_save: list[tuple[int, float, str, str, str]] = []
+    for version in sorted(set(versions)):
+        rows = [i for i, v in enumerate(versions) if v == version]
+        m = get_ridge_model(version)
+        X = np.array([items[i].features for i in rows], dtype=float)
+        with stage("model_predict"):
+            y = m.predict(X)
+        for i, val in zip(rows, y):
+            scores[i] = float(val)
+            cache_set(items[i].features, scores[i], items[i].patient_id, model_version=version)
+            if items[i].patient_id:
+                to_save.append((int(items[i].patient_id), scores[i], _risk_label(scores[i]), version,
+                                feature_hash(items[i].features)))
+    # Multi-row write-back (queued; batched with other requests)
+    persist_risk_scores(to_save)
+    return scores
+
+
+# ---- Stale-while-revalidate: stale saved scores are served, then recomputed in the background ----
+RISK_SWR_ENABLED = os.getenv("RISK_SWR_ENABLED", "true").lower() in ("1", "true", "yes")
+_risk_refresher = None
+_risk_refreshing: set[tuple[int, str]] = set()
+# (patient_id, version) -> monotonic time its last refresh finished. A refresh whose write
+# was dropped leaves the old hash in MySQL, so without a cooldown every read would refresh again.
+_risk_refreshed_at: dict[tuple[int, str], float] = {}
+_risk_refresh_lock = threading.Lock()
+_risk_refresh_stats = {"stale_served": 0, "scheduled": 0, "cooldown_skipped": 0, "refreshed": 0, "failed": 0}
+RISK_REFRESH_COOLDOWN = float(os.getenv("RISK_REFRESH_COOLDOWN", "300"))
+
+
+def schedule_risk_refresh(items: list[DashboardRequest], versions: list[str]) -> None:
+    """Recompute stale scores off the request path (``items`` were just served stale).
+
+    Patients already being refreshed, or refreshed less than RISK_REFRESH_COOLDOWN
+    seconds ago, are skipped.
+    """
+    global _risk_refresher
+    now = time.monotonic()
+    metrics.RISK_STALE_SERVED.inc(len(items))
+    with _risk_refresh_lock:
+        _risk_refresh_stats["stale_served"] += len(items)
+        pending, cooling = [], 0
+        for item, v in zip(items, versions):
+            if not item.patient_id or (item.patient_id, v) in _risk_refreshing:
+                continue
+            if now - _risk_refreshed_at.get((item.patient_id, v), -RISK_REFRESH_COOLDOWN) < RISK_REFRESH_COOLDOWN:
+                cooling += 1
+                continue
+            pending.append((item, v))
+        _risk_refresh_stats["cooldown_skipped"] += cooling
+        if cooling:
+            metrics.RISK_REFRESHES.inc(cooling, result="cooldown")
+        if not pending:
+            return
+        _risk_refreshing.update((item.patient_id, v) for item, v in pending)
+        _risk_refresh_stats["scheduled"] += len(pending)
+        if _risk_refresher is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _risk_refresher = ThreadPoolExecutor(
+                max_workers=int(os.getenv("RISK_REFRESH_WORKERS", "2")), thread_name_prefix="risk-refresh"
+            )
+    metrics.RISK_REFRESHES.inc(len(pending), result="scheduled")
+
+    def refresh():
+        result = "refreshed"
+        try:
+            _score_dashboard_items([item for item, _ in pending], [v for _, v in pending])
+        except Exception as e:
+            print("[RISK] Background refresh failed:", e)
+            result = "failed"
+        metrics.RISK_REFRESHES.inc(len(pending), result=result)
+        with _risk_refresh_lock:
+            _risk_refresh_stats[result] += len(pending)
+            _risk_refreshing.difference_update((item.patient_id, v) for item, v in pending)
+            done = time.monotonic()
+            if len(_risk_refreshed_at) > 10000:  # forget cooldowns that have run out
+                for key in [k for k, t in _risk_refreshed_at.items() if done - t >= RISK_REFRESH_COOLDOWN]:
+                    del _risk_refreshed_at[key]
+            _risk_refreshed_at.update(((item.patient_id, v), done) for item, v in pending)
+
+    _risk_refresher.submit(refresh)
+
+
+def _dashboard_score(req: DashboardRequest, model_version: str, force: bool) -> tuple[float, bool, bool]:
+    """``(score, cached, stale)`` for one dashboard row; fresh scores are saved to MySQL."""
+    # 1) Check local cache, then MySQL, for last saved prediction (unless force recalculate)
+    if not force:
+        cached_score, stale = cache_lookup(req.features, req.patient_id, model_version=model_version)
+        if cached_score is not None and (not stale or RISK_SWR_ENABLED):
+            if stale:
+                schedule_risk_refresh([req], [model_version])
+            return float(cached_score), True, stale
+
+    # 2) No cached value or force=true: compute fresh prediction
+    if force:
+        cache_invalidate(req.features, req.patient_id, model_version=model_version)
+    prediction_val = predict_risk_row(req.features, model_version)
+    cache_set(req.features, prediction_val, req.patient_id, model_version=model_version)
+    # Persist the fresh score (write-behind) so future calls hit the MySQL cache
+    if req.patient_id:
+        persist_risk_scores([(int(req.patient_id), prediction_val, _risk_label(prediction_val), model_version,
+                              feature_hash(req.features))])
+    return prediction_val, False, False
+
+
+@app.post("/risk-dashboard", tags=["risk"])
 def risk_dashboard(req: DashboardRequest, force: bool = False):
+    fill_risk_features([req])
+    model_version = resolve_model_version("risk", req.model_version, req.patient_id)
     try:
-        model_version = req.model_version or "risk_v1"
-
-        # 1) Check MySQL for last saved prediction (unless force recalculate)
-        if not force and req.patient_id:
-            cached_score = latest_get(req.patient_id, model_version=model_version)
-            if cached_score is not None:
-                label = _risk_label(float(cached_score))
-                factors = _key_factors_from_patient(req.patient)
-                return {
-                    "prediction": float(cached_score),
-                    "risk_label": label,
-                    "key_factors": factors,
-                    "cached": True,
-                    "stale": False,
-                    "model_version": model_version,
-                }
-
-        # 2) No cached value or force=true: compute fresh prediction
-        m = get_ridge_model()
-        input_data = np.array(req.features, dtype=float).reshape(1, -1)
-        prediction_val = float(m.predict(input_data)[0])
-
-        label = _risk_label(prediction_val)
-        # Persist fresh score directly to MySQL so future calls hit cache
-        if req.patient_id:
-            save_latest_to_mysql(int(req.patient_id), prediction_val, label, model_version=model_version)
-        factors = _key_factors_from_patient(req.patient)
+        # Two tabs / a double-clicked "recalculate" share one lookup + predict + save
+        key = ("risk-dashboard", req.patient_id, digest(req.features), model_version, force)
+        score, cached, stale = coalesce(key, lambda: _dashboard_score(req, model_version, force))
         return {
-            "prediction": prediction_val,
-            "risk_label": label,
-            "key_factors": factors,
-            "cached": False,
-            "stale": False,
+            "prediction": score,
+            "risk_label": _risk_label(score),
+            "key_factors": _key_factors_from_patient(req.patient),
+            "cached": cached,
+            "stale": stale,
             "model_version": model_version,
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Risk dashboard failed: {e}")
 
-@app.post("/rag")
-async def rag_query(request: Request):
+@app.post("/risk-dashboard-bulk", tags=["risk"])
+def risk_dashboard_bulk(req: DashboardBulkRequest, force: bool = False):
+    """Score a whole patient list: one cache SELECT, one predict, one UPDATE.
+
+    Saved scores that are stale (see :func:`is_stale`) are returned as-is
+    with ``stale: true`` and recomputed in the background, so a dashboard
+    always renders in one pass and converges on the next load.
+    """
+    if not req.items:
+        return {"results": []}
+    fill_risk_features(req.items)
+    versions = [
+        resolve_model_version("risk", item.model_version or req.model_version, item.patient_id)
+        for item in req.items
+    ]
+    try:
+
+        cache = get_prediction_cache()
+        keys = [PredictionCache.make_key(item.features, v, item.patient_id) for item, v in zip(req.items, versions)]
+        scores: list[float | None] = [None] * len(req.items)
+        is_cached = [False] * len(req.items)
+        is_stale_row = [False] * len(req.items)
+
+        # 1) Local cache first, then one MySQL lookup per model version (normally just one)
+        if force:
+            for item, key in zip(req.items, keys):
+                cache.invalidate(key=key, patient_id=item.patient_id)
+        else:
+            for i, key in enumerate(keys):
+                scores[i] = cache.get(key)
+                is_cached[i] = scores[i] is not None
+            for version in set(versions):
+                ids = [
+                    item.patient_id
+                    for i, (item, v) in enumerate(zip(req.items, versions))
+                    if v == version and item.patient_id and not is_cached[i]
+                ]
+                found = latest_get_many(ids, model_version=version) if ids else {}
+                for i, (item, v) in enumerate(zip(req.items, versions)):
+                    stored = found.get(item.patient_id) if v == version and not is_cached[i] else None
+                    if stored is None:
+                        continue
+                    if not is_stale(stored, item.features):
+                        scores[i] = stored.score
+                        is_cached[i] = True
+                        cache.set(keys[i], scores[i], patient_id=item.patient_id)
+                    elif RISK_SWR_ENABLED:
+                        scores[i] = stored.score
+                        is_cached[i] = is_stale_row[i] = True
+
+        # Stale rows are answered now and recomputed in one background batch
+        stale_rows = [i for i, s in enumerate(is_stale_row) if s]
+        if stale_rows:
+            schedule_risk_refresh([req.items[i] for i in stale_rows], [versions[i] for i in stale_rows])
+
+        # 2) One vectorized predict per model version for every miss, saved in one multi-row write
+        misses = [i for i, hit in enumerate(is_cached) if not hit]
+        if misses:
+            fresh = _score_dashboard_items([req.items[i] for i in misses], [versions[i] for i in misses])
+            for i, val in zip(misses, fresh):
+                scores[i] = val
+
+        factors = _key_factors_many([item.patient for item in req.items])
+        results = []
+        for item, score, hit, stale, version, key_factors in zip(
+            req.items, scores, is_cached, is_stale_row, versions, factors
+        ):
+            results.append({
+                "patient_id": item.patient_id,
+                "prediction": score,
+                "risk_label": _risk_label(score),
+                "key_factors": key_factors,
+                "cached": hit,
+                "stale": stale,
+                "model_version": version,
+            })
+        return {"results": results}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Risk dashboard bulk failed: {e}")
+
+# ---- Cohort summary for the dashboard (see risk_summary.py) ----
+RISK_SUMMARY_TTL = float(os.getenv("RISK_SUMMARY_TTL", "300"))  # seconds before a full rebuild
+# Every gunicorn worker holds its own summary; scores other workers saved are read back this often
+RISK_SUMMARY_SYNC_SECONDS = float(os.getenv("RISK_SUMMARY_SYNC_SECONDS", "5"))
+_risk_summaries: dict[str, "RiskSummary"] = {}
+_risk_summary_lock = threading.Lock()
+
+
+@timed("mysql_lookup_cohort")
+def load_risk_cohort() -> tuple[object, list[tuple]]:
+    """``(db_now, rows)``: MySQL's NOW() before the scan, and
+    ``(id, name, assigned_doctor_id, *features, *stored score columns)`` for every patient, one SELECT.
+    """
+    with get_mysql_pool().connection() as conn:
+        if conn is None:
+            raise RuntimeError("MySQL unavailable")
+        columns = _stored_score_columns(conn)
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT NOW()")
+            (db_now,) = cursor.fetchone()
+            cursor.execute(
+                f"SELECT id, name, assigned_doctor_id, {', '.join(patient_features.RISK_COLUMNS)}, {columns} "
+                "FROM patients"
+            )
+            return db_now, cursor.fetchall()
+        finally:
+            cursor.close()
+
+
+@timed("mysql_lookup_recent_scores")
+def sync_risk_summary(summary: "RiskSummary") -> None:
+    """Apply scores saved since the last sync, e.g. by other gunicorn workers.
+
+    One SELECT on ``last_predicted_at`` (indexed); the watermark is MySQL's own
+    clock, and rows on the boundary second are simply applied twice.
+    """
+    with get_mysql_pool().connection() as conn:
+        if conn is None:
+            raise RuntimeError("MySQL unavailable")
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT NOW()")
+            (db_now,) = cursor.fetchone()
+            cursor.execute(
+                "SELECT id, last_risk_score FROM patients "
+                "WHERE last_predicted_at >= %s AND risk_model_version = %s AND last_risk_score IS NOT NULL",
+                (summary.db_watermark, summary.model_version),
+            )
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    for pid, score in rows:
+        if int(pid) in summary:  # patients new since the last build wait for it
+            summary.update(int(pid), float(score))
+    summary.db_watermark = db_now
+    summary.synced_at = time.monotonic()
+
+
+def build_risk_summary(model_version: str) -> "RiskSummary":
+    """Score the whole cohort: fresh saved scores as-is, everything else in one vectorized predict."""
+    from risk_summary import RiskSummary
+    db_now, rows = load_risk_cohort()
+    n_features = len(patient_features.RISK_COLUMNS)
+    X, complete = patient_features.risk_matrix(
+        patient_features.columns((row[3:3 + n_features] for row in rows), patient_features.RISK_COLUMNS)
+    )
+    scores = np.full(len(rows), np.nan)
+    for i in np.flatnonzero(complete):
+        stored = _stored_score(rows[i][3 + n_features:], model_version)
+        if stored is not None and not is_stale(stored, X[i].tolist()):
+            scores[i] = stored.score
+
+    misses = np.flatnonzero(complete & np.isnan(scores))
+    if misses.size:
+        scores[misses] = _predict_risk_rows(model_version, X[misses])
+        to_save = []
+        for i in misses:
+            features = X[i].tolist()
+            cache_set(features, float(scores[i]), int(rows[i][0]), model_version=model_version)
+            to_save.append((int(rows[i][0]), float(scores[i]), _risk_label(scores[i]), model_version,
+                            feature_hash(features)))
+        persist_risk_scores(to_save)
+
+    summary = RiskSummary(model_version, _risk_label, RISK_LABELS)
+    summary.db_watermark = db_now
+    summary.unscored = int((~complete).sum())
+    for i in np.flatnonzero(complete):
+        pid, name, doctor_id = rows[i][:3]
+        summary.update(int(pid), float(scores[i]), doctor_id, name)
+    print(f"[RISK] Summary for {model_version}: {len(rows)} patients, {misses.size} scored fresh")
+    return summary
+
+
+def get_risk_summary(model_version: str, refresh: bool = False) -> "RiskSummary":
+    summary = _risk_summaries.get(model_version)
+    if summary is not None and not refresh and time.time() - summary.built_at < RISK_SUMMARY_TTL:
+        if time.monotonic() - summary.synced_at >= RISK_SUMMARY_SYNC_SECONDS and summary.db_watermark is not None:
+            try:
+                coalesce(("risk-summary-sync", model_version), lambda: sync_risk_summary(summary))
+            except Exception as e:
+                print("[RISK] Summary sync failed, serving the last one:", e)
+        return summary
+    # Concurrent dashboards share one rebuild
+    summary = coalesce(("risk-summary", model_version), lambda: build_risk_summary(model_version))
+    with _risk_summary_lock:
+        _risk_summaries[model_version] = summary
+    return summary
+
+
+def note_risk_scores(rows: list[tuple[int, float, str, str, str | None]]) -> None:
+    """Apply freshly computed scores to the cached summaries (patients new since the last build wait for it)."""
+    for pid, score, _, version, _ in rows:
+        summary = _risk_summaries.get(version)
+        if summary is not None and pid in summary:
+            summary.update(pid, score)
+
+
+@app.get("/risk-summary", tags=["risk"])
+def risk_summary(top: int = 10, doctor_id: int | None = None, scores: bool = False, refresh: bool = False,
+                 model_version: str | None = None):
+    """Label distribution, top-risk patients and per-doctor breakdown for the whole cohort.
+
+    Served from an in-memory summary that is kept current as scores are
+    recomputed (in this worker directly, from other workers through MySQL
+    every RISK_SUMMARY_SYNC_SECONDS) and rebuilt every RISK_SUMMARY_TTL seconds (or on
+    ``refresh=true``). ``scores=true`` adds every patient's score in columnar
+    form so a dashboard can render from this one response.
+    """
+    version = resolve_model_version("risk", model_version)
+    try:
+        summary = get_risk_summary(version, refresh)
+        result = summary.snapshot(top_n=max(0, top), doctor_id=doctor_id, include_scores=scores)
+        result["age_seconds"] = time.time() - summary.built_at
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Risk summary failed: {e}")
+
+
+@app.post("/rag", tags=["rag"])
+async def rag_query(request: Request, cache: bool = True):
     query = (await request.json())["query"]
-    response_text = generate_rag_response(query)
+    scope = answer_cache_scope("rag", query, RAG_PROMPT_VERSION, enabled=cache)
+    response_text = await _cancel_on_disconnect(request, generate_rag_response_async(query, cache_scope=scope))
     return {"response": response_text}
 
-@app.post("/treatment-recommendation")
-async def treatment_recommendation(request: Request):
+@app.post("/treatment-recommendation", tags=["rag"])
+async def treatment_recommendation(request: Request, cache: bool = True):
     try:
         body = await request.json()
         patient = body["patient"]
@@ -442,22 +1888,26 @@ async def treatment_recommendation(request: Request):
         patient_data = "\n".join([f"{k}: {v}" for k, v in patient.items()])
 
         # Use RAG-style structured prompt (pass patient context)
-        response = generate_rag_response(question, patient_context=patient_data)
+        scope = answer_cache_scope("treatment", question, RAG_PROMPT_VERSION, patient=patient, enabled=cache)
+        response = await _cancel_on_disconnect(
+            request, generate_rag_response_async(question, patient_context=patient_data, cache_scope=scope)
+        )
 
         return {
             "response": response["response"],
             "context_used": response["context_used"]
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         print("❌ Treatment Recommendation Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/chatbot-patient-query")
-async def chatbot_patient_query(req: PatientChatRequest):
-    patient_data = "\n".join([f"{k}: {v}" for k, v in req.patient.items()])
-    prompt = f"""
+def _chatbot_prompt(patient: dict, query: str) -> str:
+    patient_data = "\n".join([f"{k}: {v}" for k, v in patient.items()])
+    return f"""
 You are a clinical health assistant.
 
 Context:
@@ -465,7 +1915,7 @@ Patient Info:
 {patient_data}
 
 User Question:
-{req.query}
+{query}
 
 Instructions:
 - Answer directly and concisely based only on the patient's context.
@@ -479,46 +1929,52 @@ Instructions:
 - Keep responses friendly and clear, under 180 words.
 """
 
-    response = generate_rag_response(prompt)
+@app.post("/chatbot-patient-query", tags=["rag"])
+async def chatbot_patient_query(req: PatientChatRequest, request: Request, cache: bool = True):
+    prompt = _chatbot_prompt(req.patient, req.query)
+    scope = answer_cache_scope("chatbot", req.query, CHATBOT_PROMPT_VERSION, patient=req.patient, enabled=cache)
+    # Retrieve for the question itself: it is what the cache embeds, and the template adds nothing to search on
+    response = await _cancel_on_disconnect(
+        request, generate_rag_response_async(prompt, cache_scope=scope, retrieval_query=req.query)
+    )
     return {"response": response["response"]}
 
 
-@app.post("/predict-therapy-pathline")
-def predict_therapy_pathline(data: PatientData):
-    try:
-        patient_dict = {
-            'INSULIN REGIMEN': [data.insulin_regimen],
-            'HbA1c1': [data.hba1c1],
-            'HbA1c2': [data.hba1c2],
-            'HbA1c3': [data.hba1c3],
-            'HbA1c_Delta_1_2': [data.hba1c_delta_1_2],
-            'Gap from initial visit (days)': [data.gap_initial_visit],
-            'Gap from first clinical visit (days)': [data.gap_first_clinical],
-            'eGFR': [data.egfr],
-            'Reduction (%)': [data.reduction_percent],
-            'FVG1': [data.fvg1],
-            'FVG2': [data.fvg2],
-            'FVG3': [data.fvg3],
-            'FVG_Delta_1_2': [data.fvg_delta_1_2],
-            'DDS1': [data.dds1],
-            'DDS3': [data.dds3],
-            'DDS_Trend_1_3': [data.dds_trend_1_3],
-        }
+# ---- Streaming (Server-Sent Events) variants ----
+@app.post("/treatment-recommendation/stream", tags=["rag"])
+async def treatment_recommendation_stream(req: TreatmentRequest, cache: bool = True):
+    patient_data = "\n".join([f"{k}: {v}" for k, v in req.patient.items()])
+    scope = answer_cache_scope("treatment", req.question, RAG_PROMPT_VERSION, patient=req.patient, enabled=cache)
+    return _sse_response(stream_rag_response(req.question, patient_context=patient_data, cache_scope=scope))
+
 
-        df = pd.DataFrame(patient_dict)
-        visits = [data.hba1c1, data.hba1c2, data.hba1c3]
-        probabilities = []
+@app.post("/chatbot-patient-query/stream", tags=["rag"])
+async def chatbot_patient_query_stream(req: PatientChatRequest, cache: bool = True):
+    scope = answer_cache_scope("chatbot", req.query, CHATBOT_PROMPT_VERSION, patient=req.patient, enabled=cache)
+    return _sse_response(
+        stream_rag_response(_chatbot_prompt(req.patient, req.query), cache_scope=scope, retrieval_query=req.query)
+    )
 
-        tm = get_therapy_model()
-        for val in visits:
-            df['HbA1c1'] = [val]
-            prob = tm.predict_proba(df)[0][1]
-            probabilities.append(round(prob, 3))
 
-        prob_text = "\n".join([f"Visit {i+1}: {p * 100:.1f}%" for i, p in enumerate(probabilities)])
-        prompt = (
-            f"The patient is undergoing the insulin regimen: {data.insulin_regimen}.\n"
-    "The predicted therapy effectiveness probabilities over three visits are:\n{prob_text}\n\n"
+# ---- Therapy scoring (see therapy_model.py) ----
+def patient_from_inputs(inputs: dict[str, np.ndarray], i: int) -> "PatientData":
+    return PatientData(**{
+        attr: inputs[col][i] if col == patient_features.THERAPY_CATEGORY else float(inputs[col][i])
+        for col, attr in THERAPY_INPUT_FIELDS.items()
+    })
+
+
+@timed("therapy_predict")
+def predict_therapy_pathlines(patients: list["PatientData"], model: "TherapyModel | None" = None) -> np.ndarray:
+    """Therapy-effectiveness probabilities for every visit of every patient."""
+    return (model or get_therapy_model()).predict_pathlines(patients)
+
+
+def _therapy_insight_messages(data: PatientData, probabilities: list[float]) -> list[dict]:
+    prob_text = "\n".join([f"Visit {i+1}: {p * 100:.1f}%" for i, p in enumerate(probabilities)])
+    prompt = (
+        f"The patient is undergoing the insulin regimen: {data.insulin_regimen}.\n"
+    f"The predicted therapy effectiveness probabilities over three visits are:\n{prob_text}\n\n"
 
     "Format output in strict markdown with the following sections:\n\n"
 
@@ -540,30 +1996,300 @@ def predict_therapy_pathline(data: PatientData):
     f"HbA1c scores: {data.hba1c1}, {data.hba1c2}, {data.hba1c3}\n"
     f"FVG scores: {data.fvg1}, {data.fvg2}, {data.fvg3}\n"
     f"DDS scores: {data.dds1}, {data.dds3}\n"
-        )
+    )
+    return [
+        {"role": "system", "content": "You are a helpful medical AI assistant."},
+        {"role": "user", "content": prompt}
+    ]
 
-        llm = get_groq_client().chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are a helpful medical AI assistant."},
-                {"role": "user", "content": prompt}
-            ]
-        )
+
+def _add_local_factors(result: dict, tm: TherapyModel, data: PatientData) -> None:
+    # An explicit reason instead of a bare null, so clients can tell "not installed" from "no factors"
+    reason = tm.explain_unavailable()
+    result["local_factors"] = None if reason else tm.local_factors(data)
+    if reason:
+        result["local_factors_unavailable"] = reason
+
+
+@app.post("/predict-therapy-pathline", tags=["therapy"])
+def predict_therapy_pathline(data: PatientData, explain: bool = False):
+    model_version = resolve_model_version("therapy", data.model_version)
+    key = ("therapy-pathline", digest(data.model_dump(exclude={"model_version"})), model_version, explain)
+    return coalesce(key, lambda: _therapy_pathline(data, model_version, explain))
+
+
+def _therapy_pathline(data: PatientData, model_version: str, explain: bool) -> dict:
+    try:
+        tm = get_therapy_model(model_version)
+        probabilities = [round(float(p), 3) for p in predict_therapy_pathlines([data], tm)[0]]
+
+        with stage("llm_completion"):
+            llm = get_groq_client().chat.completions.create(
+                model="llama-3.3-70b-versatile",
+                messages=_therapy_insight_messages(data, probabilities)
+            )
 
         full_reply = llm.choices[0].message.content
         insight = full_reply.split("</think>")[-1].strip() if "</think>" in full_reply else full_reply.strip()
 
-        feature_names = tm.named_steps['preprocessor'].get_feature_names_out()
-        importances = tm.named_steps['classifier'].feature_importances_
-        sorted_features = sorted(zip(feature_names, importances), key=lambda x: x[1], reverse=True)
-        top_factors = [{"feature": name, "importance": round(score, 4)} for name, score in sorted_features[:5]]
-
-        return {
+        result = {
             "probabilities": probabilities,
             "insight": insight,
-            "top_factors": top_factors
+            "top_factors": tm.top_factors,
+            "model_version": model_version,
         }
+        if explain:
+            _add_local_factors(result, tm, data)
+        return result
 
     except Exception as e:
         print("❌ LLM Pathline Error:", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/predict-therapy-pathline/stream", tags=["therapy"])
+async def predict_therapy_pathline_stream(data: PatientData, explain: bool = False):
+    """Send the probabilities immediately, then stream the LLM insight."""
+    model_version = resolve_model_version("therapy", data.model_version)
+
+    def score():
+        tm = get_therapy_model(model_version)
+        result = {
+            "probabilities": [round(float(p), 3) for p in predict_therapy_pathlines([data], tm)[0]],
+            "top_factors": tm.top_factors,
+            "model_version": model_version,
+        }
+        if explain:
+            _add_local_factors(result, tm, data)
+        return result
+
+    try:
+        prediction = await asyncio.to_thread(score)
+    except Exception as e:
+        print("❌ LLM Pathline Error:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        yield _sse("prediction", prediction)
+        try:
+            async for event in _stream_completion(_therapy_insight_messages(data, prediction["probabilities"])):
+                yield event
+            yield _sse("done", {})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print("❌ LLM Pathline Error:", e)
+            yield _sse("error", {"detail": str(e) or "request timed out"})
+
+    return _sse_response(events())
+
+
+# ---- Bulk therapy scoring ----
+@timed("mysql_lookup_therapy")
+def load_therapy_inputs(patient_ids: list[int]) -> tuple[list[int], dict[str, np.ndarray], dict[int, str]]:
+    """Therapy model inputs for many patients, one SELECT per chunk.
+
+    Returns ``(ids, inputs, skipped)``: ``inputs`` are columns aligned with
+    ``ids``; ``skipped`` maps ids that are missing or have incomplete visit
+    data to the reason.
+    """
+    ids = list(dict.fromkeys(int(pid) for pid in patient_ids))
+    sources = list(dict.fromkeys(patient_features.THERAPY_COLUMNS.values()))
+    rows: dict[int, dict] = {}
+    with get_mysql_pool().connection() as conn:
+        if conn is None:
+            raise RuntimeError("MySQL unavailable")
+        cursor = conn.cursor(dictionary=True)
+        try:
+            for start in range(0, len(ids), _MYSQL_BATCH):
+                chunk = ids[start:start + _MYSQL_BATCH]
+                placeholders = ", ".join(["%s"] * len(chunk))
+                cursor.execute(f"SELECT id, {', '.join(sources)} FROM patients WHERE id IN ({placeholders})",
+                               tuple(chunk))
+                for row in cursor.fetchall():
+                    rows[int(row["id"])] = row
+        finally:
+            cursor.close()
+
+    skipped = {pid: "not found" for pid in ids if pid not in rows}
+    found = [pid for pid in ids if pid in rows]
+    inputs = patient_features.therapy_inputs(patient_features.columns((rows[pid] for pid in found), sources))
+    gaps = {
+        col: values == None if col == patient_features.THERAPY_CATEGORY else np.isnan(values)  # noqa: E711
+        for col, values in inputs.items()
+    }
+    incomplete = np.logical_or.reduce(list(gaps.values())) if found else np.zeros(0, dtype=bool)
+    for i in np.flatnonzero(incomplete):
+        missing = [patient_features.THERAPY_COLUMNS[col] for col, gap in gaps.items() if gap[i]]
+        skipped[found[i]] = "missing " + ", ".join(dict.fromkeys(missing))
+    keep = np.flatnonzero(~incomplete)
+    return [found[i] for i in keep], {col: values[keep] for col, values in inputs.items()}, skipped
+
+
+class TherapyBulkRequest(BaseModel):
+    patients: list[PatientData] = []
+    patient_ids: list[int] = []  # loaded from the patients table
+    model_version: str | None = None  # default for patients that do not set one
+    insight: bool = False  # also generate the LLM insight per patient (slow)
+
+
+@app.post("/predict-therapy-bulk", tags=["therapy"])
+async def predict_therapy_bulk(req: TherapyBulkRequest):
+    """Score every visit pathline of many patients in one vectorized pass.
+
+    Inline ``patients`` come first, then ``patient_ids`` in request order.
+    The response is columnar (one list per field, aligned by position);
+    patients that cannot be scored are listed under ``skipped`` instead.
+    """
+    try:
+        loaded_ids, loaded, skipped = (
+            await asyncio.to_thread(load_therapy_inputs, req.patient_ids) if req.patient_ids
+            else ([], patient_inputs([]), {})
+        )
+    except Exception as e:
+        print("❌ Therapy Bulk Error:", e)
+        raise HTTPException(status_code=503, detail=f"Could not load patients: {e}")
+
+    # Inline records and loaded rows as one set of input columns
+    inline = patient_inputs(req.patients)
+    inputs = {col: np.concatenate([inline[col], loaded[col]]) for col in inline}
+    keys: list[int | None] = [None] * len(req.patients) + loaded_ids
+    versions = np.array(
+        [resolve_model_version("therapy", p.model_version or req.model_version) for p in req.patients]
+        + [resolve_model_version("therapy", req.model_version, pid) for pid in loaded_ids],
+        dtype=object,
+    )
+    regimens = inputs[patient_features.THERAPY_CATEGORY]
+
+    def score():
+        proba = np.full((len(keys), len(THERAPY_VISITS)), np.nan)
+        ok = np.ones(len(keys), dtype=bool)
+        errors: dict[int, str] = {}
+        for version in sorted(set(versions)):
+            tm = get_therapy_model(version)
+            rows = np.flatnonzero(versions == version)
+            if tm.layout is not None:
+                unknown = rows[~np.isin(regimens[rows], tm.layout["categories"])]
+                for i in unknown:
+                    errors[int(i)] = f"unknown insulin regimen {regimens[i]!r}"
+                ok[unknown] = False
+                rows = rows[ok[rows]]
+            if rows.size:
+                with stage("therapy_predict"):
+                    proba[rows] = tm.predict_inputs({col: values[rows] for col, values in inputs.items()})
+        return np.round(proba, 3), ok, errors
+
+    try:
+        proba, ok, errors = await asyncio.to_thread(score)
+    except Exception as e:
+        print("❌ Therapy Bulk Error:", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def index(i: int) -> int | None:  # position in ``patients`` for inline records
+        return i if keys[i] is None else None
+
+    scored = [i for i in range(len(keys)) if ok[i]]
+    result = {
+        "count": len(scored),
+        "patient_id": [keys[i] for i in scored],
+        "index": [index(i) for i in scored],
+        "model_version": [versions[i] for i in scored],
+        **{f"visit_{v + 1}": proba[scored, v].tolist() for v in range(len(THERAPY_VISITS))},
+        "skipped": [{"patient_id": pid, "index": None, "reason": reason} for pid, reason in skipped.items()]
+        + [{"patient_id": keys[i], "index": index(i), "reason": reason} for i, reason in errors.items()],
+    }
+
+    if req.insight:
+        async def insight(i: int) -> str | None:
+            async with get_rag_semaphore():
+                try:
+                    reply = await _groq_complete_async(
+                        _therapy_insight_messages(patient_from_inputs(inputs, i), proba[i].tolist())
+                    )
+                except Exception as e:
+                    print("❌ LLM Pathline Error:", e)
+                    return None
+            return reply.split("</think>")[-1].strip()
+
+        result["insight"] = await asyncio.gather(*(insight(i) for i in scored))
+    return result
+
+
+def _prune_disabled_features() -> None:
+    disabled = set(ALL_FEATURES) - ENABLED_FEATURES
+    if not disabled:
+        return
+    app.router.routes = [
+        r for r in app.router.routes if not disabled.intersection(getattr(r, "tags", None) or ())
+    ]
+    print("[STARTUP] disabled features:", ",".join(sorted(disabled)))
+
+
+_prune_disabled_features()
+_MAIN_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+
+
+def profile_startup(top: int = 25, resources: list[str] | None = None) -> dict:
+    """Measure per-module import cost and per-resource load cost.
+
+    Imports are timed in a fresh interpreter with ``-X importtime`` so the
+    numbers reflect a real cold start; resources are then loaded serially
+    in this process.
+    """
+    import subprocess
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        env={**os.environ, "PROFILE_STARTUP": ""},
+    )
+    modules = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        modules.append({"module": name.strip(), "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000})
+    packages: dict[str, float] = {}
+    for m in modules:
+        root = m["module"].split(".")[0]
+        packages[root] = packages.get(root, 0.0) + m["self_ms"]
+
+    names = resources if resources is not None else [n for n, g in WARMUP_DEFAULTS.items() if g in ENABLED_FEATURES]
+    run_warmup([n for n in names if n in WARMUP_LOADERS], parallel=False)
+    return {
+        "import_total_ms": round(sum(m["self_ms"] for m in modules), 1),
+        "top_modules": sorted(modules, key=lambda m: m["self_ms"], reverse=True)[:top],
+        "top_packages": sorted(({"package": k, "self_ms": round(v, 1)} for k, v in packages.items()),
+                               key=lambda p: p["self_ms"], reverse=True)[:top],
+        "resources": _warmup["resources"],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="FastAPI service utilities")
+    parser.add_argument("--profile-startup", action="store_true", help="report import and model-load costs")
+    parser.add_argument("--top", type=int, default=25)
+    parser.add_argument("--resources", help="comma-separated warm-up resources to time")
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    if args.profile_startup:
+        report = profile_startup(args.top, args.resources.split(",") if args.resources else None)
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"Total import time: {report['import_total_ms']} ms")
+            print("\nTop packages (self time):")
+            for p in report["top_packages"]:
+                print(f"  {p['self_ms']:>9.1f} ms  {p['package']}")
+            print("\nTop modules (self time):")
+            for m in report["top_modules"]:
+                print(f"  {m['self_ms']:>9.1f} ms  {m['module']}")
+            print("\nResource loads:")
+            for name, r in report["resources"].items():
+                print(f"  {r.get('seconds', 0) * 1000:>9.1f} ms  {name} ({r['status']})")
+    else:
+        parser.print_help()
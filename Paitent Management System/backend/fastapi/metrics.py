@@ -0,0 +1,367 @@
+"""Minimal Prometheus-style metrics for the FastAPI service.
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format by ``render()`` (served at ``/metrics``). Kept dependency
+free so every image variant (see requirements-*.txt) can expose metrics.
+
+Pipeline stages are timed with ``stage("name")`` or the ``@timed("name")``
+decorator (sync and async functions); both feed ``stage_duration_seconds``.
+Values that are read rather than counted (cache sizes, pool usage) are set by
+collectors registered with ``add_collector()``, which run before every render.
+
+Multi-process mode: every gunicorn worker has its own values, so a scrape
+answered by one worker would see only its share. When ``METRICS_MULTIPROC_DIR``
+is set (gunicorn.conf.py sets it for more than one worker), each process
+writes a snapshot of its values to ``<dir>/<pid>.json`` every
+``METRICS_SYNC_SECONDS`` and on scrape, and ``render()`` merges the snapshots
+of all processes: counters and histograms are summed, including those of
+exited workers, so totals never go backwards; gauges are reported per live
+process with a ``pid`` label. Values recorded in the last sync interval
+before a worker is killed are lost.
+"""
+import asyncio
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry: list["_Metric"] = []
+_collectors: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[tuple, object] = {}
+        _registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[n] for n in self.labelnames)
+
+    def _samples(self, values: dict, labelnames: tuple[str, ...]):
+        raise NotImplementedError
+
+    def render(self, values: dict | None = None, labelnames: tuple[str, ...] | None = None) -> list[str]:
+        """Text lines for this metric; ``values``/``labelnames`` override its own (merged snapshots)."""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = self._samples(self._values if values is None else values, labelnames or self.labelnames)
+            lines += [f"{name}{labels} {_format_value(v)}" for name, labels, v in samples]
+        return lines
+
+    def _dump(self) -> list:
+        with self._lock:
+            return [[[str(v) for v in key], value] for key, value in self._values.items()]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self, values, labelnames):
+        for key, v in values.items():
+            yield self.name, _format_labels(labelnames, key), v
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def time(self, **labels):
+        """Set the gauge to the duration of the block (e.g. a model load)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.set(time.perf_counter() - start, **labels)
+
+    def _samples(self, values, labelnames):
+        for key, v in values.items():
+            yield self.name, _format_labels(labelnames, key), v
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+            state["sum"] += value
+            state["count"] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, values, labelnames):
+        for key, state in values.items():
+            for bound, count in zip(self.buckets, state["counts"]):
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket", _format_labels(labelnames, key, le), count
+            yield f"{self.name}_bucket", _format_labels(labelnames, key, 'le="+Inf"'), state["count"]
+            yield f"{self.name}_sum", _format_labels(labelnames, key), state["sum"]
+            yield f"{self.name}_count", _format_labels(labelnames, key), state["count"]
+
+
+def add_collector(fn) -> None:
+    """Run ``fn()`` before every render and snapshot, to set gauges from live state."""
+    _collectors.append(fn)
+
+
+def _collect() -> None:
+    for fn in _collectors:
+        try:
+            fn()
+        except Exception as e:
+            print("[METRICS] Collector failed:", e)
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text format."""
+    _collect()
+    if multiprocess_dir():
+        return _render_multiprocess()
+    lines: list[str] = []
+    for metric in _registry:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+# ---- Multi-process mode (see module docstring) ----
+_sync_pid = None
+
+
+def multiprocess_dir() -> str | None:
+    return os.getenv("METRICS_MULTIPROC_DIR") or None
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(multiprocess_dir(), f"{pid}.json")
+
+
+def _write_json(path: str, data: dict) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def write_snapshot() -> None:
+    """Write this process's values to the shared directory."""
+    _write_json(_snapshot_path(os.getpid()), {"live": True, "metrics": {m.name: m._dump() for m in _registry}})
+
+
+def start_multiprocess_sync() -> None:
+    """Start this process's snapshot thread (call once per worker, after the fork).
+
+    Counters and histograms inherited from the master are cleared first; the
+    master wrote them to its own snapshot (see ``mark_process_dead``).
+    """
+    global _sync_pid
+    if not multiprocess_dir() or _sync_pid == os.getpid():
+        return
+    _sync_pid = os.getpid()
+    for metric in _registry:
+        if not isinstance(metric, Gauge):
+            with metric._lock:
+                metric._values.clear()
+    interval = float(os.getenv("METRICS_SYNC_SECONDS", "5"))
+
+    def run():
+        while True:
+            try:
+                _collect()
+                write_snapshot()
+            except Exception as e:
+                print("[METRICS] Snapshot failed:", e)
+            time.sleep(interval)
+
+    threading.Thread(target=run, name="metrics-sync", daemon=True).start()
+
+
+def mark_process_dead(pid: int) -> None:
+    """Keep an exited process's counters and histograms in the totals, drop its gauges."""
+    path = _snapshot_path(pid)
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    kinds = {m.name: m.kind for m in _registry}
+    data["metrics"] = {name: values for name, values in data["metrics"].items() if kinds.get(name) != "gauge"}
+    data["live"] = False
+    _write_json(path, data)
+
+
+def clear_multiprocess_dir() -> None:
+    """Remove every snapshot (at server start, so reused pids do not pick up old values)."""
+    for path in glob.glob(os.path.join(multiprocess_dir(), "*.json")):
+        os.remove(path)
+
+
+def _render_multiprocess() -> str:
+    write_snapshot()
+    merged: dict[str, dict] = {m.name: {} for m in _registry}
+    for path in sorted(glob.glob(os.path.join(multiprocess_dir(), "*.json"))):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue  # being replaced; its next snapshot counts
+        pid = os.path.splitext(os.path.basename(path))[0]
+        for metric in _registry:
+            values = merged[metric.name]
+            for key, value in data["metrics"].get(metric.name, ()):
+                key = tuple(key)
+                if metric.kind == "gauge":
+                    values[key + (pid,)] = value
+                elif metric.kind == "counter":
+                    values[key] = values.get(key, 0.0) + value
+                else:
+                    state = values.setdefault(key, {"counts": [0] * len(metric.buckets), "sum": 0.0, "count": 0})
+                    state["counts"] = [a + b for a, b in zip(state["counts"], value["counts"])]
+                    state["sum"] += value["sum"]
+                    state["count"] += value["count"]
+    lines: list[str] = []
+    for metric in _registry:
+        labelnames = metric.labelnames + ("pid",) if metric.kind == "gauge" else metric.labelnames
+        lines += metric.render(merged[metric.name], labelnames)
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ---- Service-wide metrics ----
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by route, method and status.",
+                        ("route", "method", "status"))
+HTTP_LATENCY = Histogram("http_request_duration_seconds",
+                         "Time to response headers by route (streams: time to first byte).",
+                         ("route", "method"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being handled.")
+STAGE_LATENCY = Histogram("stage_duration_seconds",
+                          "Latency of pipeline stages (mysql_lookup, model_predict, embedding, ...).",
+                          ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Pipeline stages that raised.", ("stage",))
+MODEL_LOAD_SECONDS = Gauge("model_load_seconds", "Time taken by the last load of each lazy resource.",
+                           ("resource",))
+CACHE_HIT_RATIO = Gauge("cache_hit_ratio", "Hit ratio since start per cache.", ("cache",))
+CACHE_LOOKUPS = Gauge("cache_lookups", "Lookups since start per cache and result.", ("cache", "result"))
+CACHE_ENTRIES = Gauge("cache_entries", "Entries currently held per cache.", ("cache",))
+MODEL_REQUESTS = Counter("model_requests_total", "Requests routed to each model version.", ("kind", "version"))
+SINGLEFLIGHT_REQUESTS = Counter("singleflight_requests_total",
+                                "Coalescable requests by endpoint and role (leader ran it, follower shared it).",
+                                ("endpoint", "role"))
+WRITE_BEHIND_DEPTH = Gauge("write_behind_queue_depth", "Risk scores waiting to be written to MySQL.")
+WRITE_BEHIND_ROWS = Counter("write_behind_rows_total", "Queued risk score rows by outcome (written, retried, dropped).",
+                            ("result",))
+RISK_REFRESHES = Counter("risk_refreshes_total",
+                         "Stale risk scores recomputed in the background, by result "
+                         "(scheduled, refreshed, failed, cooldown).",
+                         ("result",))
+RISK_STALE_SERVED = Counter("risk_stale_served_total",
+                            "Saved risk scores served stale (compare write_behind_rows_total{result=\"dropped\"}).")
+DB_POOL_CONNECTIONS = Gauge("db_pool_connections", "MySQL pool connections by state (size, open, in_use, idle).",
+                            ("state",))
+DB_POOL_EVENTS = Counter("db_pool_events_total",
+                         "MySQL pool events (checkouts, waits, timeouts, connects, reconnects, discarded).",
+                         ("event",))
+DB_POOL_CHECKOUT = Histogram("db_pool_checkout_seconds", "Time to get a pooled MySQL connection, waits included.",
+                             buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0))
+MICROBATCH_SIZE = Histogram("microbatch_rows", "Rows per micro-batched predict call.",
+                            buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+MICROBATCH_WAIT = Histogram("microbatch_wait_seconds", "Time a row waited for its micro-batch to run.",
+                            buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05))
+MICROBATCH_FLUSHES = Counter("microbatch_flushes_total", "Micro-batches run, by flush reason (full, window, idle).",
+                             ("reason",))
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block as pipeline stage ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=name)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=name)
+
+
+def timed(name: str):
+    """Decorator form of :func:`stage` for sync and async functions."""
+    def decorate(fn):
+        if asyncio.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
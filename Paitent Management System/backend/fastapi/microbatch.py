@@ -0,0 +1,109 @@
+"""Dynamic micro-batching for single-row model calls.
+
+Request handlers call ``MicroBatcher.submit(version, row)`` and block on the
+result. A background thread collects rows that arrive close together and
+scores them with one vectorized ``predict_fn(version, X)`` call per
+``(version, row length)`` group, then resolves each caller's future with its
+own value (or exception).
+
+A batch is flushed when it reaches ``max_rows`` ("full"), when ``window_ms``
+has passed since its first row ("window"), or when no new row has arrived
+for ``idle_ms`` ("idle"). The idle path keeps a lone request from waiting out
+the whole window when there is no burst to batch with.
+"""
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+import metrics
+
+
+class MicroBatcher:
+    def __init__(self, predict_fn, window_ms: float = 3.0, max_rows: int = 64, idle_ms: float = 0.5,
+                 timeout: float = 30.0):
+        self.predict_fn = predict_fn
+        self.window = window_ms / 1000.0
+        self.max_rows = max(1, max_rows)
+        self.idle = min(idle_ms, window_ms) / 1000.0
+        self.timeout = timeout
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stats = {"rows": 0, "batches": 0, "full": 0, "window": 0, "idle": 0, "errors": 0}
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork; start one per process on first use
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._thread = threading.Thread(target=self._run, name="microbatch", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, version: str, row) -> float:
+        """Score one row; blocks until its batch has run."""
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((version, np.asarray(row, dtype=float).reshape(-1), future, time.perf_counter()))
+        return future.result(timeout=self.timeout)
+
+    def _collect(self) -> tuple[list, str]:
+        batch = [self._queue.get()]
+        deadline = batch[0][3] + self.window
+        while len(batch) < self.max_rows:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining <= 0:
+                    # Out of time, but still take rows that queued up during the last predict
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=min(remaining, self.idle)))
+            except queue.Empty:
+                return batch, "idle" if remaining > 0 else "window"
+        return batch, "full"
+
+    def _run(self) -> None:
+        while True:
+            batch, reason = self._collect()
+            started = time.perf_counter()
+            for *_, enqueued in batch:
+                metrics.MICROBATCH_WAIT.observe(started - enqueued)
+            metrics.MICROBATCH_SIZE.observe(len(batch))
+            metrics.MICROBATCH_FLUSHES.inc(reason=reason)
+            with self._lock:
+                self._stats["rows"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats[reason] += 1
+
+            groups: dict[tuple[str, int], list] = {}
+            for item in batch:
+                groups.setdefault((item[0], item[1].shape[0]), []).append(item)
+            for (version, _), items in groups.items():
+                try:
+                    y = self.predict_fn(version, np.stack([row for _, row, _, _ in items]))
+                except Exception as e:
+                    with self._lock:
+                        self._stats["errors"] += 1
+                    for _, _, future, _ in items:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future, _), value in zip(items, y):
+                    future.set_result(float(value))
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+        return {
+            "window_ms": self.window * 1000,
+            "idle_ms": self.idle * 1000,
+            "max_rows": self.max_rows,
+            "avg_batch_rows": round(s["rows"] / s["batches"], 2) if s["batches"] else 0.0,
+            **s,
+        }
@@ -0,0 +1,289 @@
+"""Versioned model registry with hot-swap, canary routing and a memory budget.
+
+Layout of ``MODEL_REGISTRY_DIR``::
+
+    registry.json
+    risk_v1/        model.npz (linear_model.py) and/or model.pkl
+    risk_v2/
+    therapy_v1/     forest/ (forest_model.py) and/or model.pkl
+    therapy_v2/
+
+A version belongs to the kind named by its prefix (``risk_*``, ``therapy_*``).
+``registry.json`` holds the routing table, one entry per kind::
+
+    {"risk": {"default": "risk_v1", "canary": "risk_v2", "canary_percent": 10}}
+
+Requests that name a version get exactly that version. Requests that do not
+are routed to ``default``, or to ``canary`` for ``canary_percent`` percent
+of routing keys (a stable hash of the patient id, so one patient sees one
+version). The routing table is replaced as a whole, never mutated, so a swap
+is atomic for readers. Every process re-reads ``registry.json`` when its
+mtime changes (checked at most every ``poll_seconds``), so a routing change
+written by one gunicorn worker reaches all of them without a restart.
+Newly routed versions are loaded before the swap, so the first requests
+after a rollout do not pay the load; a table naming a version that has no
+directory, or one that fails to load, is rejected and the current routing
+stays in place.
+
+Loaded versions are kept in LRU order and evicted once their combined
+on-disk size exceeds ``memory_budget_bytes``; versions in the current routing
+table are never evicted.
+"""
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+
+VERSION_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+class UnknownModelVersion(LookupError):
+    pass
+
+
+class ModelLoadError(RuntimeError):
+    """A routed version could not be loaded, so the routing was not changed."""
+
+
+def _dir_size(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for base, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(base, f)) for f in files)
+    return total
+
+
+def canary_bucket(routing_key) -> int:
+    """Stable 0-99 bucket for a routing key."""
+    digest = hashlib.sha256(str(routing_key).encode("utf-8")).digest()
+    return int.from_bytes(digest[:4], "big") % 100
+
+
+class ModelRegistry:
+    """See module docstring.
+
+    ``loaders`` maps kind -> ``fn(version, version_dir) -> model``. ``fallback``
+    maps kind -> default version used while there is no registry.json; such a
+    version may have no directory, in which case its loader gets ``None`` and
+    loads the service's legacy top-level model files.
+    """
+
+    def __init__(self, root: str, loaders: dict, memory_budget_bytes: int, poll_seconds: float = 5.0,
+                 fallback: dict | None = None):
+        self.root = root
+        self.loaders = loaders
+        self.memory_budget_bytes = memory_budget_bytes
+        self.poll_seconds = poll_seconds
+        # Used when there is no registry.json: kind -> default version
+        self.fallback = {
+            kind: {"default": v, "canary": None, "canary_percent": 0.0} for kind, v in (fallback or {}).items()
+        }
+        self._routing: dict = dict(self.fallback)
+        self._routing_mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._models: OrderedDict[str, tuple[object, int]] = OrderedDict()
+        self._load_locks: dict[str, threading.Lock] = {}
+        self._stats = {"loads": 0, "evictions": 0, "reloads": 0}
+        self._refresh(force=True)
+
+    # ---- routing ----
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, "registry.json")
+
+    def kind_of(self, version: str) -> str:
+        if not VERSION_RE.match(version or ""):
+            raise UnknownModelVersion(f"Invalid model version {version!r}")
+        for kind in self.loaders:
+            if version.startswith(kind + "_"):
+                return kind
+        raise UnknownModelVersion(f"Model version {version!r} does not belong to any known kind")
+
+    def _validate(self, routing: dict) -> dict:
+        clean = {}
+        for kind, entry in routing.items():
+            if kind not in self.loaders:
+                raise ValueError(f"Unknown model kind {kind!r}")
+            default = entry.get("default")
+            canary = entry.get("canary") or None
+            percent = float(entry.get("canary_percent", 0) or 0)
+            if not default or self.kind_of(default) != kind:
+                raise ValueError(f"{kind}: default must be a {kind}_* version")
+            if canary and self.kind_of(canary) != kind:
+                raise ValueError(f"{kind}: canary must be a {kind}_* version")
+            for version in (default, canary):
+                if version and not self.exists(version):
+                    raise UnknownModelVersion(f"Model version {version!r} is not in the registry")
+            if not 0 <= percent <= 100:
+                raise ValueError(f"{kind}: canary_percent must be between 0 and 100")
+            clean[kind] = {"default": default, "canary": canary, "canary_percent": percent if canary else 0.0}
+        return clean
+
+    def _refresh(self, force: bool = False) -> None:
+        if not force and time.monotonic() - self._checked_at < self.poll_seconds:
+            return
+        # One refresher at a time; other callers keep using the current table
+        if not self._refresh_lock.acquire(blocking=force):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            self._refresh_locked()
+        finally:
+            self._refresh_lock.release()
+
+    def _refresh_locked(self) -> None:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._routing_mtime:
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                routing = {**self.fallback, **self._validate(json.load(f))}
+        except Exception as e:
+            # Keep serving the last good table
+            print(f"[REGISTRY] Ignoring invalid {self.path}: {e}")
+            self._routing_mtime = mtime
+            return
+        try:
+            self._swap(routing)
+        except ModelLoadError as e:
+            # mtime is not recorded, so the next poll retries (e.g. model files still being copied)
+            print(f"[REGISTRY] Keeping the current routing: {e}")
+            return
+        self._routing_mtime = mtime
+
+    def _preload(self, routing: dict) -> None:
+        """Load every version ``routing`` names; raise ModelLoadError if any of them fails."""
+        for entry in routing.values():
+            for version in (entry["default"], entry.get("canary")):
+                if version:
+                    try:
+                        self.get_model(version)
+                    except Exception as e:
+                        raise ModelLoadError(f"Preloading {version} failed: {e}") from e
+
+    def _swap(self, routing: dict) -> None:
+        # Warm every routed version first so the switch itself is a single assignment
+        self._preload(routing)
+        with self._lock:
+            self._routing = routing
+            self._stats["reloads"] += 1
+        self._evict()
+        print(f"[REGISTRY] Routing: {json.dumps(routing)}")
+
+    def routing(self) -> dict:
+        self._refresh()
+        return self._routing
+
+    def default_version(self, kind: str) -> str:
+        return self.routing()[kind]["default"]
+
+    def resolve(self, kind: str, requested: str | None = None, routing_key=None) -> str:
+        """Version that should serve a request (raises UnknownModelVersion)."""
+        if requested:
+            if self.kind_of(requested) != kind:
+                raise UnknownModelVersion(f"{requested!r} is not a {kind} model")
+            if not self.exists(requested):
+                raise UnknownModelVersion(f"Model version {requested!r} is not in the registry")
+            return requested
+        entry = self.routing()[kind]
+        canary = entry.get("canary")
+        if canary and entry["canary_percent"] > 0:
+            bucket = canary_bucket(routing_key) if routing_key is not None else random.randrange(100)
+            if bucket < entry["canary_percent"]:
+                return canary
+        return entry["default"]
+
+    def set_routing(self, kind: str, default: str, canary: str | None = None, canary_percent: float = 0) -> dict:
+        """Validate, preload, swap and persist a new routing entry for ``kind``."""
+        entry = self._validate({kind: {"default": default, "canary": canary, "canary_percent": canary_percent}})[kind]
+        self._preload({kind: entry})  # fail before persisting if it cannot load
+        routing = {**self._routing, kind: entry}
+        os.makedirs(self.root, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(routing, f, indent=2)
+        os.replace(tmp, self.path)
+        self._routing_mtime = os.stat(self.path).st_mtime_ns
+        self._swap(routing)
+        return entry
+
+    def reload(self) -> dict:
+        self._refresh(force=True)
+        return self._routing
+
+    # ---- loading / eviction ----
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def exists(self, version: str) -> bool:
+        if version in self._models or os.path.isdir(self.version_dir(version)):
+            return True
+        return any(e["default"] == version for e in self.fallback.values())
+
+    def get_model(self, version: str):
+        with self._lock:
+            hit = self._models.get(version)
+            if hit is not None:
+                self._models.move_to_end(version)
+                return hit[0]
+            load_lock = self._load_locks.setdefault(version, threading.Lock())
+        kind = self.kind_of(version)
+        with load_lock:  # one load per version, concurrent callers wait for it
+            with self._lock:
+                hit = self._models.get(version)
+                if hit is not None:
+                    return hit[0]
+            if not self.exists(version):
+                raise UnknownModelVersion(f"Model version {version!r} is not in the registry")
+            path = self.version_dir(version)
+            start = time.perf_counter()
+            model = self.loaders[kind](version, path if os.path.isdir(path) else None)
+            size = _dir_size(path) if os.path.isdir(path) else 0
+            print(f"[REGISTRY] Loaded {version} in {time.perf_counter() - start:.3f}s ({size / 1e6:.1f} MB)")
+            with self._lock:
+                self._models[version] = (model, size)
+                self._stats["loads"] += 1
+        self._evict()
+        return model
+
+    def _evict(self) -> None:
+        with self._lock:
+            pinned = {v for e in self._routing.values() for v in (e["default"], e.get("canary")) if v}
+            total = sum(size for _, size in self._models.values())
+            for version in list(self._models):
+                if total <= self.memory_budget_bytes:
+                    break
+                if version in pinned:
+                    continue
+                _, size = self._models.pop(version)
+                total -= size
+                self._stats["evictions"] += 1
+                print(f"[REGISTRY] Evicted {version} ({size / 1e6:.1f} MB) to stay under the memory budget")
+
+    def stats(self) -> dict:
+        routing = self.routing()
+        with self._lock:
+            loaded = {v: {"bytes": size} for v, (_, size) in self._models.items()}
+            available = sorted(
+                d for d in (os.listdir(self.root) if os.path.isdir(self.root) else [])
+                if os.path.isdir(os.path.join(self.root, d)) and VERSION_RE.match(d)
+            )
+            return {
+                "root": self.root,
+                "routing": routing,
+                "available": available,
+                "loaded": loaded,
+                "loaded_bytes": sum(s["bytes"] for s in loaded.values()),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                **self._stats,
+            }
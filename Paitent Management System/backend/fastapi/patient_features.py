@@ -0,0 +1,213 @@
+"""Model inputs from the Laravel ``patients`` table, shared by training and serving.
+
+This is the one place that maps ``patients`` columns (``hba1c_1st_visit``,
+``fvg_1``, ``dds_1`` ...) to the inputs of the risk and therapy models. All
+transforms are column-wise NumPy operations, so scoring a batch of any size
+is a single array transform instead of a dict or list assembled per row:
+
+    table = patient_features.columns(rows)              # MySQL / JSON records -> {column: array}
+    X, complete = patient_features.risk_matrix(table)   # (n, 6) Ridge inputs + rows without gaps
+    inputs = patient_features.therapy_inputs(table)     # therapy pipeline columns
+    X = patient_features.therapy_visit_matrix(inputs, layout)
+
+``table`` may be any mapping of column name to array-like, including a
+pandas DataFrame, so a training script builds its frame with the same code
+(``pd.DataFrame(therapy_inputs(df))``) the endpoints use.
+
+Columns Laravel derives when a patient is saved (``avg_fvg_1_2``,
+``reduction_a``, ``fvg_delta_1_2``, ``dds_trend_1_3``) are read from the
+table and filled in from the raw visits, the way PatientController computes
+them, where they are missing.
+
+Exported artifacts record ``FEATURE_SCHEMA_VERSION`` (linear_model.py,
+forest_model.py); ``check_model`` rejects a model whose schema version or
+inputs this module cannot produce, when the model registry loads it.
+"""
+from collections.abc import Mapping
+
+import numpy as np
+
+FEATURE_SCHEMA_VERSION = 1
+
+
+class FeatureSchemaError(ValueError):
+    """The model's inputs do not match what this module produces."""
+
+
+RISK_COLUMNS = ("hba1c_1st_visit", "hba1c_2nd_visit", "fvg_1", "fvg_2", "avg_fvg_1_2", "reduction_a")
+
+# Therapy pipeline input column -> patients column (same mapping as TherapyEffectivenessForm.jsx)
+THERAPY_COLUMNS = {
+    'INSULIN REGIMEN': 'insulin_regimen_type',
+    'HbA1c1': 'hba1c_1st_visit',
+    'HbA1c2': 'hba1c_2nd_visit',
+    'HbA1c3': 'hba1c_3rd_visit',
+    'HbA1c_Delta_1_2': 'reduction_a',
+    'Gap from initial visit (days)': 'gap_from_initial_visit',
+    'Gap from first clinical visit (days)': 'gap_from_first_clinical_visit',
+    'eGFR': 'egfr',
+    'Reduction (%)': 'reduction_a',
+    'FVG1': 'fvg_1',
+    'FVG2': 'fvg_2',
+    'FVG3': 'fvg_3',
+    'FVG_Delta_1_2': 'fvg_delta_1_2',
+    'DDS1': 'dds_1',
+    'DDS3': 'dds_3',
+    'DDS_Trend_1_3': 'dds_trend_1_3',
+}
+THERAPY_CATEGORY = 'INSULIN REGIMEN'
+THERAPY_VISITS = ('HbA1c1', 'HbA1c2', 'HbA1c3')  # each visit is scored with HbA1c1 set to that value
+
+CATEGORICAL_COLUMNS = frozenset({'insulin_regimen_type'})
+
+
+def _floats(table, name: str) -> np.ndarray:
+    return np.asarray(table[name], dtype=float)
+
+
+# Columns Laravel stores on save, recomputed from the raw visits like PatientController
+DERIVED_COLUMNS = {
+    'avg_fvg_1_2': lambda t: (_floats(t, 'fvg_1') + _floats(t, 'fvg_2')) / 2,
+    'fvg_delta_1_2': lambda t: _floats(t, 'fvg_2') - _floats(t, 'fvg_1'),
+    'reduction_a': lambda t: _floats(t, 'hba1c_1st_visit') - _floats(t, 'hba1c_2nd_visit'),
+    'dds_trend_1_3': lambda t: _floats(t, 'dds_3') - _floats(t, 'dds_1'),
+}
+
+# Everything read from patients by default: model inputs, their raw sources, key factor inputs
+PATIENT_COLUMNS = tuple(dict.fromkeys((
+    *RISK_COLUMNS, *THERAPY_COLUMNS.values(),
+    'fvg_1', 'fvg_2', 'hba1c_1st_visit', 'hba1c_2nd_visit', 'dds_1', 'dds_3', 'reduction_a_per_day',
+)))
+
+
+def _number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def columns(records, names=PATIENT_COLUMNS) -> dict[str, np.ndarray]:
+    """Column arrays from row records: mappings, or sequences aligned with ``names``.
+
+    Numeric columns become float arrays with NaN for NULL / unparsable values
+    (MySQL decimals and the strings the Laravel API returns both work);
+    ``CATEGORICAL_COLUMNS`` stay object arrays.
+    """
+    records = list(records)
+    table = {}
+    for j, name in enumerate(names):
+        values = [r.get(name) if isinstance(r, Mapping) else r[j] for r in records]
+        if name in CATEGORICAL_COLUMNS:
+            table[name] = np.array(values, dtype=object)
+        else:
+            table[name] = np.array([_number(v) for v in values], dtype=float)
+    return table
+
+
+def column(table, name: str) -> np.ndarray:
+    """``table[name]`` as floats; gaps in derived columns are filled from the raw visits."""
+    derive = DERIVED_COLUMNS.get(name)
+    if name not in table:
+        if derive is None:
+            raise KeyError(name)
+        return derive(table)
+    values = _floats(table, name)
+    if derive is not None:
+        missing = np.isnan(values)
+        if missing.any():
+            try:
+                values = np.where(missing, derive(table), values)
+            except KeyError:  # raw visits not in the table either
+                pass
+    return values
+
+
+def risk_matrix(table) -> tuple[np.ndarray, np.ndarray]:
+    """``(X, complete)``: the Ridge inputs, shape ``(n, 6)``, and a mask of rows without NaN."""
+    X = np.column_stack([column(table, c) for c in RISK_COLUMNS]).reshape(-1, len(RISK_COLUMNS))
+    return X, ~np.isnan(X).any(axis=1)
+
+
+def therapy_inputs(table) -> dict[str, np.ndarray]:
+    """Therapy pipeline input columns (``THERAPY_COLUMNS`` keys) from a patients table."""
+    return {
+        col: np.asarray(table[src], dtype=object) if col == THERAPY_CATEGORY else column(table, src)
+        for col, src in THERAPY_COLUMNS.items()
+    }
+
+
+def therapy_visit_matrix(inputs, layout: dict) -> np.ndarray:
+    """Model rows for every visit of every patient, ``n * len(THERAPY_VISITS)`` rows.
+
+    ``layout`` is ``forest_model.onehot_layout``'s description of the
+    pipeline's ColumnTransformer: one-hot regimen columns in ``categories``
+    order, then ``numeric_columns``. Each visit's row has HbA1c1 replaced by
+    that visit's HbA1c.
+    """
+    index = {c: i for i, c in enumerate(layout["categories"])}
+    numeric = list(layout["numeric_columns"])
+    regimens = np.asarray(inputs[THERAPY_CATEGORY], dtype=object)
+    codes = np.array([index.get(r, -1) for r in regimens], dtype=int)
+    if (codes < 0).any():
+        raise ValueError(f"Unknown insulin regimen: {regimens[codes < 0][0]!r}")
+
+    n, n_onehot = len(regimens), len(index)
+    X = np.zeros((n, n_onehot + len(numeric)), dtype=float)
+    X[np.arange(n), codes] = 1.0
+    for j, col in enumerate(numeric):
+        X[:, n_onehot + j] = np.asarray(inputs[col], dtype=float)
+    X = np.repeat(X, len(THERAPY_VISITS), axis=0)
+    visits = np.column_stack([np.asarray(inputs[v], dtype=float) for v in THERAPY_VISITS])
+    X[:, n_onehot + numeric.index('HbA1c1')] = visits.reshape(-1)
+    return X
+
+
+def key_factors(table, limit: int = 6) -> list[list[str]]:
+    """Human-readable risk drivers per patient, from column-wise thresholds.
+
+    Only stored values are reported: unlike the model inputs, a missing
+    ``fvg_delta_1_2`` is not derived from the raw visits.
+    """
+    hba1c1 = column(table, 'hba1c_1st_visit')
+    factors: list[list[str]] = [[] for _ in range(len(hba1c1))]
+
+    def stored(name: str) -> np.ndarray:
+        return _floats(table, name) if name in table else np.full(len(hba1c1), np.nan)
+
+    fvg1, per_day, fvg_delta = stored('fvg_1'), stored('reduction_a_per_day'), stored('fvg_delta_1_2')
+    for i in np.flatnonzero(hba1c1 > 8):
+        factors[i].append(f"High initial HbA1c ({float(hba1c1[i])}%)")
+    for i in np.flatnonzero(hba1c1 < 5.7):
+        factors[i].append(f"Normal initial HbA1c ({float(hba1c1[i])}%)")
+    for i in np.flatnonzero(fvg1 > 130):
+        factors[i].append(f"Elevated FVG @ V1 ({int(fvg1[i])} mg/dL)")
+    for i in np.flatnonzero(per_day < 0.01):
+        factors[i].append(f"Low daily HbA1c drop ({per_day[i]:.3f})")
+    for i in np.flatnonzero(fvg_delta > 0):
+        factors[i].append(f"FVG increase between visits (+{float(fvg_delta[i])})")
+    return [f[:limit] for f in factors]
+
+
+def check_model(kind: str, model, manifest: dict | None = None) -> None:
+    """Raise FeatureSchemaError unless this module can produce ``model``'s inputs.
+
+    ``manifest`` is the exported artifact's manifest, if any; artifacts written
+    before the schema version was recorded are taken to be version 1.
+    """
+    version = (manifest or {}).get("feature_schema", 1)
+    if version != FEATURE_SCHEMA_VERSION:
+        raise FeatureSchemaError(
+            f"{kind} model was built for feature schema v{version}, this service has v{FEATURE_SCHEMA_VERSION}"
+        )
+    if kind == "risk":
+        n = getattr(model, "n_features_in_", None)
+        if n is not None and int(n) != len(RISK_COLUMNS):
+            raise FeatureSchemaError(
+                f"risk model expects {n} inputs, the feature schema provides {len(RISK_COLUMNS)}: "
+                + ", ".join(RISK_COLUMNS)
+            )
+    elif kind == "therapy":
+        unknown = [c for c in model.input_columns if c not in THERAPY_COLUMNS]
+        if unknown:
+            raise FeatureSchemaError("therapy model expects inputs the feature schema lacks: " + ", ".join(unknown))
@@ -0,0 +1,164 @@
+"""In-process cache of risk scores in front of the MySQL ``last_risk_score`` lookup."""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class PredictionCache:
+    """Tiered cache for risk scores keyed on ``(features, model_version, patient_id)``.
+
+    L1 is an in-memory LRU bounded by ``max_entries`` with a per-entry TTL.
+    L2 is the optional ``prediction_cache.sqlite`` table, which survives
+    restarts and is used to re-warm L1; an entry keeps its original expiry
+    when promoted. Patient-scoped keys include the patient id, so one
+    patient's entry (or an anonymous ``/predict`` entry) never answers a
+    lookup for another patient. Entries remember their patient so a newly
+    saved score can invalidate everything stale for that patient, in both
+    tiers.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 3600.0, sqlite_path: str | None = None):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._lru: OrderedDict[str, tuple[float, float]] = OrderedDict()  # key -> (value, expires_at)
+        self._by_patient: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "l2_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0, "invalidations": 0}
+        self._sqlite = None
+        if sqlite_path:
+            try:
+                self._sqlite = sqlite3.connect(sqlite_path, check_same_thread=False)
+                self._sqlite.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS prediction_cache (
+                        key TEXT PRIMARY KEY,
+                        value REAL NOT NULL,
+                        patient_id INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )
+                    """
+                )
+                columns = {row[1] for row in self._sqlite.execute("PRAGMA table_info(prediction_cache)")}
+                if "patient_id" not in columns:  # file written before entries were patient-scoped
+                    self._sqlite.execute("ALTER TABLE prediction_cache ADD COLUMN patient_id INTEGER")
+                self._sqlite.execute(
+                    "CREATE INDEX IF NOT EXISTS prediction_cache_patient_id ON prediction_cache (patient_id)"
+                )
+                self._sqlite.commit()
+            except sqlite3.Error as e:
+                print(f"Prediction cache sqlite disabled: {e}")
+                self._sqlite = None
+
+    @staticmethod
+    def make_key(features: list[float], model_version: str, patient_id: int | None = None) -> str:
+        parts = [[round(float(f), 6) for f in features], model_version]
+        if patient_id is not None:
+            parts.append(int(patient_id))
+        payload = json.dumps(parts, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> float | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._lru.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._lru[key]
+                self._stats["expired"] += 1
+
+            row = self._l2_get(key)
+            if row is not None:
+                value, patient_id, age = row
+                self._stats["l2_hits"] += 1
+                self._put(key, value, patient_id, now + max(0.0, self.ttl - age))
+                return value
+            self._stats["misses"] += 1
+            return None
+
+    def set(self, key: str, value: float, patient_id: int | None = None) -> None:
+        with self._lock:
+            self._stats["sets"] += 1
+            self._put(key, float(value), patient_id, time.monotonic() + self.ttl)
+            self._l2_set(key, float(value), patient_id)
+
+    def invalidate(self, key: str | None = None, patient_id: int | None = None) -> None:
+        """Drop one key and/or every entry recorded for ``patient_id``."""
+        with self._lock:
+            keys = set(self._by_patient.pop(int(patient_id), set())) if patient_id is not None else set()
+            if key is not None:
+                keys.add(key)
+            for k in keys:
+                if self._lru.pop(k, None) is not None:
+                    self._stats["invalidations"] += 1
+            self._l2_delete(list(keys), patient_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lru.clear()
+            self._by_patient.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            s = dict(self._stats)
+            lookups = s["hits"] + s["l2_hits"] + s["misses"]
+            s["size"] = len(self._lru)
+            s["max_entries"] = self.max_entries
+            s["ttl_seconds"] = self.ttl
+            s["l2_enabled"] = self._sqlite is not None
+            s["hit_ratio"] = round((s["hits"] + s["l2_hits"]) / lookups, 4) if lookups else 0.0
+            return s
+
+    # -- internals; callers hold self._lock --
+    def _put(self, key: str, value: float, patient_id: int | None, expires_at: float) -> None:
+        self._lru[key] = (value, expires_at)
+        self._lru.move_to_end(key)
+        if patient_id is not None:
+            self._by_patient.setdefault(int(patient_id), set()).add(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def _l2_get(self, key: str) -> tuple[float, int | None, float] | None:
+        """``(value, patient_id, age_seconds)`` of an unexpired L2 entry."""
+        if self._sqlite is None:
+            return None
+        try:
+            row = self._sqlite.execute(
+                "SELECT value, patient_id, strftime('%s', 'now') - strftime('%s', created_at) FROM prediction_cache "
+                "WHERE key = ? AND created_at >= datetime('now', ?)",
+                (key, f"-{int(self.ttl)} seconds"),
+            ).fetchone()
+            return (float(row[0]), row[1], float(row[2] or 0)) if row else None
+        except sqlite3.Error:
+            return None
+
+    def _l2_set(self, key: str, value: float, patient_id: int | None) -> None:
+        if self._sqlite is None:
+            return
+        try:
+            self._sqlite.execute(
+                "INSERT OR REPLACE INTO prediction_cache (key, value, patient_id, created_at) "
+                "VALUES (?, ?, ?, CURRENT_TIMESTAMP)",
+                (key, value, int(patient_id) if patient_id is not None else None),
+            )
+            self._sqlite.commit()
+        except sqlite3.Error:
+            pass
+
+    def _l2_delete(self, keys: list[str], patient_id: int | None = None) -> None:
+        if self._sqlite is None or (not keys and patient_id is None):
+            return
+        try:
+            self._sqlite.executemany("DELETE FROM prediction_cache WHERE key = ?", [(k,) for k in keys])
+            if patient_id is not None:  # also entries only L2 knows about (e.g. from before a restart)
+                self._sqlite.execute("DELETE FROM prediction_cache WHERE patient_id = ?", (int(patient_id),))
+            self._sqlite.commit()
+        except sqlite3.Error:
+            pass
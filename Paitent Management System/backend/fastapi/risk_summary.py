@@ -0,0 +1,122 @@
+"""Cohort risk aggregates for the dashboard (served at ``/risk-summary``).
+
+``RiskSummary`` holds the latest score of every patient for one risk model
+version together with the aggregates the dashboard needs: the risk label
+distribution and a per-doctor breakdown (``assigned_doctor_id``). The
+aggregates are maintained incrementally: ``update()`` moves a single patient
+between buckets in O(1) when one of its scores changes, so freshly computed
+scores show up without rescanning the cohort. The top-risk list is taken with
+one ``heapq.nlargest`` pass on request.
+
+Building the initial snapshot (one SELECT plus one vectorized predict for the
+patients without a usable saved score) lives in main.py, as does the periodic
+sync that applies scores saved by other gunicorn workers.
+"""
+import heapq
+import threading
+import time
+
+UNASSIGNED = "unassigned"
+
+
+class RiskSummary:
+    def __init__(self, model_version: str, label_fn, labels: list[str]):
+        self.model_version = model_version
+        self.label_fn = label_fn
+        self.labels = list(labels)
+        self.built_at = time.time()
+        # MySQL NOW() of the last build/sync and when it ran (main.sync_risk_summary)
+        self.db_watermark = None
+        self.synced_at = time.monotonic()
+        self.unscored = 0  # patients without complete risk features
+        self._lock = threading.Lock()
+        # patient_id -> (score, label, doctor key, name); the key is assigned_doctor_id or UNASSIGNED
+        self._patients: dict[int, tuple] = {}
+        self._counts = {label: 0 for label in self.labels}
+        self._doctors: dict = {}
+
+    def _doctor(self, key) -> dict:
+        bucket = self._doctors.get(key)
+        if bucket is None:
+            bucket = self._doctors[key] = {"total": 0, "sum": 0.0, "counts": {label: 0 for label in self.labels}}
+        return bucket
+
+    def _remove(self, patient_id: int) -> tuple | None:
+        old = self._patients.pop(patient_id, None)
+        if old is not None:
+            score, label, doctor, _ = old
+            self._counts[label] -= 1
+            bucket = self._doctors[doctor]
+            bucket["total"] -= 1
+            bucket["sum"] -= score
+            bucket["counts"][label] -= 1
+            if bucket["total"] == 0:
+                del self._doctors[doctor]
+        return old
+
+    def update(self, patient_id: int, score: float, doctor_id=None, name: str | None = None) -> None:
+        """Record a new score; doctor and name default to what is already known for the patient."""
+        score = float(score)
+        label = self.label_fn(score)
+        with self._lock:
+            old = self._remove(int(patient_id))
+            if old is not None:
+                doctor_key = old[2] if doctor_id is None else doctor_id
+                name = old[3] if name is None else name
+            else:
+                doctor_key = UNASSIGNED if doctor_id is None else doctor_id
+            self._patients[int(patient_id)] = (score, label, doctor_key, name)
+            self._counts[label] += 1
+            bucket = self._doctor(doctor_key)
+            bucket["total"] += 1
+            bucket["sum"] += score
+            bucket["counts"][label] += 1
+
+    def discard(self, patient_id: int) -> None:
+        with self._lock:
+            self._remove(int(patient_id))
+
+    def __contains__(self, patient_id) -> bool:
+        return patient_id in self._patients
+
+    def snapshot(self, top_n: int = 10, doctor_id=None, include_scores: bool = False) -> dict:
+        with self._lock:
+            items = self._patients.items()
+            if doctor_id is not None:
+                items = [(pid, p) for pid, p in items if p[2] == doctor_id]
+            top = heapq.nlargest(top_n, items, key=lambda kv: kv[1][0])
+            if doctor_id is not None:
+                bucket = self._doctors.get(doctor_id)
+                distribution = dict(bucket["counts"]) if bucket else {label: 0 for label in self.labels}
+            else:
+                distribution = dict(self._counts)
+            result = {
+                "model_version": self.model_version,
+                "generated_at": self.built_at,
+                "total": sum(distribution.values()),
+                "unscored": self.unscored,
+                "distribution": distribution,
+                "top_risk": [
+                    {"patient_id": pid, "name": name, "prediction": score, "risk_label": label,
+                     "assigned_doctor_id": None if doctor == UNASSIGNED else doctor}
+                    for pid, (score, label, doctor, name) in top
+                ],
+                "by_doctor": {
+                    doctor: {
+                        "total": b["total"],
+                        "mean_prediction": b["sum"] / b["total"],
+                        "distribution": dict(b["counts"]),
+                    }
+                    for doctor, b in sorted(self._doctors.items(), key=lambda kv: str(kv[0]))
+                    if doctor_id is None or doctor == doctor_id
+                },
+            }
+            if include_scores:
+                # Columnar, aligned by position (for the per-patient badges and filter)
+                rows = list(items)
+                result["scores"] = {
+                    "patient_id": [pid for pid, _ in rows],
+                    "prediction": [p[0] for _, p in rows],
+                    "risk_label": [p[1] for _, p in rows],
+                }
+            return result
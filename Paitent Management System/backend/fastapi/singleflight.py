@@ -0,0 +1,97 @@
+"""Request coalescing: identical concurrent calls share one computation.
+
+``SingleFlight.do(key, fn)`` runs ``fn`` for the first caller with ``key``
+(the leader); callers arriving while it is still running wait for and
+receive the same result or exception instead of repeating the work.
+``do_async(key, factory)`` is the asyncio equivalent: the shared coroutine
+runs in its own task, so one waiter being cancelled (e.g. its client
+disconnected) does not cancel it for the others. It is only cancelled once
+every waiter has gone.
+
+Keys are tuples whose first element names the endpoint, which is also the
+label of the ``singleflight_requests_total`` metric. Nothing is cached
+after the computation finishes; see PredictionCache and SemanticAnswerCache
+for that.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+
+import metrics
+
+
+def digest(*parts) -> str:
+    """Stable hash of JSON-serialisable request parts for use in a key."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[tuple, Future] = {}
+        self._tasks: dict[tuple, list] = {}  # key -> [task, waiters]
+        self._stats = {"leaders": 0, "followers": 0}
+
+    def _record(self, key: tuple, leader: bool) -> None:
+        role = "leader" if leader else "follower"
+        metrics.SINGLEFLIGHT_REQUESTS.inc(endpoint=str(key[0]), role=role)
+        with self._lock:
+            self._stats[role + "s"] += 1
+
+    def do(self, key: tuple, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        self._record(key, leader)
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def do_async(self, key: tuple, factory):
+        """``await factory()`` once for all concurrent callers with ``key``."""
+        with self._lock:
+            entry = self._tasks.get(key)
+            leader = entry is None
+            if leader:
+                task = asyncio.ensure_future(factory())
+                entry = self._tasks[key] = [task, 0]
+                task.add_done_callback(lambda t: self._task_done(key, t))
+            entry[1] += 1
+        self._record(key, leader)
+        task = entry[0]
+        try:
+            return await asyncio.shield(task)
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                abandoned = entry[1] == 0 and not task.done()
+            if abandoned:  # the last waiter was cancelled
+                task.cancel()
+
+    def _task_done(self, key: tuple, task) -> None:
+        with self._lock:
+            entry = self._tasks.get(key)
+            if entry is not None and entry[0] is task:
+                del self._tasks[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_flight": len(self._calls) + len(self._tasks),
+                **self._stats,
+            }
@@ -5,4 +5,4 @@ set -e
 # python -m pip install --upgrade pip
 # pip install -r requirements.txt
 
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py main:app
\ No newline at end of file
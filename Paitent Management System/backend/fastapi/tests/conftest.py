@@ -0,0 +1,366 @@
+"""Shared fixtures: small trained models, a model registry, a fake MySQL and the app client.
+
+The models are fitted on synthetic data with the production pipelines' shape
+(scaler + Ridge over the six risk columns; one-hot regimen + RandomForest over
+the therapy columns), so no pickles have to be checked in.
+"""
+import os
+
+import joblib
+import numpy as np
+import pytest
+from mysql.connector import Error
+
+import patient_features
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self._rows = []
+        self.rowcount = 0
+
+    def execute(self, query, params=()):
+        self.conn.queries.append((" ".join(query.split()), params))
+        if self.conn.fail_queries:
+            raise Error("lost connection")
+        self._rows = list(self.conn.respond(query, params) or [])
+        self.rowcount = len(self._rows)
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return list(self._rows)
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    """Just enough of a mysql.connector connection for db_pool and main.
+
+    ``respond(query, params)`` returns the rows a query yields; every executed
+    query is recorded (whitespace-normalised) in ``queries``.
+    """
+
+    def __init__(self, respond=None):
+        self.respond = respond or (lambda query, params: [])
+        self.queries = []
+        self.closed = False
+        self.fail_ping = False
+        self.fail_reconnect = False
+        self.fail_queries = False
+        self.reconnects = 0
+        self.commits = 0
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self)
+
+    def ping(self, reconnect=False):
+        if self.fail_ping:
+            raise Error("MySQL server has gone away")
+
+    def reconnect(self, attempts=1, delay=0):
+        if self.fail_reconnect:
+            raise Error("Can't connect to MySQL server")
+        self.reconnects += 1
+        self.fail_ping = False
+
+    def commit(self):
+        self.commits += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_connect():
+    """A ``connect`` callable for MySQLPool that records every connection it opens."""
+    opened = []
+
+    def connect():
+        conn = FakeConnection()
+        opened.append(conn)
+        return conn
+
+    connect.opened = opened
+    return connect
+
+
+@pytest.fixture
+def fake_mysql(monkeypatch):
+    """main's MySQL pool replaced by one handing out a single FakeConnection.
+
+    Set ``conn.respond`` to script query results; ``patients.risk_feature_hash``
+    is taken to exist.
+    """
+    import main
+    from db_pool import MySQLPool
+
+    conn = FakeConnection()
+    monkeypatch.setattr(main, "_mysql_pool", MySQLPool(size=1, timeout=1, connect=lambda: conn))
+    monkeypatch.setattr(main, "_feature_hash_column", True)
+    return conn
+
+
+def metric_value(metric, **labels) -> float:
+    """Current value of a Counter/Gauge sample (0 if never set)."""
+    return metric._values.get(metric._key(labels), 0.0)
+
+
+REGIMENS = ("Basal", "Basal-Bolus", "Premix")
+
+
+def risk_rows(n: int, seed: int = 0) -> np.ndarray:
+    """Plausible ``patient_features.RISK_COLUMNS`` rows."""
+    rng = np.random.default_rng(seed)
+    hba1c1, hba1c2 = rng.uniform(5, 12, n), rng.uniform(5, 11, n)
+    fvg1, fvg2 = rng.uniform(80, 250, n), rng.uniform(80, 220, n)
+    return np.column_stack([hba1c1, hba1c2, fvg1, fvg2, (fvg1 + fvg2) / 2, hba1c1 - hba1c2])
+
+
+def patient_record(pid: int, features, **extra) -> dict:
+    """A ``patients`` row (as the Laravel API returns it) with the given risk features."""
+    return {"id": pid, **dict(zip(patient_features.RISK_COLUMNS, map(float, features))), **extra}
+
+
+def therapy_frame(n: int, seed: int = 0):
+    """Therapy pipeline inputs (``therapy_model.THERAPY_INPUT_FIELDS`` columns) plus a label."""
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    h1, h2, h3 = rng.uniform(6, 12, n), rng.uniform(5.5, 11, n), rng.uniform(5, 10, n)
+    f1, f2, f3 = rng.uniform(90, 250, n), rng.uniform(90, 230, n), rng.uniform(80, 200, n)
+    d1, d3 = rng.uniform(20, 60, n), rng.uniform(20, 60, n)
+    frame = pd.DataFrame({
+        'INSULIN REGIMEN': rng.choice(REGIMENS, n),
+        'HbA1c1': h1, 'HbA1c2': h2, 'HbA1c3': h3,
+        'HbA1c_Delta_1_2': h1 - h2,
+        'Gap from initial visit (days)': rng.uniform(30, 400, n),
+        'Gap from first clinical visit (days)': rng.uniform(30, 400, n),
+        'eGFR': rng.uniform(30, 120, n),
+        'Reduction (%)': (h1 - h3) / h1 * 100,
+        'FVG1': f1, 'FVG2': f2, 'FVG3': f3,
+        'FVG_Delta_1_2': f2 - f1,
+        'DDS1': d1, 'DDS3': d3,
+        'DDS_Trend_1_3': d3 - d1,
+    })
+    label = ((h1 - h3) + rng.normal(0, 0.8, n) > 1.0).astype(int)
+    return frame, label
+
+
+@pytest.fixture(scope="session")
+def ridge_pipeline():
+    import pandas as pd
+    from sklearn.linear_model import Ridge
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X = risk_rows(300)
+    y = 0.6 * X[:, 0] + 0.3 * X[:, 1] + 0.004 * X[:, 2] - 0.5
+    frame = pd.DataFrame(X, columns=patient_features.RISK_COLUMNS)
+    return Pipeline([("scaler", StandardScaler()), ("ridge", Ridge(alpha=1.0))]).fit(frame, y)
+
+
+@pytest.fixture(scope="session")
+def therapy_pipeline():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    frame, label = therapy_frame(400)
+    preprocessor = ColumnTransformer(
+        [("onehot", OneHotEncoder(handle_unknown="ignore"), ["INSULIN REGIMEN"])], remainder="passthrough"
+    )
+    classifier = RandomForestClassifier(n_estimators=25, max_depth=8, random_state=0)
+    return Pipeline([("preprocessor", preprocessor), ("classifier", classifier)]).fit(frame, label)
+
+
+@pytest.fixture(scope="session")
+def model_dir(tmp_path_factory, ridge_pipeline, therapy_pipeline):
+    """A MODEL_REGISTRY_DIR: risk_v1 (pickle), risk_v2 (pickle + NumPy artifact),
+    therapy_v1 (pickle) and therapy_v2 (pickle + compiled forest); no registry.json."""
+    from forest_model import compile_pipeline
+    from linear_model import export
+
+    root = tmp_path_factory.mktemp("model_registry")
+    for version, pipeline in (("risk_v1", ridge_pipeline), ("risk_v2", ridge_pipeline),
+                              ("therapy_v1", therapy_pipeline), ("therapy_v2", therapy_pipeline)):
+        os.makedirs(root / version)
+        joblib.dump(pipeline, root / version / "model.pkl")
+    export(ridge_pipeline, str(root / "risk_v2" / "model.npz"))
+    compile_pipeline(therapy_pipeline, str(root / "therapy_v2" / "forest"))
+    return root
+
+
+@pytest.fixture
+def api(monkeypatch, model_dir, fake_mysql):
+    """A TestClient over main.app with fresh caches, the test registry and synchronous score writes.
+
+    Startup hooks (warm-up, metrics sync) are not run.
+    """
+    from fastapi.testclient import TestClient
+
+    import main
+    from prediction_cache import PredictionCache
+
+    monkeypatch.setenv("MODEL_REGISTRY_DIR", str(model_dir))
+    for name, value in {
+        "_model_registry": None,
+        "_prediction_cache": PredictionCache(),
+        "_score_writer": None,
+        "_single_flight": None,
+        "_risk_batcher": None,
+        "_risk_summaries": {},
+        "_risk_refreshing": set(),
+        "_risk_refreshed_at": {},
+        "_risk_refresh_stats": dict.fromkeys(main._risk_refresh_stats, 0),
+        "_unknown_versions_seen": set(),
+        "WRITE_BEHIND_ENABLED": False,
+        "MICROBATCH_ENABLED": False,
+    }.items():
+        monkeypatch.setattr(main, name, value)
+    return TestClient(main.app)
+
+
+def therapy_payloads(n: int, seed: int = 1) -> list[dict]:
+    """``main.PatientData`` request bodies."""
+    from therapy_model import THERAPY_INPUT_FIELDS
+
+    frame, _ = therapy_frame(n, seed)
+    return [
+        {attr: (row[col] if col == patient_features.THERAPY_CATEGORY else float(row[col]))
+         for col, attr in THERAPY_INPUT_FIELDS.items()}
+        for _, row in frame.iterrows()
+    ]
+
+
+class FakeGroq:
+    """``groq.Groq`` stand-in: ``chat.completions.create`` returns ``reply`` and records the call."""
+
+    def __init__(self, reply: str):
+        from types import SimpleNamespace
+
+        self.calls = []
+        self.chat = SimpleNamespace(completions=self)
+        self._response = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return self._response
+
+
+def text_vector(text: str, dim: int = 32) -> list[float]:
+    """Deterministic bag-of-words embedding: equal texts give equal vectors, shared words raise similarity."""
+    import hashlib
+
+    v = np.zeros(dim)
+    for word in text.lower().split():
+        v[int(hashlib.md5(word.encode()).hexdigest(), 16) % dim] += 1.0
+    return (v / (np.linalg.norm(v) or 1.0)).tolist()
+
+
+class FakeAsyncOpenAI:
+    """``openai.AsyncOpenAI`` stand-in for ``embeddings.create``."""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.inputs = []
+        self.embeddings = self
+
+    async def create(self, model, input):
+        import asyncio
+        from types import SimpleNamespace
+
+        self.inputs += list(input)
+        await asyncio.sleep(self.delay)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=text_vector(t)) for t in input])
+
+
+class FakeRetriever:
+    """A blocking vector store returning fixed chunks; records the vectors it was queried with."""
+
+    blocking = True
+
+    def __init__(self, chunks=("chunk one", "chunk two")):
+        self.chunks = list(chunks)
+        self.queries = []
+        self.threads = []
+
+    def query(self, vector, top_k=3, include_metadata=True):
+        import threading
+
+        self.queries.append(list(vector))
+        self.threads.append(threading.current_thread().name)
+        return {"matches": [{"id": str(i), "score": 1.0, "metadata": {"text": c}}
+                            for i, c in enumerate(self.chunks[:top_k])]}
+
+
+class FakeAsyncGroq:
+    """``groq.AsyncGroq`` stand-in: answers ``reply``, streamed as ``chunks`` when ``stream=True``.
+
+    ``fail`` is raised after the chunks have been sent (or instead of the reply).
+    """
+
+    def __init__(self, reply: str = "answer", chunks=None, delay: float = 0.0, fail: Exception | None = None):
+        from types import SimpleNamespace
+
+        self.reply = reply
+        self.chunks = list(chunks) if chunks is not None else [reply]
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.cancelled = 0
+        self.chat = SimpleNamespace(completions=self)
+
+    async def create(self, model, messages, stream=False, **kwargs):
+        import asyncio
+        from types import SimpleNamespace
+
+        self.calls.append({"messages": messages, "stream": stream, **kwargs})
+        if stream:
+            return self._stream()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        if self.fail is not None:
+            raise self.fail
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+    async def _stream(self):
+        import asyncio
+        from types import SimpleNamespace
+
+        for text in self.chunks:
+            await asyncio.sleep(self.delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+        if self.fail is not None:
+            raise self.fail
+
+
+@pytest.fixture
+def rag(monkeypatch):
+    """main's RAG clients replaced by FakeAsyncOpenAI / FakeRetriever / FakeAsyncGroq, with empty caches."""
+    from types import SimpleNamespace
+
+    import main
+    from answer_cache import SemanticAnswerCache
+    from embedding_cache import EmbeddingCache
+
+    fakes = SimpleNamespace(openai=FakeAsyncOpenAI(), retriever=FakeRetriever(), groq=FakeAsyncGroq())
+    for name, value in {
+        "_async_openai_client": fakes.openai,
+        "_async_groq_client": fakes.groq,
+        "_retriever": fakes.retriever,
+        "_embedding_cache": EmbeddingCache(),
+        "_answer_cache": SemanticAnswerCache(),
+        "_rag_semaphore": None,
+        "_single_flight": None,
+    }.items():
+        monkeypatch.setattr(main, name, value)
+    monkeypatch.delenv("SEMANTIC_CACHE_DISABLED", raising=False)
+    return fakes
@@ -0,0 +1,110 @@
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+import answer_cache
+import main
+from answer_cache import SemanticAnswerCache
+from conftest import FakeAsyncGroq
+
+
+class Clock:
+    now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def unit(*values) -> np.ndarray:
+    v = np.asarray(values, dtype=float)
+    return v / np.linalg.norm(v)
+
+
+def test_similar_question_hits_above_threshold():
+    cache = SemanticAnswerCache(threshold=0.95)
+    cache.store("ns", unit(1, 0, 0), {"response": "r"})
+
+    hit = cache.lookup("ns", unit(1, 0.2, 0))  # cosine ~0.98
+    assert hit["response"] == "r" and hit["similarity"] == pytest.approx(0.9806, abs=1e-4)
+    assert cache.lookup("ns", unit(1, 0.5, 0)) is None  # cosine ~0.89
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_best_match_wins():
+    cache = SemanticAnswerCache(threshold=0.5)
+    cache.store("ns", unit(1, 1, 0), {"response": "near"})
+    cache.store("ns", unit(0, 1, 0), {"response": "far"})
+    assert cache.lookup("ns", unit(1, 0.9, 0))["response"] == "near"
+
+
+def test_namespaces_are_isolated():
+    a = SemanticAnswerCache.namespace("chatbot", "chatbot-v1", "llama", {"name": "A"})
+    b = SemanticAnswerCache.namespace("chatbot", "chatbot-v1", "llama", {"name": "B"})
+    assert a != b
+    assert a == SemanticAnswerCache.namespace("chatbot", "chatbot-v1", "llama", {"name": "A"})
+    cache = SemanticAnswerCache()
+    cache.store(a, unit(1, 0), {"response": "for A"})
+    assert cache.lookup(b, unit(1, 0)) is None
+
+
+def test_entries_expire(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(answer_cache, "time", clock)
+    cache = SemanticAnswerCache(ttl=60)
+    cache.store("ns", unit(1, 0), {"response": "r"})
+    clock.now += 61
+    assert cache.lookup("ns", unit(1, 0)) is None
+    assert (cache.stats()["expired"], cache.stats()["size"]) == (1, 0)
+
+
+def test_least_recently_used_answer_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.store("ns", unit(1, 0, 0), {"response": "a"})
+    cache.store("ns", unit(0, 1, 0), {"response": "b"})
+    cache.lookup("ns", unit(1, 0, 0))
+    cache.store("ns", unit(0, 0, 1), {"response": "c"})
+    assert cache.lookup("ns", unit(0, 1, 0)) is None
+    assert cache.lookup("ns", unit(1, 0, 0))["response"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+CHAT = {"patient": {"name": "A", "hba1c_1st_visit": 8.1}, "query": "How is my sugar control?"}
+
+
+def test_repeated_chatbot_question_skips_retrieval_and_llm(rag):
+    client = TestClient(main.app)
+
+    first = client.post("/chatbot-patient-query", json=CHAT).json()
+    second = client.post("/chatbot-patient-query", json=CHAT).json()
+
+    assert first == second == {"response": "answer"}
+    assert len(rag.groq.calls) == 1 and len(rag.retriever.queries) == 1
+    # The question is embedded once, for both the cache lookup and retrieval
+    assert rag.openai.inputs == [CHAT["query"]]
+
+
+def test_another_patient_does_not_get_the_cached_answer(rag):
+    client = TestClient(main.app)
+    client.post("/chatbot-patient-query", json=CHAT)
+    client.post("/chatbot-patient-query", json={**CHAT, "patient": {"name": "B"}})
+    assert len(rag.groq.calls) == 2
+
+
+def test_cache_can_be_bypassed(rag, monkeypatch):
+    client = TestClient(main.app)
+    client.post("/chatbot-patient-query", json=CHAT)
+    client.post("/chatbot-patient-query?cache=false", json=CHAT)
+    assert len(rag.groq.calls) == 2
+
+    monkeypatch.setenv("SEMANTIC_CACHE_DISABLED", "chatbot")
+    client.post("/chatbot-patient-query", json=CHAT)
+    assert len(rag.groq.calls) == 3
+
+
+def test_failed_answers_are_not_cached(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client", FakeAsyncGroq(fail=RuntimeError("down")))
+    client = TestClient(main.app)
+    assert client.post("/chatbot-patient-query", json=CHAT).json()["response"].startswith("❌")
+
+    monkeypatch.setattr(main, "_async_groq_client", rag.groq)
+    assert client.post("/chatbot-patient-query", json=CHAT).json() == {"response": "answer"}
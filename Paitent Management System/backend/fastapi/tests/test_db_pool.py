@@ -0,0 +1,154 @@
+import threading
+
+import pytest
+from mysql.connector import Error
+
+import metrics
+from conftest import metric_value
+from db_pool import MySQLPool
+
+
+def test_connection_is_reused(fake_connect):
+    pool = MySQLPool(size=2, connect=fake_connect)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(fake_connect.opened) == 1
+    stats = pool.stats()
+    assert (stats["checkouts"], stats["connects"], stats["open"], stats["idle"], stats["in_use"]) == (2, 1, 1, 1, 0)
+
+
+def test_pool_opens_up_to_size_and_times_out_beyond(fake_connect):
+    pool = MySQLPool(size=2, timeout=0.05, connect=fake_connect)
+    with pool.connection() as a, pool.connection() as b:
+        assert a is not b
+        assert pool.stats()["in_use"] == 2
+        with pool.connection() as c:
+            assert c is None
+    stats = pool.stats()
+    assert (stats["open"], stats["waits"], stats["timeouts"]) == (2, 1, 1)
+    # The timed-out caller gave nothing back, so both slots are free again
+    with pool.connection() as a, pool.connection() as b:
+        assert a is not None and b is not None
+
+
+def test_waiter_gets_the_returned_connection(fake_connect):
+    pool = MySQLPool(size=1, timeout=5, connect=fake_connect)
+    got = []
+    with pool.connection() as held:
+        waiter = threading.Thread(target=lambda: got.append(pool.connection().__enter__()))
+        waiter.start()
+        waiter.join(0.05)
+        assert waiter.is_alive()  # blocked until the connection comes back
+    waiter.join(5)
+    assert got == [held]
+    assert pool.stats()["waits"] == 1
+
+
+def test_mysql_error_discards_connection(fake_connect):
+    pool = MySQLPool(size=1, connect=fake_connect)
+    with pytest.raises(Error):
+        with pool.connection() as conn:
+            raise Error("Lost connection to MySQL server during query")
+    assert conn.closed
+    with pool.connection() as fresh:
+        assert fresh is not conn
+    stats = pool.stats()
+    assert (stats["discarded"], stats["connects"], stats["open"]) == (1, 2, 1)
+
+
+def test_other_errors_keep_connection(fake_connect):
+    pool = MySQLPool(size=1, connect=fake_connect)
+    with pytest.raises(KeyError):
+        with pool.connection() as conn:
+            raise KeyError("not a database problem")
+    with pool.connection() as again:
+        assert again is conn
+
+
+def test_old_connections_are_recycled(fake_connect):
+    pool = MySQLPool(size=1, recycle=-1, connect=fake_connect)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first.closed and second is not first
+    assert pool.stats()["discarded"] == 1
+
+
+def test_idle_connection_is_pinged_and_reconnected(fake_connect):
+    pool = MySQLPool(size=1, ping_after=-1, connect=fake_connect)
+    with pool.connection() as conn:
+        pass
+    conn.fail_ping = True
+    with pool.connection() as again:
+        assert again is conn
+    assert conn.reconnects == 1
+    assert pool.stats()["reconnects"] == 1
+
+
+def test_unreachable_idle_connection_is_replaced(fake_connect):
+    pool = MySQLPool(size=1, ping_after=-1, connect=fake_connect)
+    with pool.connection() as conn:
+        pass
+    conn.fail_ping = conn.fail_reconnect = True
+    with pool.connection() as fresh:
+        assert fresh is not conn
+    assert conn.closed
+    assert pool.stats()["discarded"] == 1
+
+
+def test_unavailable_mysql_yields_none_and_frees_the_slot():
+    pool = MySQLPool(size=1, timeout=0.05, connect=lambda: None)
+    for _ in range(3):
+        with pool.connection() as conn:
+            assert conn is None
+    stats = pool.stats()
+    assert (stats["open"], stats["in_use"], stats["timeouts"]) == (0, 0, 0)
+
+
+def test_close_all_closes_idle_connections(fake_connect):
+    pool = MySQLPool(size=2, connect=fake_connect)
+    with pool.connection(), pool.connection():
+        pass
+    pool.close_all()
+    assert all(c.closed for c in fake_connect.opened)
+    assert (pool.stats()["open"], pool.stats()["idle"]) == (0, 0)
+
+
+def test_pool_events_are_exported(fake_connect):
+    before = {e: metric_value(metrics.DB_POOL_EVENTS, event=e) for e in ("checkouts", "connects", "timeouts")}
+    checkouts_before = metrics.DB_POOL_CHECKOUT._values.get((), {"count": 0})["count"]
+    pool = MySQLPool(size=1, timeout=0.01, connect=fake_connect)
+    with pool.connection():
+        with pool.connection():
+            pass
+    with pool.connection():
+        pass
+    assert metric_value(metrics.DB_POOL_EVENTS, event="checkouts") - before["checkouts"] == 2
+    assert metric_value(metrics.DB_POOL_EVENTS, event="connects") - before["connects"] == 1
+    assert metric_value(metrics.DB_POOL_EVENTS, event="timeouts") - before["timeouts"] == 1
+    assert metrics.DB_POOL_CHECKOUT._values[()]["count"] - checkouts_before == 2
+
+
+def test_latest_get_uses_the_pool(fake_mysql):
+    import main
+
+    fake_mysql.respond = lambda query, params: [(7.25, "risk_v1", 60, "abc")] if params == (3,) else []
+    assert main.latest_get(3) == main.StoredScore(7.25, 60.0, "abc")
+    assert main.latest_get(4) is None
+    assert main.latest_get(3, model_version="risk_v2") is None
+    assert main.get_mysql_pool().stats()["connects"] == 1
+
+
+def test_pool_gauges_are_collected(fake_mysql):
+    import main
+
+    with main.get_mysql_pool().connection():
+        main._collect_pool_metrics()
+        assert metric_value(metrics.DB_POOL_CONNECTIONS, state="in_use") == 1
+    main._collect_pool_metrics()
+    assert metric_value(metrics.DB_POOL_CONNECTIONS, state="idle") == 1
+    assert metric_value(metrics.DB_POOL_CONNECTIONS, state="size") == 1
@@ -0,0 +1,73 @@
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from conftest import text_vector
+from embedding_cache import EmbeddingCache
+
+
+def test_key_normalizes_whitespace_and_unicode():
+    key = EmbeddingCache.make_key("What lowers  HbA1c?\n", "text-embedding-3-small")
+    assert key == EmbeddingCache.make_key(" What lowers HbA1c? ", "text-embedding-3-small")
+    assert key == EmbeddingCache.make_key("What lowers HbA1c？", "text-embedding-3-small")  # full-width "?"
+    assert key != EmbeddingCache.make_key("What lowers HbA1c?", "text-embedding-3-large")
+    assert key != EmbeddingCache.make_key("what lowers hba1c?", "text-embedding-3-small")
+
+
+def test_least_recently_used_vector_is_evicted():
+    cache = EmbeddingCache(max_entries=2)
+    cache.set("a", [1.0], "m")
+    cache.set("b", [2.0], "m")
+    cache.get("a")
+    cache.set("c", [3.0], "m")
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == ([1.0], None, [3.0])
+    assert cache.stats()["evictions"] == 1
+
+
+def test_vectors_survive_a_restart_as_float32(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite")
+    vector = np.random.default_rng(0).standard_normal(1536).tolist()
+    EmbeddingCache(sqlite_path=path).set("q", vector, "text-embedding-3-small")
+
+    restarted = EmbeddingCache(sqlite_path=path)
+    got = restarted.get("q")
+
+    np.testing.assert_array_equal(got, np.asarray(vector, dtype=np.float32))
+    restarted.get("q")
+    stats = restarted.stats()
+    assert (stats["disk_hits"], stats["hits"], stats["misses"]) == (1, 1, 0)
+
+
+def test_repeated_retrieval_embeds_once(rag):
+    first = asyncio.run(main.retrieve_context_async("What lowers HbA1c?"))
+    second = asyncio.run(main.retrieve_context_async("What  lowers HbA1c?"))
+
+    assert first == second == ["chunk one", "chunk two"]
+    assert rag.openai.inputs == ["What lowers HbA1c?"]
+    assert rag.retriever.queries == [text_vector("What lowers HbA1c?")] * 2
+
+
+def test_sync_and_async_paths_share_the_cache(rag, monkeypatch):
+    calls = []
+
+    def create(model, input):
+        calls.append(input)
+        return SimpleNamespace(data=[SimpleNamespace(embedding=text_vector(input[0]))])
+
+    monkeypatch.setattr(main, "get_openai_client", lambda: SimpleNamespace(embeddings=SimpleNamespace(create=create)))
+
+    assert main.get_openai_embedding("dose change") == text_vector("dose change")
+    assert asyncio.run(main.get_openai_embedding_async("dose change")) == text_vector("dose change")
+    assert calls == [["dose change"]] and rag.openai.inputs == []
+
+
+def test_cache_stats_route(rag):
+    asyncio.run(main.get_openai_embedding_async("dose change"))
+    asyncio.run(main.get_openai_embedding_async("dose change"))
+
+    stats = TestClient(main.app).get("/health/embedding-cache").json()
+
+    assert (stats["hits"], stats["misses"], stats["size"]) == (1, 1, 1)
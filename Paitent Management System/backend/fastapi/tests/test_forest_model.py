@@ -0,0 +1,125 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+
+import forest_model
+import main
+from conftest import therapy_frame, therapy_payloads
+from forest_model import CompiledForest, compile_pipeline, onehot_layout
+from therapy_model import TherapyModel
+
+
+@pytest.fixture(scope="module")
+def forest(tmp_path_factory, therapy_pipeline):
+    path = str(tmp_path_factory.mktemp("forest") / "forest")
+    compile_pipeline(therapy_pipeline, path)
+    return CompiledForest(path)
+
+
+def model_matrix(pipeline, n: int, seed: int) -> np.ndarray:
+    frame, _ = therapy_frame(n, seed)
+    return pipeline.named_steps["preprocessor"].transform(frame)
+
+
+def test_probabilities_match_sklearn(forest, therapy_pipeline):
+    X = model_matrix(therapy_pipeline, 3 * forest_model.EVAL_BATCH_ROWS + 7, seed=5)  # several blocks
+
+    expected = therapy_pipeline.named_steps["classifier"].predict_proba(X)
+
+    np.testing.assert_allclose(forest.predict_proba(X), expected, atol=forest_model.TOLERANCE)
+    np.testing.assert_allclose(forest.predict_proba(X[:1]), expected[:1], atol=forest_model.TOLERANCE)
+    assert forest.classes_.tolist() == therapy_pipeline.named_steps["classifier"].classes_.tolist()
+
+
+def test_missing_values_follow_sklearn(tmp_path):
+    from sklearn.compose import ColumnTransformer
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.pipeline import Pipeline
+    from sklearn.preprocessing import OneHotEncoder
+
+    frame, label = therapy_frame(300, seed=2)
+    frame.loc[frame.index[::4], "HbA1c2"] = np.nan
+    pipeline = Pipeline([
+        ("preprocessor", ColumnTransformer([("onehot", OneHotEncoder(), ["INSULIN REGIMEN"])], remainder="passthrough")),
+        ("classifier", RandomForestClassifier(n_estimators=10, max_depth=6, random_state=0)),
+    ]).fit(frame, label)
+    compile_pipeline(pipeline, str(tmp_path / "forest"))
+
+    X = pipeline.named_steps["preprocessor"].transform(frame)
+    forest = CompiledForest(str(tmp_path / "forest"))
+    assert forest.missing_left.any()
+    np.testing.assert_allclose(forest.predict_proba(X), pipeline.named_steps["classifier"].predict_proba(X),
+                               atol=forest_model.TOLERANCE)
+
+
+def test_arrays_are_memory_mapped(forest):
+    assert not forest.threshold.flags.writeable  # read-only mapping of threshold.npy
+    assert CompiledForest(forest.path, mmap=False).threshold.flags.writeable
+
+
+def test_onehot_step_is_folded_into_the_layout(forest, therapy_pipeline):
+    layout = onehot_layout(therapy_pipeline.named_steps["preprocessor"])
+    assert forest.layout == layout
+    assert layout["column"] == "INSULIN REGIMEN"
+    assert layout["categories"] == ["Basal", "Basal-Bolus", "Premix"]
+    assert "INSULIN REGIMEN" not in layout["numeric_columns"]
+
+
+def test_other_preprocessors_are_refused():
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import StandardScaler
+
+    frame, _ = therapy_frame(20)
+    scaler = ColumnTransformer([("scale", StandardScaler(), ["HbA1c1"])], remainder="drop").fit(frame)
+    with pytest.raises(ValueError, match="single OneHotEncoder"):
+        onehot_layout(scaler)
+
+
+def test_verify_rejects_drift(tmp_path, therapy_pipeline):
+    from sklearn.ensemble import RandomForestClassifier
+
+    path = str(tmp_path / "forest")
+    compile_pipeline(therapy_pipeline, path)
+    frame, label = therapy_frame(400, seed=8)
+    X = therapy_pipeline.named_steps["preprocessor"].transform(frame)
+    retrained = RandomForestClassifier(n_estimators=5, random_state=1).fit(X, label)
+    with pytest.raises(ValueError, match="recompile"):
+        CompiledForest(path).verify(retrained)
+
+    value = np.load(os.path.join(path, "value.npy"))
+    np.save(os.path.join(path, "value.npy"), value[:, ::-1])
+    with pytest.raises(ValueError, match="disagrees with sklearn"):
+        CompiledForest(path).verify()
+
+
+def test_recompiling_replaces_the_directory(tmp_path, therapy_pipeline):
+    path = str(tmp_path / "forest")
+    compile_pipeline(therapy_pipeline, path)
+    manifest = compile_pipeline(therapy_pipeline, path)
+
+    assert os.listdir(tmp_path) == ["forest"]
+    assert manifest["n_trees"] == 25 and manifest["max_depth"] <= 8
+
+
+def test_cli_compile_and_verify(tmp_path, therapy_pipeline, capsys):
+    joblib.dump(therapy_pipeline, tmp_path / "therapy.pkl")
+    out = str(tmp_path / "therapy_forest")
+
+    forest_model.main(["compile", str(tmp_path / "therapy.pkl"), "--out", out])
+    forest_model.main(["verify", out, "--pickle", str(tmp_path / "therapy.pkl")])
+
+    text = capsys.readouterr().out
+    assert "25 trees" in text and "OK, max drift" in text
+
+
+def test_large_batches_go_back_to_sklearn(forest, therapy_pipeline, monkeypatch):
+    patients = [main.PatientData(**p) for p in therapy_payloads(10)]
+    model = TherapyModel(therapy_pipeline, forest=forest)
+    expected = TherapyModel(therapy_pipeline).predict_pathlines(patients)
+    np.testing.assert_allclose(model.predict_pathlines(patients), expected, atol=forest_model.TOLERANCE)
+
+    model.forest_max_rows = 29  # 10 patients x 3 visits
+    monkeypatch.setattr(forest, "predict_proba", lambda X: pytest.fail("forest used for a large batch"))
+    np.testing.assert_allclose(model.predict_pathlines(patients), expected)
@@ -0,0 +1,196 @@
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+import ingest_books
+from conftest import text_vector
+from ingest_books import IngestState, LocalSink, PineconeSink, ingest, iter_chunks
+from vector_store import LocalVectorIndex
+
+
+def words(prefix: str, n: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(n))
+
+
+class FakeOpenAI:
+    """Sync ``openai.OpenAI`` for embed_batch; ``fail_on`` call numbers raise."""
+
+    def __init__(self, fail_on=()):
+        self.calls = []
+        self.fail_on = set(fail_on)
+        self.embeddings = self
+
+    def create(self, model, input):
+        self.calls.append(list(input))
+        if len(self.calls) in self.fail_on:
+            raise RuntimeError("rate limited")
+        # Out of order on purpose: embed_batch sorts by index
+        data = [SimpleNamespace(index=i, embedding=text_vector(t, dim=16)) for i, t in enumerate(input)]
+        return SimpleNamespace(data=data[::-1])
+
+
+@pytest.fixture
+def books(monkeypatch):
+    """``{path: [page text, ...]}`` served by iter_pages instead of PyMuPDF."""
+    pages = {}
+    monkeypatch.setattr(ingest_books, "iter_pages", lambda path: enumerate(pages[path], start=1))
+    return pages
+
+
+@pytest.fixture
+def openai(monkeypatch):
+    client = FakeOpenAI()
+    monkeypatch.setitem(sys.modules, "openai", SimpleNamespace(OpenAI=lambda api_key=None: client))
+    monkeypatch.setattr(ingest_books.time, "sleep", lambda s: None)
+    return client
+
+
+def run(paths, sink, state, **kwargs):
+    return ingest(paths, sink, state, chunk_size=10, overlap=3, batch_size=4, workers=2, **kwargs)
+
+
+def test_chunks_overlap_and_carry_the_previous_page_tail():
+    pages = [(1, words("a", 17)), (2, ""), (3, words("b", 5))]
+    chunks = list(iter_chunks(pages, "/books/mims.pdf", chunk_size=10, overlap=3))
+
+    texts = [c["text"].split() for c in chunks]
+    assert texts[0] == [f"a{i}" for i in range(10)]
+    assert texts[1] == [f"a{i}" for i in range(7, 17)]
+    assert texts[2] == ["a14", "a15", "a16"] + [f"b{i}" for i in range(5)]  # page 3 starts with page 1's tail
+    assert [c["metadata"]["page"] for c in chunks] == [1, 1, 3]
+    assert chunks[0]["metadata"]["source"] == "mims.pdf"
+    with pytest.raises(ValueError):
+        list(iter_chunks(pages, "x.pdf", chunk_size=5, overlap=5))
+
+
+def test_editing_a_page_only_changes_its_chunks_and_the_next_first_chunk():
+    pages = [words("a", 20), words("b", 20), words("c", 20)]
+    before = [c["id"] for c in iter_chunks(enumerate(pages, 1), "x.pdf", 10, 3)]
+    pages[0] = words("a", 19) + " edited"
+    after = {c["id"]: c["metadata"]["page"] for c in iter_chunks(enumerate(pages, 1), "x.pdf", 10, 3)}
+
+    changed_pages = sorted({page for cid, page in after.items() if cid not in before})
+    assert changed_pages == [1, 2]
+    page3 = [c["id"] for c in iter_chunks(enumerate(pages, 1), "x.pdf", 10, 3) if c["metadata"]["page"] == 3]
+    assert set(page3) <= set(before)
+
+
+def test_local_ingest_builds_the_index_and_skips_on_rerun(tmp_path, books, openai):
+    books["mims.pdf"] = [words("a", 30), words("b", 30)]
+    state = IngestState(str(tmp_path / "state.sqlite"))
+    out = str(tmp_path / "vector_index")
+
+    first = run(["mims.pdf"], LocalSink(out), state)
+    index = LocalVectorIndex(out, model=ingest_books.EMBEDDING_MODEL)
+    assert first["ingested"] == len(index) == first["seen"]
+    assert sum(len(c) for c in openai.calls) == first["ingested"]
+
+    openai.calls.clear()
+    second = run(["mims.pdf"], LocalSink(out), state)
+    assert (second["ingested"], second["skipped"], openai.calls) == (0, first["seen"], [])
+
+
+def test_interrupted_run_resumes_without_duplicates(tmp_path, books, openai):
+    books["mims.pdf"] = [words("a", 60)]
+    state = IngestState(str(tmp_path / "state.sqlite"))
+    out = str(tmp_path / "vector_index")
+    openai.fail_on = set(range(3, 20))  # every retry of the later batches fails
+
+    with pytest.raises(RuntimeError):
+        ingest(["mims.pdf"], LocalSink(out), state, chunk_size=10, overlap=3, batch_size=2, workers=1)
+    done = len(state.ids(LocalSink(out).name, "mims.pdf"))
+    assert 0 < done
+
+    openai.fail_on = set()
+    counts = ingest(["mims.pdf"], LocalSink(out), state, chunk_size=10, overlap=3, batch_size=2, workers=1)
+    index = LocalVectorIndex(out)
+    assert counts["skipped"] == done
+    assert len(index) == len(set(index.ids)) == counts["seen"]
+
+
+def test_prune_removes_chunks_of_edited_pages(tmp_path, books, openai):
+    books["mims.pdf"] = [words("a", 30), words("b", 30)]
+    books["other.pdf"] = [words("z", 12)]
+    state = IngestState(str(tmp_path / "state.sqlite"))
+    out = str(tmp_path / "vector_index")
+    run(["mims.pdf", "other.pdf"], LocalSink(out), state)
+    before = set(LocalVectorIndex(out).ids)
+
+    books["mims.pdf"][1] = words("B", 30)
+    kept = run(["mims.pdf"], LocalSink(out), state)
+    assert before < set(LocalVectorIndex(out).ids)  # without --prune the old page-2 chunks stay
+
+    pruned = run(["mims.pdf"], LocalSink(out), state, prune=True)
+    current = {c["id"] for c in iter_chunks(enumerate(books["mims.pdf"], 1), "mims.pdf", 10, 3)}
+    other = {c["id"] for c in iter_chunks(enumerate(books["other.pdf"], 1), "other.pdf", 10, 3)}
+    assert set(LocalVectorIndex(out).ids) == current | other  # other books are left alone
+    assert pruned["pruned"] == len(before - current - other) and kept["pruned"] == 0
+    assert state.ids(LocalSink(out).name, "mims.pdf") == current
+
+
+def test_restaged_chunk_is_kept_once(tmp_path):
+    sink = LocalSink(str(tmp_path / "idx"))
+    chunk = {"id": "c1", "text": "t", "metadata": {"text": "t", "source": "x.pdf", "page": 1}}
+    sink.upsert([chunk], [[1.0, 0.0]])
+    sink.upsert([chunk, {**chunk, "id": "c2"}], [[0.0, 1.0], [1.0, 1.0]])
+    sink.delete(["c2"])
+    sink.finalize()
+
+    index = LocalVectorIndex(str(tmp_path / "idx"))
+    assert index.ids == ["c1"]
+    assert index.vectors[0].tolist() == [0.0, 1.0]  # the last copy wins
+
+
+class FakePineconeIndex:
+    def __init__(self, legacy=()):
+        self.upserts, self.deletes = [], []
+        self.namespaces = set()
+        self.legacy = list(legacy)
+
+    def upsert(self, vectors, namespace=""):
+        self.upserts.append(vectors)
+        self.namespaces.add(namespace)
+
+    def delete(self, ids, namespace=""):
+        self.deletes.append((list(ids), namespace))
+        self.namespaces.add(namespace)
+
+    def list(self, prefix="", namespace=""):
+        yield from (self.legacy[i:i + 2] for i in range(0, len(self.legacy), 2))
+
+
+def pinecone_sink(index, namespace="") -> PineconeSink:
+    sink = PineconeSink.__new__(PineconeSink)  # skip the client setup
+    sink.index, sink.namespace, sink.name = index, namespace, f"pinecone:test/{namespace}"
+    return sink
+
+
+def test_purge_legacy_deletes_notebook_chunks_after_ingesting(tmp_path, books, openai, monkeypatch):
+    monkeypatch.setattr(ingest_books, "MAX_DELETE_IDS", 2)
+    books["mims.pdf"] = [words("a", 12)]
+    index = FakePineconeIndex(legacy=["chunk-0", "chunk-1", "chunk-2"])
+
+    counts = run(["mims.pdf"], pinecone_sink(index, "books-v2"), IngestState(str(tmp_path / "s.sqlite")),
+                 purge_legacy=True)
+
+    assert counts["purged_legacy"] == 3
+    assert index.deletes == [(["chunk-0", "chunk-1"], "books-v2"), (["chunk-2"], "books-v2")]
+    assert index.upserts  # ingested before anything was deleted
+    assert index.namespaces == {"books-v2"}  # upserts land where the cleanup deletes
+
+
+def test_pinecone_upserts_are_split_by_request_size(monkeypatch):
+    monkeypatch.setattr(ingest_books, "MAX_UPSERT_BYTES", 200)
+    index = FakePineconeIndex()
+    chunks = [{"id": f"c{i}", "metadata": {"text": "x" * 40}} for i in range(5)]
+
+    pinecone_sink(index).upsert(chunks, [[0.5] * 4] * 5)
+
+    assert [len(batch) for batch in index.upserts] == [2, 2, 1]
+
+
+def test_embedding_batches_are_retried(openai):
+    openai.fail_on = {1}
+    assert ingest_books.embed_batch(openai, ["one", "two"]) == [text_vector("one", 16), text_vector("two", 16)]
+    assert len(openai.calls) == 2
@@ -0,0 +1,107 @@
+import os
+import subprocess
+import sys
+
+import joblib
+import numpy as np
+import pytest
+
+import linear_model
+import main
+from conftest import risk_rows
+from linear_model import LinearScorer, export, fold_estimator
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fit(*steps):
+    from sklearn.pipeline import make_pipeline
+
+    X = risk_rows(200, seed=3)
+    y = X @ np.array([0.5, 0.3, 0.01, -0.004, 0.2, 0.1]) + 1.0
+    return make_pipeline(*steps).fit(X, y)
+
+
+def test_scores_match_sklearn(tmp_path, ridge_pipeline):
+    export(ridge_pipeline, str(tmp_path / "model.npz"))
+    scorer = LinearScorer(str(tmp_path / "model.npz"))
+    X = risk_rows(50, seed=9)
+
+    np.testing.assert_allclose(scorer.predict(X), ridge_pipeline.predict(X), atol=linear_model.TOLERANCE)
+    assert scorer.predict(X[0]).shape == (1,)
+    assert scorer.verify(ridge_pipeline) <= linear_model.TOLERANCE
+    assert scorer.feature_names == [str(c) for c in ridge_pipeline.feature_names_in_]
+
+
+@pytest.mark.parametrize("scaler", ["StandardScaler", "MinMaxScaler", "MaxAbsScaler", "RobustScaler"])
+def test_scalers_are_folded(tmp_path, scaler):
+    import sklearn.preprocessing
+    from sklearn.linear_model import LinearRegression
+
+    pipeline = fit(getattr(sklearn.preprocessing, scaler)(), LinearRegression())
+    export(pipeline, str(tmp_path / "model.npz"))
+
+    X = risk_rows(20, seed=4)
+    np.testing.assert_allclose(LinearScorer(str(tmp_path / "model.npz")).predict(X), pipeline.predict(X), atol=1e-6)
+
+
+def test_unsupported_models_are_refused():
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import Ridge
+    from sklearn.preprocessing import PolynomialFeatures
+
+    with pytest.raises(ValueError, match="not a linear model"):
+        fold_estimator(fit(RandomForestRegressor(n_estimators=2)))
+    with pytest.raises(ValueError, match="Cannot fold PolynomialFeatures"):
+        fold_estimator(fit(PolynomialFeatures(), Ridge()))
+
+
+def test_verify_rejects_drift(tmp_path, ridge_pipeline):
+    from sklearn.linear_model import Ridge
+
+    path = str(tmp_path / "model.npz")
+    export(ridge_pipeline, path)
+    retrained = fit(Ridge(alpha=50.0))
+    with pytest.raises(ValueError, match="re-export"):
+        LinearScorer(path).verify(retrained)
+
+    with np.load(path) as data:
+        tampered = dict(data)
+    tampered["coef"] = tampered["coef"] * 1.01
+    np.savez(path, **tampered)
+    with pytest.raises(ValueError, match="disagrees with sklearn"):
+        LinearScorer(path).verify()
+
+
+def test_wrong_feature_count_is_rejected(tmp_path, ridge_pipeline):
+    export(ridge_pipeline, str(tmp_path / "model.npz"))
+    with pytest.raises(ValueError, match="expecting 6 features"):
+        LinearScorer(str(tmp_path / "model.npz")).predict([[1.0, 2.0]])
+
+
+def test_scoring_does_not_import_sklearn(tmp_path, ridge_pipeline):
+    export(ridge_pipeline, str(tmp_path / "model.npz"))
+    code = ("import sys, linear_model\n"
+            f"linear_model.LinearScorer({str(tmp_path / 'model.npz')!r}).verify()\n"
+            "print('sklearn' in sys.modules)")
+    proc = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+    assert proc.stdout.strip() == "False"
+
+
+def test_cli_export_and_verify(tmp_path, ridge_pipeline, capsys):
+    joblib.dump(ridge_pipeline, tmp_path / "ridge.pkl")
+
+    linear_model.main(["export", str(tmp_path / "ridge.pkl")])
+    linear_model.main(["verify", str(tmp_path / "ridge.npz"), "--pickle", str(tmp_path / "ridge.pkl")])
+
+    out = capsys.readouterr().out
+    assert "Wrote" in out and "with 6 features" in out and "OK, max drift" in out
+    assert len(LinearScorer(str(tmp_path / "ridge.npz")).manifest["source_sha256"]) == 64
+
+
+def test_service_prefers_the_artifact(model_dir):
+    model = main._load_ridge_model(str(model_dir / "risk_v2" / "model.npz"), str(model_dir / "risk_v2" / "model.pkl"))
+    assert isinstance(model, LinearScorer)
+
+    legacy = main._load_ridge_model(str(model_dir / "risk_v1" / "model.npz"), str(model_dir / "risk_v1" / "model.pkl"))
+    assert type(legacy).__name__ == "Pipeline"
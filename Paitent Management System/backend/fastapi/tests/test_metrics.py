@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import main
+import metrics
+from conftest import metric_value, risk_rows
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """An empty metric registry, so test metrics do not leak into /metrics."""
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_collectors", [])
+    monkeypatch.delenv("METRICS_MULTIPROC_DIR", raising=False)
+
+
+def stage_count(name: str) -> int:
+    return metrics.STAGE_LATENCY._values.get((name,), {}).get("count", 0)
+
+
+def test_text_format(registry):
+    requests = metrics.Counter("requests_total", "Requests.", ("route",))
+    in_flight = metrics.Gauge("in_flight", "In flight.")
+    latency = metrics.Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0))
+    requests.inc(route='/say "hi"')
+    requests.inc(2, route='/say "hi"')
+    in_flight.inc()
+    in_flight.dec(0.5)
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert metrics.render().splitlines() == [
+        "# HELP requests_total Requests.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/say \\"hi\\""} 3',
+        "# HELP in_flight In flight.",
+        "# TYPE in_flight gauge",
+        "in_flight 0.5",
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 0.55",
+        "latency_seconds_count 2",
+    ]
+
+
+def test_labels_must_match(registry):
+    counter = metrics.Counter("c", "C.", ("kind",))
+    with pytest.raises(ValueError, match="expects labels"):
+        counter.inc(other="x")
+
+
+def test_collectors_run_before_render_and_failures_are_contained(registry):
+    size = metrics.Gauge("size", "Size.")
+    metrics.add_collector(lambda: 1 / 0)
+    metrics.add_collector(lambda: size.set(42))
+    assert "size 42" in metrics.render()
+
+
+def test_stage_and_timed_record_latency_and_errors():
+    @metrics.timed("test_sync")
+    def sync():
+        return "ok"
+
+    @metrics.timed("test_async")
+    async def failing():
+        raise RuntimeError("boom")
+
+    before = stage_count("test_sync"), stage_count("test_async")
+    assert sync() == "ok" and sync.__name__ == "sync"
+    with pytest.raises(RuntimeError):
+        asyncio.run(failing())
+
+    assert (stage_count("test_sync"), stage_count("test_async")) == (before[0] + 1, before[1] + 1)
+    assert metric_value(metrics.STAGE_ERRORS, stage="test_async") == 1
+    assert metric_value(metrics.STAGE_ERRORS, stage="test_sync") == 0
+
+
+def test_dashboard_request_is_timed_by_route_and_stage(api):
+    lookups, predicts = stage_count("mysql_lookup"), stage_count("model_predict")
+    requests = metric_value(metrics.HTTP_REQUESTS, route="/risk-dashboard", method="POST", status="200")
+
+    api.post("/risk-dashboard", json={"features": risk_rows(1)[0].tolist(), "patient_id": 5})
+
+    assert stage_count("mysql_lookup") == lookups + 1
+    assert stage_count("model_predict") == predicts + 1
+    assert metric_value(metrics.HTTP_REQUESTS, route="/risk-dashboard", method="POST", status="200") == requests + 1
+    assert metric_value(metrics.HTTP_IN_FLIGHT) == 0
+
+
+def test_metrics_route(api):
+    api.post("/predict", json={"features": risk_rows(1)[0].tolist()})
+    api.get("/no-such-route")
+
+    response = api.get("/metrics")
+
+    assert response.headers["content-type"] == metrics.CONTENT_TYPE
+    text = response.text
+    assert 'http_requests_total{route="/predict",method="POST",status="200"}' in text
+    assert 'route="unmatched"' in text
+    assert 'cache_lookups{cache="prediction",result="misses"}' in text
+    assert 'db_pool_connections{state="size"} 1' in text
+    assert 'model_load_seconds{resource="risk_v1"}' in text
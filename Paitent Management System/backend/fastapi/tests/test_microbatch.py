@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import main
+import metrics
+from conftest import metric_value, risk_rows
+from microbatch import MicroBatcher
+
+
+class Model:
+    """``predict_fn`` that sums each row and records the batches it was given."""
+
+    def __init__(self, delay: float = 0.0, fail: set = frozenset()):
+        self.batches = []
+        self.delay = delay
+        self.fail = fail
+
+    def __call__(self, version, X):
+        self.batches.append((version, X.shape))
+        time.sleep(self.delay)
+        if version in self.fail:
+            raise RuntimeError(f"{version} failed")
+        return X.sum(axis=1)
+
+
+def burst(batcher, rows, versions=None):
+    """Submit every row from its own thread at the same moment."""
+    versions = versions or ["v1"] * len(rows)
+    barrier = threading.Barrier(len(rows))
+
+    def one(i):
+        barrier.wait()
+        try:
+            return batcher.submit(versions[i], rows[i])
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(len(rows)) as pool:
+        return list(pool.map(one, range(len(rows))))
+
+
+def test_concurrent_rows_share_one_predict_and_get_their_own_result():
+    model = Model()
+    batcher = MicroBatcher(model, window_ms=200, max_rows=64, idle_ms=50)
+    rows = [[i, 0.5] for i in range(20)]
+
+    results = burst(batcher, rows)
+
+    assert results == [i + 0.5 for i in range(20)]
+    assert sum(shape[0] for _, shape in model.batches) == 20
+    assert len(model.batches) <= 3
+    assert batcher.stats()["avg_batch_rows"] >= 20 / 3
+
+
+def test_full_batches_flush_without_waiting_for_the_window():
+    model = Model(delay=0.01)
+    batcher = MicroBatcher(model, window_ms=5000, max_rows=4, idle_ms=5000)
+
+    start = time.perf_counter()
+    burst(batcher, [[i] for i in range(8)])
+
+    assert time.perf_counter() - start < 2
+    assert all(shape[0] <= 4 for _, shape in model.batches)
+    assert batcher.stats()["full"] >= 1
+
+
+def test_lone_request_flushes_when_idle():
+    batcher = MicroBatcher(Model(), window_ms=2000, idle_ms=1)
+    flushes = metric_value(metrics.MICROBATCH_FLUSHES, reason="idle")
+
+    start = time.perf_counter()
+    assert batcher.submit("v1", [1.0, 2.0]) == 3.0
+
+    assert time.perf_counter() - start < 1
+    assert batcher.stats()["idle"] == 1
+    assert metric_value(metrics.MICROBATCH_FLUSHES, reason="idle") == flushes + 1
+
+
+def test_versions_and_row_lengths_are_predicted_separately():
+    model = Model(fail={"broken"})
+    batcher = MicroBatcher(model, window_ms=200, idle_ms=50)
+    rows = [[1.0], [2.0], [1.0, 1.0], [3.0]]
+
+    results = burst(batcher, rows, ["v1", "v1", "v1", "broken"])
+
+    assert results[:3] == [1.0, 2.0, 2.0]
+    assert isinstance(results[3], RuntimeError) and str(results[3]) == "broken failed"
+    assert batcher.stats()["errors"] == 1
+    assert sorted(model.batches) == [("broken", (1, 1)), ("v1", (1, 2)), ("v1", (2, 1))]
+
+
+def test_worker_is_restarted_after_fork():
+    batcher = MicroBatcher(Model(), idle_ms=1)
+    batcher.submit("v1", [1.0])
+    first = batcher._thread
+    batcher._pid = -1  # as seen from a forked child
+
+    assert batcher.submit("v1", [2.0]) == 2.0
+    assert batcher._thread is not first and batcher._thread.is_alive()
+
+
+@pytest.fixture
+def batching(api, monkeypatch):
+    monkeypatch.setattr(main, "MICROBATCH_ENABLED", True)
+    monkeypatch.setenv("MICROBATCH_WINDOW_MS", "100")
+    monkeypatch.setenv("MICROBATCH_IDLE_MS", "20")
+    return api
+
+
+def test_service_scores_concurrent_rows_in_batches(batching, ridge_pipeline):
+    X = risk_rows(16, seed=6)
+    barrier = threading.Barrier(len(X))
+
+    def one(row):
+        barrier.wait()
+        return main.predict_risk_row(row.tolist(), "risk_v1")
+
+    with ThreadPoolExecutor(len(X)) as pool:
+        got = list(pool.map(one, X))
+
+    np.testing.assert_allclose(got, ridge_pipeline.predict(X))
+    stats = batching.get("/health/microbatch").json()
+    assert stats["rows"] == 16 and stats["batches"] < 16
+
+
+def test_predict_route_is_unchanged_for_clients(batching, ridge_pipeline):
+    features = risk_rows(1, seed=7)[0]
+    body = batching.post("/predict", json={"features": features.tolist()}).json()
+    assert body["prediction"] == pytest.approx(float(ridge_pipeline.predict(features.reshape(1, -1))[0]))
@@ -0,0 +1,200 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import main
+from conftest import risk_rows
+from model_registry import ModelLoadError, ModelRegistry, UnknownModelVersion, canary_bucket
+
+MB = 1_000_000
+
+
+@pytest.fixture
+def root(tmp_path):
+    """risk_v1..v3 and therapy_v1 directories of 1 MB each."""
+    for version in ("risk_v1", "risk_v2", "risk_v3", "therapy_v1"):
+        os.makedirs(tmp_path / version)
+        (tmp_path / version / "model.bin").write_bytes(b"\0" * MB)
+    return tmp_path
+
+
+class Loader:
+    """Records loads; versions in ``broken`` raise."""
+
+    def __init__(self):
+        self.loaded = []
+        self.broken = set()
+
+    def __call__(self, version, path):
+        if version in self.broken:
+            raise RuntimeError(f"{version} is corrupt")
+        self.loaded.append(version)
+        return f"model:{version}"
+
+
+@pytest.fixture
+def loader():
+    return Loader()
+
+
+def registry(root, loader, budget=10 * MB) -> ModelRegistry:
+    return ModelRegistry(str(root), {"risk": loader, "therapy": loader}, budget, poll_seconds=0,
+                         fallback={"risk": "risk_v1", "therapy": "therapy_v1"})
+
+
+def write_routing(root, routing: dict) -> None:
+    path = root / "registry.json"
+    before = os.stat(path).st_mtime_ns if path.exists() else 0
+    path.write_text(json.dumps(routing))
+    os.utime(path, ns=(before + 10**9, before + 10**9))  # a new mtime even on coarse clocks
+
+
+def test_canary_split_is_stable_per_patient_and_close_to_the_percentage(root, loader):
+    reg = registry(root, loader)
+    reg.set_routing("risk", "risk_v1", canary="risk_v2", canary_percent=10)
+
+    versions = [reg.resolve("risk", routing_key=pid) for pid in range(5000)]
+
+    assert versions == [reg.resolve("risk", routing_key=pid) for pid in range(5000)]
+    assert 0.08 < versions.count("risk_v2") / 5000 < 0.12
+    assert all((v == "risk_v2") == (canary_bucket(pid) < 10) for pid, v in enumerate(versions))
+
+
+def test_requested_version_is_served_as_named(root, loader):
+    reg = registry(root, loader)
+    assert reg.resolve("risk") == "risk_v1"
+    assert reg.resolve("risk", "risk_v3") == "risk_v3"
+    with pytest.raises(UnknownModelVersion, match="not a risk model"):
+        reg.resolve("risk", "therapy_v1")
+    with pytest.raises(UnknownModelVersion, match="not in the registry"):
+        reg.resolve("risk", "risk_v9")
+    with pytest.raises(UnknownModelVersion, match="Invalid"):
+        reg.resolve("risk", "../risk_v1")
+
+
+def test_routing_file_is_hot_swapped_after_preloading(root, loader):
+    reg = registry(root, loader)
+    assert reg.default_version("risk") == "risk_v1" and loader.loaded == []
+
+    write_routing(root, {"risk": {"default": "risk_v2"}})
+
+    assert reg.default_version("risk") == "risk_v2"
+    assert sorted(loader.loaded) == ["risk_v2", "therapy_v1"]  # every routed version, before the swap
+    assert reg.default_version("therapy") == "therapy_v1"  # kinds not in the file keep the fallback
+    assert reg.stats()["reloads"] == 1
+
+
+def test_routing_to_a_missing_version_is_ignored(root, loader, capsys):
+    reg = registry(root, loader)
+    write_routing(root, {"risk": {"default": "risk_v9"}})
+
+    assert reg.default_version("risk") == "risk_v1"
+    assert "Ignoring invalid" in capsys.readouterr().out
+
+
+def test_unloadable_version_keeps_the_current_routing_until_it_loads(root, loader):
+    reg = registry(root, loader)
+    loader.broken = {"risk_v2"}
+    write_routing(root, {"risk": {"default": "risk_v1", "canary": "risk_v2", "canary_percent": 50}})
+
+    assert reg.routing()["risk"]["canary"] is None
+
+    loader.broken = set()  # e.g. the copy finished
+    assert reg.routing()["risk"]["canary"] == "risk_v2"
+
+
+def test_set_routing_persists_and_refuses_what_cannot_load(root, loader):
+    reg = registry(root, loader)
+    entry = reg.set_routing("risk", "risk_v2", canary="risk_v3", canary_percent=25)
+    assert entry == {"default": "risk_v2", "canary": "risk_v3", "canary_percent": 25.0}
+    assert json.loads((root / "registry.json").read_text())["risk"] == entry
+
+    loader.broken = {"risk_v1"}
+    with pytest.raises(ModelLoadError, match="risk_v1 is corrupt"):
+        reg.set_routing("risk", "risk_v1")
+    assert reg.routing()["risk"] == entry
+    assert json.loads((root / "registry.json").read_text())["risk"] == entry
+
+    with pytest.raises(ValueError, match="between 0 and 100"):
+        reg.set_routing("risk", "risk_v1", canary="risk_v2", canary_percent=150)
+    with pytest.raises(ValueError, match="Unknown model kind"):
+        reg.set_routing("glucose", "glucose_v1")
+    # A fresh process picks the persisted table up
+    assert registry(root, Loader()).routing()["risk"] == entry
+
+
+def test_least_recently_used_version_is_evicted_but_routed_ones_stay(root, loader):
+    reg = registry(root, loader, budget=int(2.5 * MB))
+    reg.get_model("risk_v1")  # routed (default)
+    reg.get_model("risk_v2")
+    reg.get_model("risk_v3")
+
+    stats = reg.stats()
+    assert set(stats["loaded"]) == {"risk_v1", "risk_v3"}
+    assert stats["evictions"] == 1 and stats["loaded_bytes"] <= 2.5 * MB
+
+    reg.get_model("risk_v2")
+    assert loader.loaded.count("risk_v2") == 2  # reloaded on demand
+    assert "risk_v1" in reg.stats()["loaded"]
+
+
+def test_concurrent_requests_load_a_version_once(root, loader):
+    from concurrent.futures import ThreadPoolExecutor
+
+    reg = registry(root, loader)
+    with ThreadPoolExecutor(8) as pool:
+        models = list(pool.map(lambda _: reg.get_model("risk_v2"), range(32)))
+    assert set(models) == {"model:risk_v2"} and loader.loaded == ["risk_v2"]
+
+
+@pytest.fixture
+def admin(api, model_dir, tmp_path, monkeypatch):
+    """The API over a private copy of the test registry, with an admin token."""
+    shutil.copytree(model_dir, tmp_path / "registry")
+    monkeypatch.setenv("MODEL_REGISTRY_DIR", str(tmp_path / "registry"))
+    monkeypatch.setenv("MODEL_ADMIN_TOKEN", "s3cret")
+    return api
+
+
+def test_admin_routes_fail_closed(admin, monkeypatch):
+    assert admin.post("/models/reload").status_code == 403
+    assert admin.post("/models/reload", headers={"x-admin-token": "wrong"}).status_code == 403
+    assert admin.post("/models/reload", headers={"x-admin-token": "s3cret"}).status_code == 200
+
+    monkeypatch.delenv("MODEL_ADMIN_TOKEN")
+    response = admin.put("/models/risk/routing", json={"default": "risk_v2"}, headers={"x-admin-token": ""})
+    assert response.status_code == 503 and "disabled" in response.json()["detail"]
+
+
+def test_requests_follow_the_routing(admin):
+    features = risk_rows(1)[0].tolist()
+    headers = {"x-admin-token": "s3cret"}
+
+    response = admin.put("/models/risk/routing", json={"default": "risk_v1", "canary": "risk_v2",
+                                                       "canary_percent": 100}, headers=headers)
+    assert response.json() == {"kind": "risk", "default": "risk_v1", "canary": "risk_v2", "canary_percent": 100.0}
+    assert admin.post("/predict", json={"features": features, "patient_id": 3}).json()["model_version"] == "risk_v2"
+    pinned = admin.post("/predict", json={"features": features, "patient_id": 3, "model_version": "risk_v1"}).json()
+    assert pinned["model_version"] == "risk_v1"
+
+    bad = admin.put("/models/risk/routing", json={"default": "risk_v9"}, headers=headers)
+    assert bad.status_code == 400 and "not in the registry" in bad.json()["detail"]
+    assert main.get_model_registry().routing()["risk"]["canary"] == "risk_v2"
+
+    stats = admin.get("/models").json()
+    assert stats["available"] == ["risk_v1", "risk_v2", "therapy_v1", "therapy_v2"]
+    assert {"risk_v1", "risk_v2"} <= set(stats["loaded"])
+
+
+def test_unknown_versions_are_served_by_the_routed_one(admin, capsys):
+    features = risk_rows(1)[0].tolist()
+
+    for label in ("risk_v9", "mobile-1.4", "risk_v9", "therapy_v1"):
+        body = admin.post("/predict", json={"features": features, "model_version": label}).json()
+        assert body["model_version"] == "risk_v1"
+
+    warnings = [line for line in capsys.readouterr().out.splitlines() if "[REGISTRY]" in line and "instead" in line]
+    assert len(warnings) == 3  # once per label
+    assert "'risk_v9' is not in the registry; serving risk_v1 instead" in warnings[0]
@@ -0,0 +1,151 @@
+import gc
+import json
+import os
+import runpy
+import shutil
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import metrics
+from risk_summary import RiskSummary
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("METRICS_MULTIPROC_DIR", str(tmp_path))
+    return tmp_path
+
+
+def worker(code: str) -> int:
+    """Run ``code`` in a separate process that writes its metrics snapshot; returns its pid."""
+    script = f"import os, metrics\n{code}\nmetrics.write_snapshot()\nprint(os.getpid())"
+    proc = subprocess.run([sys.executable, "-c", script], cwd=HERE, capture_output=True, text=True, check=True)
+    return int(proc.stdout.strip())
+
+
+def test_scrape_merges_every_worker(shared_dir):
+    pids = [worker("metrics.HTTP_REQUESTS.inc(2, route='/mp', method='GET', status='200')\n"
+                   "metrics.WRITE_BEHIND_DEPTH.set(3)\n"
+                   "metrics.STAGE_LATENCY.observe(0.02, stage='mp')") for _ in range(2)]
+
+    text = metrics.render()
+
+    assert 'http_requests_total{route="/mp",method="GET",status="200"} 4' in text
+    assert 'stage_duration_seconds_count{stage="mp"} 2' in text
+    assert 'stage_duration_seconds_bucket{stage="mp",le="0.025"} 2' in text
+    for pid in pids:
+        assert f'write_behind_queue_depth{{pid="{pid}"}} 3' in text
+    assert os.path.exists(shared_dir / f"{os.getpid()}.json")  # this process took part too
+
+
+def test_exited_worker_keeps_its_counts_but_not_its_gauges(shared_dir):
+    pid = worker("metrics.HTTP_REQUESTS.inc(route='/gone', method='GET', status='200')\n"
+                 "metrics.WRITE_BEHIND_DEPTH.set(7)")
+
+    metrics.mark_process_dead(pid)
+    text = metrics.render()
+
+    assert 'http_requests_total{route="/gone",method="GET",status="200"} 1' in text
+    assert f'pid="{pid}"' not in text
+    assert json.loads((shared_dir / f"{pid}.json").read_text())["live"] is False
+    metrics.mark_process_dead(999999999)  # never wrote a snapshot
+
+
+def test_worker_clears_counts_inherited_from_the_master(shared_dir, monkeypatch):
+    started = []
+    monkeypatch.setattr(metrics, "_registry", [])
+    monkeypatch.setattr(metrics, "_sync_pid", None)
+    monkeypatch.setattr(metrics.threading, "Thread", lambda **kw: SimpleNamespace(start=lambda: started.append(kw)))
+    counter = metrics.Counter("loaded_total", "Loads.")
+    gauge = metrics.Gauge("model_bytes", "Bytes.")
+    counter.inc()
+    gauge.set(10)
+
+    metrics.start_multiprocess_sync()
+    metrics.start_multiprocess_sync()  # once per process
+
+    assert counter._values == {} and gauge._values == {(): 10.0}
+    assert [kw["name"] for kw in started] == ["metrics-sync"]
+
+
+@pytest.fixture
+def gunicorn_conf(monkeypatch):
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    monkeypatch.setenv("METRICS_MULTIPROC_DIR", "")  # restored to unset afterwards
+    conf = runpy.run_path(os.path.join(HERE, "gunicorn.conf.py"))
+    made = os.environ["METRICS_MULTIPROC_DIR"]
+    yield conf
+    shutil.rmtree(made, ignore_errors=True)
+
+
+def test_gunicorn_config(gunicorn_conf):
+    assert gunicorn_conf["workers"] == 3 and gunicorn_conf["preload_app"]
+    assert gunicorn_conf["worker_class"] == "uvicorn.workers.UvicornWorker"
+    assert os.path.isdir(os.environ["METRICS_MULTIPROC_DIR"])  # made up so /metrics sees every worker
+
+
+def test_gunicorn_hooks(gunicorn_conf, shared_dir, monkeypatch):
+    logged = []
+    server = SimpleNamespace(log=SimpleNamespace(info=lambda msg, *args: logged.append(msg % args)))
+    (shared_dir / "12345.json").write_text(json.dumps({"live": True, "metrics": {}}))
+
+    gunicorn_conf["on_starting"](server)
+    assert os.listdir(shared_dir) == []  # snapshots of a previous run are gone
+
+    monkeypatch.setattr(main, "preload_for_fork", lambda: ["ridge", "therapy"])
+    gunicorn_conf["when_ready"](server)
+    assert logged == ["Preloaded before fork: ridge, therapy (3 workers)"]
+    master = json.loads((shared_dir / f"{os.getpid()}.json").read_text())
+    assert master["live"] is False and "write_behind_queue_depth" not in master["metrics"]
+
+    pid = worker("metrics.WRITE_BEHIND_DEPTH.set(1)")
+    gunicorn_conf["child_exit"](server, SimpleNamespace(pid=pid))
+    assert json.loads((shared_dir / f"{pid}.json").read_text())["live"] is False
+
+
+def test_master_preloads_only_fork_safe_models(api, monkeypatch):
+    monkeypatch.setattr(main, "_warmup", {"started": False, "done": False, "resources": {}})
+    monkeypatch.setenv("WARMUP_RESOURCES", "ridge,mysql,groq,therapy")
+    try:
+        assert main.preload_for_fork() == ["ridge", "therapy"]
+        assert gc.get_freeze_count() > 0
+    finally:
+        gc.unfreeze()
+    assert main._warmup["resources"]["therapy"]["status"] == "ready"
+
+
+def test_summary_picks_up_scores_saved_by_other_workers(api, fake_mysql):
+    summary = RiskSummary("risk_v1", main._risk_label, main.RISK_LABELS)
+    summary.update(1, 5.0, doctor_id=4, name="A")
+    summary.update(2, 6.0, doctor_id=4, name="B")
+    summary.db_watermark = "2026-10-18 10:00:00"
+    summary.synced_at = time.monotonic() - 60
+    main._risk_summaries["risk_v1"] = summary
+
+    def respond(query, params):
+        if query == "SELECT NOW()":
+            return [("2026-10-18 10:00:05",)]
+        if query.startswith("SELECT id, last_risk_score"):
+            return [(1, 9.5), (3, 8.0)]  # patient 3 is new since the build
+        return []
+
+    fake_mysql.respond = respond
+
+    body = api.get("/risk-summary?scores=true").json()
+
+    assert dict(zip(body["scores"]["patient_id"], body["scores"]["prediction"])) == {1: 9.5, 2: 6.0}
+    assert body["top_risk"][0] == {"patient_id": 1, "name": "A", "prediction": 9.5,
+                                   "risk_label": main._risk_label(9.5), "assigned_doctor_id": 4}
+    sync = [params for query, params in fake_mysql.queries if "last_predicted_at >=" in query]
+    assert sync == [("2026-10-18 10:00:00", "risk_v1")]
+    assert summary.db_watermark == "2026-10-18 10:00:05"
+
+    api.get("/risk-summary")  # synced just now
+    assert len([q for q, _ in fake_mysql.queries if "last_predicted_at >=" in q]) == 1
@@ -0,0 +1,241 @@
+import random
+from decimal import Decimal
+
+import joblib
+import numpy as np
+import pytest
+
+import main
+import patient_features
+from conftest import risk_rows, therapy_payloads
+from patient_features import FeatureSchemaError
+from therapy_model import THERAPY_INPUT_FIELDS, TherapyModel, patient_inputs
+
+
+def test_columns_from_mysql_rows_and_api_records():
+    table = patient_features.columns(
+        [{"fvg_1": Decimal("120.5"), "insulin_regimen_type": "Basal"},
+         {"fvg_1": "98", "fvg_2": None},
+         {"fvg_1": "n/a"}],
+        ("fvg_1", "fvg_2", "insulin_regimen_type"),
+    )
+    np.testing.assert_array_equal(table["fvg_1"], [120.5, 98.0, np.nan])
+    assert np.isnan(table["fvg_2"]).all()
+    assert table["insulin_regimen_type"].dtype == object
+    assert table["insulin_regimen_type"].tolist() == ["Basal", None, None]
+
+    rows = patient_features.columns([(1, 2.5), (None, "3")], ("fvg_1", "fvg_2"))  # cursor tuples
+    np.testing.assert_array_equal(rows["fvg_2"], [2.5, 3.0])
+
+
+def test_derived_columns_are_filled_from_the_raw_visits():
+    table = patient_features.columns(
+        [{"fvg_1": 100, "fvg_2": 140, "avg_fvg_1_2": 125},  # stored values win
+         {"fvg_1": 100, "fvg_2": 140},
+         {"fvg_1": 100}],
+    )
+    np.testing.assert_array_equal(patient_features.column(table, "avg_fvg_1_2"), [125, 120, np.nan])
+    np.testing.assert_array_equal(patient_features.column(table, "fvg_delta_1_2"), [40, 40, np.nan])
+
+    raw = {"dds_1": [10.0], "dds_3": [14.0]}  # derived column not in the table at all
+    assert patient_features.column(raw, "dds_trend_1_3").tolist() == [4.0]
+    with pytest.raises(KeyError):
+        patient_features.column(raw, "egfr")
+    assert np.isnan(patient_features.column({"reduction_a": [np.nan]}, "reduction_a")).all()
+
+
+def test_risk_matrix_marks_incomplete_rows():
+    X = risk_rows(3)
+    records = [dict(zip(patient_features.RISK_COLUMNS, row)) for row in X]
+    del records[1]["avg_fvg_1_2"]  # filled from fvg_1 / fvg_2
+    records[2]["fvg_2"] = None
+
+    M, complete = patient_features.risk_matrix(patient_features.columns(records))
+
+    assert complete.tolist() == [True, True, False]
+    np.testing.assert_allclose(M[:2], X[:2])
+    assert patient_features.risk_matrix(patient_features.columns([]))[0].shape == (0, 6)
+
+
+def test_therapy_inputs_and_unknown_regimens(therapy_pipeline):
+    table = patient_features.columns([{"reduction_a": 1.5, "insulin_regimen_type": "Pump"}])
+    inputs = patient_features.therapy_inputs(table)
+
+    assert list(inputs) == list(THERAPY_INPUT_FIELDS)
+    assert inputs["HbA1c_Delta_1_2"][0] == inputs["Reduction (%)"][0] == 1.5  # both read patients.reduction_a
+    with pytest.raises(ValueError, match="Unknown insulin regimen: 'Pump'"):
+        TherapyModel(therapy_pipeline).visit_matrix(inputs)
+
+
+def test_check_model():
+    class Risk:
+        n_features_in_ = 5
+
+    class Therapy:
+        input_columns = ["HbA1c1", "BMI"]
+
+    patient_features.check_model("risk", object())  # no input count recorded
+    with pytest.raises(FeatureSchemaError, match="expects 5 inputs"):
+        patient_features.check_model("risk", Risk())
+    with pytest.raises(FeatureSchemaError, match="lacks: BMI"):
+        patient_features.check_model("therapy", Therapy())
+    with pytest.raises(FeatureSchemaError, match="feature schema v2"):
+        patient_features.check_model("risk", None, {"feature_schema": 2})
+
+
+def test_registry_refuses_a_model_built_for_other_inputs(tmp_path):
+    from sklearn.linear_model import Ridge
+
+    joblib.dump(Ridge().fit(risk_rows(20)[:, :5], np.arange(20)), tmp_path / "model.pkl")
+    with pytest.raises(FeatureSchemaError, match="expects 5 inputs"):
+        main._load_risk_version("risk_v9", str(tmp_path))
+
+
+# ---- Parity with the per-route builders this module replaced ----
+
+def legacy_key_factors(patient: dict | None) -> list[str]:
+    """main._key_factors_from_patient before patient_features."""
+    if not patient:
+        return []
+    items: list[str] = []
+    try:
+        hba1c1 = float(patient.get("hba1c_1st_visit")) if patient.get("hba1c_1st_visit") is not None else None
+        fvg1 = float(patient.get("fvg_1")) if patient.get("fvg_1") is not None else None
+        rad = patient.get("reduction_a_per_day")
+        rad = float(rad) if rad is not None else None
+        fvg_delta_1_2 = patient.get("fvg_delta_1_2")
+        fvg_delta_1_2 = float(fvg_delta_1_2) if fvg_delta_1_2 is not None else None
+
+        if hba1c1 is not None:
+            if hba1c1 > 8:
+                items.append(f"High initial HbA1c ({hba1c1}%)")
+            elif hba1c1 < 5.7:
+                items.append(f"Normal initial HbA1c ({hba1c1}%)")
+        if fvg1 is not None and fvg1 > 130:
+            items.append(f"Elevated FVG @ V1 ({int(fvg1)} mg/dL)")
+        if rad is not None and rad < 0.01:
+            items.append(f"Low daily HbA1c drop ({rad:.3f})")
+        if fvg_delta_1_2 is not None and fvg_delta_1_2 > 0:
+            items.append(f"FVG increase between visits (+{fvg_delta_1_2})")
+    except Exception:
+        pass
+    return items[:6]
+
+
+def laravel_records(n: int, seed: int = 0) -> list[dict]:
+    """Patients as the Laravel API returns them: decimal strings, NULLs, derived columns saved."""
+    rng = random.Random(seed)
+
+    def maybe(value):
+        return None if rng.random() < 0.2 else f"{value:.2f}"
+
+    records = []
+    for pid in range(n):
+        fvg1, fvg2 = maybe(rng.uniform(80, 250)), maybe(rng.uniform(80, 250))
+        records.append({
+            "id": pid,
+            "hba1c_1st_visit": None if rng.random() < 0.2 else round(rng.uniform(4, 12), 1),
+            "fvg_1": fvg1, "fvg_2": fvg2,
+            "fvg_delta_1_2": f"{float(fvg2) - float(fvg1):.2f}" if fvg1 and fvg2 else None,
+            "reduction_a_per_day": maybe(rng.uniform(-0.02, 0.05)),
+        })
+    return records
+
+
+def test_key_factors_match_the_old_per_patient_parser():
+    patients = [*laravel_records(500), None, {}]
+    assert main._key_factors_many(patients) == [legacy_key_factors(p) for p in patients]
+
+
+def test_key_factors_only_report_a_stored_fvg_delta():
+    # The model inputs derive a missing fvg_delta_1_2 from the visits; the key factors do not
+    patients = [{"fvg_1": "100", "fvg_2": "112.5", "fvg_delta_1_2": None},
+                {"fvg_1": "100", "fvg_2": "112.5"},
+                {"fvg_1": "100", "fvg_2": "112.5", "fvg_delta_1_2": "12.5"}]
+    assert main._key_factors_many(patients) == [legacy_key_factors(p) for p in patients]
+    assert main._key_factors_many(patients)[2] == ["FVG increase between visits (+12.5)"]
+
+
+def legacy_visit_matrix(model: TherapyModel, patients: list) -> np.ndarray:
+    """TherapyModel.visit_matrix before patient_features: one PatientData at a time."""
+    categories = {c: i for i, c in enumerate(model.layout["categories"])}
+    fields = [THERAPY_INPUT_FIELDS[c] for c in model.layout["numeric_columns"]]
+    n_onehot = len(categories)
+    X = np.zeros((len(patients), n_onehot + len(fields)), dtype=float)
+    for r, p in enumerate(patients):
+        X[r, categories[p.insulin_regimen]] = 1.0
+        X[r, n_onehot:] = [getattr(p, f) for f in fields]
+    X = np.repeat(X, 3, axis=0)
+    X[:, n_onehot + fields.index('hba1c1')] = [getattr(p, v) for p in patients for v in ("hba1c1", "hba1c2", "hba1c3")]
+    return X
+
+
+def legacy_pathlines(pipeline, patients: list) -> np.ndarray:
+    """The old pandas path: a 16-key dict per visit, HbA1c1 set to that visit's value."""
+    import pandas as pd
+
+    rows = []
+    for p in patients:
+        base = {col: getattr(p, attr) for col, attr in THERAPY_INPUT_FIELDS.items()}
+        for v in ("hba1c1", "hba1c2", "hba1c3"):
+            rows.append({**base, 'HbA1c1': getattr(p, v)})
+    positive = int(np.flatnonzero(pipeline.classes_ == 1)[0])
+    frame = pd.DataFrame(rows, columns=list(THERAPY_INPUT_FIELDS))
+    return pipeline.predict_proba(frame)[:, positive].reshape(len(patients), 3)
+
+
+def test_therapy_rows_match_the_old_builders(therapy_pipeline):
+    patients = [main.PatientData(**p) for p in therapy_payloads(40, seed=8)]
+    model = TherapyModel(therapy_pipeline)
+
+    np.testing.assert_array_equal(model.visit_matrix(patient_inputs(patients)), legacy_visit_matrix(model, patients))
+    np.testing.assert_allclose(model.predict_pathlines(patients), legacy_pathlines(therapy_pipeline, patients))
+
+
+def test_therapy_inputs_from_mysql_match_the_old_row_loader():
+    payloads = therapy_payloads(20, seed=9)
+    rows = []
+    for pid, p in enumerate(payloads):
+        p["hba1c_delta_1_2"] = p["reduction_percent"]  # both inputs come from patients.reduction_a
+        row = {"id": pid}
+        for col, src in patient_features.THERAPY_COLUMNS.items():
+            row[src] = Decimal(str(p[THERAPY_INPUT_FIELDS[col]])) if src != "insulin_regimen_type" \
+                else p["insulin_regimen"]
+        rows.append(row)
+
+    # The old load_therapy_patients: PatientData(**{field: float(row[column])}) per row
+    legacy = patient_inputs([
+        main.PatientData(**{attr: row[patient_features.THERAPY_COLUMNS[col]] if attr == "insulin_regimen"
+                            else float(row[patient_features.THERAPY_COLUMNS[col]])
+                            for col, attr in THERAPY_INPUT_FIELDS.items()})
+        for row in rows
+    ])
+    inputs = patient_features.therapy_inputs(patient_features.columns(rows))
+
+    assert inputs.keys() == legacy.keys()
+    for col in legacy:
+        np.testing.assert_array_equal(inputs[col], legacy[col])
+
+
+def test_risk_matrix_matches_the_old_cohort_builder():
+    rng = random.Random(5)
+    raw = [patient_features.RISK_COLUMNS.index(c) for c in ("hba1c_1st_visit", "hba1c_2nd_visit", "fvg_1", "fvg_2")]
+    rows = []
+    for row in risk_rows(50, seed=5):
+        values = [Decimal(f"{v:.4f}") for v in row]
+        for j in raw:  # Laravel saved the derived columns, some visits are NULL
+            if rng.random() < 0.1:
+                values[j] = None
+        rows.append(values)
+
+    # /risk-summary before patient_features
+    legacy = np.array([[np.nan if v is None else float(v) for v in row] for row in rows], dtype=float)
+    legacy_complete = ~np.isnan(legacy).any(axis=1)
+
+    M, complete = patient_features.risk_matrix(patient_features.columns(rows, patient_features.RISK_COLUMNS))
+    assert not legacy_complete.all()
+    assert complete.tolist() == legacy_complete.tolist()
+    np.testing.assert_array_equal(M, legacy)
+
+    rows[0][patient_features.RISK_COLUMNS.index("avg_fvg_1_2")] = None  # not saved: derived now, a gap before
+    assert patient_features.risk_matrix(patient_features.columns(rows[:1], patient_features.RISK_COLUMNS))[1][0]
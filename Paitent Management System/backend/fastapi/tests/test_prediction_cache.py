@@ -0,0 +1,159 @@
+import sqlite3
+
+import pytest
+
+import prediction_cache
+from conftest import risk_rows
+from prediction_cache import PredictionCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(prediction_cache, "time", clock)
+    return clock
+
+
+def test_key_depends_on_features_version_and_patient():
+    key = PredictionCache.make_key([7.1, 6.2], "risk_v1", 3)
+    assert key == PredictionCache.make_key([7.1000000001, 6.2], "risk_v1", 3)
+    assert key != PredictionCache.make_key([7.1, 6.2], "risk_v2", 3)
+    assert key != PredictionCache.make_key([7.1, 6.2], "risk_v1", 4)
+    assert key != PredictionCache.make_key([7.1, 6.2], "risk_v1")
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = PredictionCache(max_entries=2)
+    cache.set("a", 1.0)
+    cache.set("b", 2.0)
+    assert cache.get("a") == 1.0
+    cache.set("c", 3.0)
+    assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1.0, None, 3.0)
+    assert cache.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = PredictionCache(ttl=60)
+    cache.set("a", 1.0)
+    clock.now += 59
+    assert cache.get("a") == 1.0
+    clock.now += 2
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["expired"], stats["misses"], stats["size"]) == (1, 1, 1, 0)
+
+
+def test_invalidate_patient_drops_all_of_its_entries(clock):
+    cache = PredictionCache()
+    cache.set("p1-old", 7.0, patient_id=1)
+    cache.set("p1-new", 8.0, patient_id=1)
+    cache.set("p2", 9.0, patient_id=2)
+    cache.set("anon", 6.0)
+
+    cache.invalidate(patient_id=1)
+    assert (cache.get("p1-old"), cache.get("p1-new")) == (None, None)
+    assert (cache.get("p2"), cache.get("anon")) == (9.0, 6.0)
+
+    cache.invalidate(key="anon")
+    assert cache.get("anon") is None
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_sqlite_tier_rewarms_a_new_process(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    PredictionCache(sqlite_path=path).set("a", 7.25, patient_id=5)
+
+    restarted = PredictionCache(sqlite_path=path)
+    assert restarted.get("a") == 7.25
+    assert restarted.get("a") == 7.25
+    stats = restarted.stats()
+    assert (stats["l2_hits"], stats["hits"]) == (1, 1)
+
+
+def test_promoted_entry_keeps_its_original_expiry(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    PredictionCache(ttl=3600, sqlite_path=path).set("a", 7.25)
+    db = sqlite3.connect(path)
+    db.execute("UPDATE prediction_cache SET created_at = datetime('now', '-3000 seconds')")
+    db.commit()
+
+    cache = PredictionCache(ttl=3600, sqlite_path=path)
+    assert cache.get("a") == 7.25
+    remaining = cache._lru["a"][1] - clock.now
+    assert remaining == pytest.approx(600, abs=5)
+
+
+def test_expired_sqlite_entries_are_ignored(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    PredictionCache(ttl=60, sqlite_path=path).set("a", 7.25)
+    db = sqlite3.connect(path)
+    db.execute("UPDATE prediction_cache SET created_at = datetime('now', '-120 seconds')")
+    db.commit()
+
+    assert PredictionCache(ttl=60, sqlite_path=path).get("a") is None
+
+
+def test_invalidate_patient_clears_the_sqlite_tier(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    before = PredictionCache(sqlite_path=path)
+    before.set("p1", 7.0, patient_id=1)
+    before.set("p2", 8.0, patient_id=2)
+
+    # A new process knows nothing of patient 1 in memory, only on disk
+    after = PredictionCache(sqlite_path=path)
+    after.invalidate(patient_id=1)
+    assert PredictionCache(sqlite_path=path).get("p1") is None
+    assert PredictionCache(sqlite_path=path).get("p2") == 8.0
+
+
+def test_sqlite_file_without_patient_column_is_migrated(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE prediction_cache (key TEXT PRIMARY KEY, value REAL NOT NULL, "
+               "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+    db.execute("INSERT INTO prediction_cache (key, value) VALUES ('old', 6.5)")
+    db.commit()
+
+    cache = PredictionCache(sqlite_path=path)
+    assert cache.stats()["l2_enabled"]
+    assert cache.get("old") == 6.5
+    cache.set("new", 7.5, patient_id=3)
+    cache.invalidate(patient_id=3)
+    assert PredictionCache(sqlite_path=path).get("new") is None
+
+
+def test_predict_caches_per_patient_and_saves_the_score(api, fake_mysql):
+    features = risk_rows(1)[0].tolist()
+
+    anonymous = api.post("/predict", json={"features": features}).json()
+    assert not anonymous["cached"]
+    assert not any(q.startswith("UPDATE") for q, _ in fake_mysql.queries)
+
+    # The anonymous entry does not answer for a patient
+    first = api.post("/predict", json={"features": features, "patient_id": 7}).json()
+    assert not first["cached"]
+    (update,) = [params for q, params in fake_mysql.queries if q.startswith("UPDATE patients")]
+    assert update[-1] == 7
+
+    again = api.post("/predict", json={"features": features, "patient_id": 7}).json()
+    assert again["cached"] and again["prediction"] == first["prediction"]
+
+
+def test_new_score_for_a_patient_replaces_its_old_entry(api):
+    import main
+
+    old, new = (row.tolist() for row in risk_rows(2))
+    api.post("/predict", json={"features": old, "patient_id": 7})
+    api.post("/predict", json={"features": new, "patient_id": 7})
+
+    cache = main.get_prediction_cache()
+    assert cache.get(PredictionCache.make_key(old, "risk_v1", 7)) is None
+    assert cache.get(PredictionCache.make_key(new, "risk_v1", 7)) is not None
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from conftest import FakeAsyncGroq
+
+
+def test_answers_from_retrieved_context(rag):
+    result = asyncio.run(main.generate_rag_response_async("What lowers HbA1c?", patient_context="age: 60"))
+
+    assert result["response"] == "answer"
+    assert "chunk one\nchunk two" in result["context_used"]
+    assert "age: 60" in result["context_used"]
+    (call,) = rag.groq.calls
+    assert "What lowers HbA1c?" in call["messages"][0]["content"]
+    assert rag.openai.inputs == ["What lowers HbA1c?"]
+    # The synchronous vector store is queried off the event loop
+    assert rag.retriever.threads[0] != threading.current_thread().name
+
+
+def test_slow_llm_calls_overlap(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client", FakeAsyncGroq(delay=0.2))
+
+    async def many():
+        start = time.perf_counter()
+        await asyncio.gather(*(main.generate_rag_response_async(f"question {i}") for i in range(5)))
+        return time.perf_counter() - start
+
+    assert asyncio.run(many()) < 0.6
+
+
+def test_concurrency_is_capped(rag, monkeypatch):
+    groq = FakeAsyncGroq(delay=0.1)
+    monkeypatch.setattr(main, "_async_groq_client", groq)
+    monkeypatch.setattr(main, "RAG_MAX_CONCURRENCY", 2)
+    peak, running = [0], [0]
+    complete = main._groq_complete_async
+
+    async def tracked(*args, **kwargs):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        try:
+            return await complete(*args, **kwargs)
+        finally:
+            running[0] -= 1
+
+    monkeypatch.setattr(main, "_groq_complete_async", tracked)
+
+    async def many():
+        await asyncio.gather(*(main.generate_rag_response_async(f"question {i}") for i in range(5)))
+
+    asyncio.run(many())
+    assert peak[0] == 2 and len(groq.calls) == 5
+
+
+def test_llm_timeout_is_reported(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client", FakeAsyncGroq(delay=1))
+    monkeypatch.setattr(main, "RAG_LLM_TIMEOUT", 0.05)
+
+    result = asyncio.run(main.generate_rag_response_async("question"))
+
+    assert result == {"response": "❌ AI backend error: request timed out", "context_used": ""}
+
+
+def test_backend_errors_are_reported(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client", FakeAsyncGroq(fail=RuntimeError("rate limited")))
+
+    result = asyncio.run(main.generate_rag_response_async("question"))
+
+    assert result["response"] == "❌ AI backend error: rate limited"
+
+
+def test_client_disconnect_cancels_generation(rag, monkeypatch):
+    groq = FakeAsyncGroq(delay=5)
+    monkeypatch.setattr(main, "_async_groq_client", groq)
+
+    class GoneRequest:
+        async def is_disconnected(self):
+            return True
+
+    async def run():
+        with pytest.raises(HTTPException) as exc:
+            await main._cancel_on_disconnect(GoneRequest(), main.generate_rag_response_async("question"),
+                                             poll_interval=0.01)
+        await asyncio.sleep(0.01)  # let the cancellation reach the LLM call
+        return exc.value
+
+    assert asyncio.run(run()).status_code == 499
+    assert groq.cancelled == 1
+
+
+def test_treatment_recommendation_endpoint(rag):
+    response = TestClient(main.app).post(
+        "/treatment-recommendation", json={"patient": {"name": "A"}, "question": "Next step?"}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["response"] == "answer"
+    assert "name: A" in body["context_used"]
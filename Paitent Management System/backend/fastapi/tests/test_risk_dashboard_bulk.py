@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+import main
+from conftest import patient_record, risk_rows
+
+
+def saved_scores(rows: dict):
+    """``respond`` for latest_get_many: ``{patient_id: (score, version, age_seconds, feature_hash)}``."""
+    def respond(query, params):
+        if query.lstrip().startswith("SELECT id, last_risk_score"):
+            return [(pid, *rows[pid]) for pid in params if pid in rows]
+        return []
+    return respond
+
+
+def updates(conn) -> list:
+    return [params for query, params in conn.queries if query.startswith("UPDATE patients")]
+
+
+def test_scores_a_patient_list_in_one_pass(api, fake_mysql, ridge_pipeline):
+    X = risk_rows(5)
+    items = [{"patient_id": 10 + i, "features": row.tolist()} for i, row in enumerate(X)]
+
+    body = api.post("/risk-dashboard-bulk", json={"items": items}).json()
+
+    expected = ridge_pipeline.predict(X)
+    results = body["results"]
+    assert [r["patient_id"] for r in results] == [10, 11, 12, 13, 14]
+    np.testing.assert_allclose([r["prediction"] for r in results], expected)
+    assert [r["risk_label"] for r in results] == [main._risk_label(v) for v in expected]
+    assert not any(r["cached"] or r["stale"] for r in results)
+    selects = [q for q, _ in fake_mysql.queries if q.startswith("SELECT id, last_risk_score")]
+    assert len(selects) == 1 and len(updates(fake_mysql)) == 1
+    # One multi-row UPDATE carrying every fresh score
+    assert set(updates(fake_mysql)[0][-5:]) == {10, 11, 12, 13, 14}
+
+
+def test_second_load_is_served_from_the_prediction_cache(api, fake_mysql):
+    items = [{"patient_id": 10 + i, "features": row.tolist()} for i, row in enumerate(risk_rows(3))]
+    first = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+    fake_mysql.queries.clear()
+
+    second = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+
+    assert [r["prediction"] for r in second] == [r["prediction"] for r in first]
+    assert all(r["cached"] for r in second)
+    assert fake_mysql.queries == []
+
+
+def test_fresh_saved_scores_are_reused_and_only_misses_written(api, fake_mysql):
+    X = risk_rows(3)
+    fake_mysql.respond = saved_scores({20: (7.5, "risk_v1", 60, main.feature_hash(X[0].tolist()))})
+    items = [{"patient_id": 20 + i, "features": row.tolist()} for i, row in enumerate(X)]
+
+    results = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+
+    assert results[0]["prediction"] == 7.5 and results[0]["cached"] and not results[0]["stale"]
+    assert not results[1]["cached"] and not results[2]["cached"]
+    (written,) = updates(fake_mysql)
+    assert set(written[-2:]) == {21, 22}
+
+
+def test_features_are_built_from_patient_records(api, ridge_pipeline):
+    X = risk_rows(2)
+    items = [{"patient_id": 30 + i, "patient": patient_record(30 + i, row, fvg_delta_1_2=5)} for i, row in enumerate(X)]
+
+    results = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+
+    np.testing.assert_allclose([r["prediction"] for r in results], ridge_pipeline.predict(X))
+    assert all("FVG increase between visits (+5.0)" in r["key_factors"] for r in results)
+
+
+def test_incomplete_patient_record_is_rejected(api):
+    record = patient_record(40, risk_rows(1)[0])
+    del record["fvg_2"], record["avg_fvg_1_2"]
+
+    response = api.post("/risk-dashboard-bulk", json={"items": [{"patient_id": 40, "patient": record}]})
+
+    assert response.status_code == 422
+    assert "[40]" in response.json()["detail"]
+
+
+def test_force_recomputes_saved_scores(api, fake_mysql, ridge_pipeline):
+    X = risk_rows(1)
+    fake_mysql.respond = saved_scores({50: (7.5, "risk_v1", 60, main.feature_hash(X[0].tolist()))})
+
+    (result,) = api.post("/risk-dashboard-bulk?force=true",
+                         json={"items": [{"patient_id": 50, "features": X[0].tolist()}]}).json()["results"]
+
+    assert result["prediction"] == pytest.approx(ridge_pipeline.predict(X)[0])
+    assert not result["cached"]
+    assert len(updates(fake_mysql)) == 1
+
+
+def test_items_are_scored_with_their_own_model_version(api):
+    X = risk_rows(2)
+    items = [{"patient_id": 60, "features": X[0].tolist()},
+             {"patient_id": 61, "features": X[1].tolist(), "model_version": "risk_v2"}]
+
+    results = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+
+    assert [r["model_version"] for r in results] == ["risk_v1", "risk_v2"]
+
+
+def test_empty_list(api):
+    assert api.post("/risk-dashboard-bulk", json={"items": []}).json() == {"results": []}
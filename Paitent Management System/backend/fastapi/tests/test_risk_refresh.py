@@ -0,0 +1,175 @@
+import threading
+import time
+
+import pytest
+
+import main
+import metrics
+from conftest import metric_value, risk_rows
+
+
+def saved_score(score: float, age: float | None, fhash: str | None, version: str = "risk_v1"):
+    """``respond`` for latest_get/latest_get_many: every patient has the same saved score."""
+    def respond(query, params):
+        if query.startswith("SELECT last_risk_score"):
+            return [(score, version, age, fhash)]
+        if query.startswith("SELECT id, last_risk_score"):
+            return [(pid, score, version, age, fhash) for pid in params]
+        return []
+    return respond
+
+
+def wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def updates(conn) -> list:
+    return [params for query, params in conn.queries if query.startswith("UPDATE patients")]
+
+
+@pytest.fixture
+def features():
+    return risk_rows(1, seed=3)[0].tolist()
+
+
+def test_is_stale(features, monkeypatch):
+    monkeypatch.setattr(main, "RISK_SCORE_MAX_AGE", 3600)
+    monkeypatch.setattr(main, "_feature_hash_column", True)
+    fhash = main.feature_hash(features)
+
+    assert not main.is_stale(main.StoredScore(7.0, 60, fhash), features)
+    assert main.is_stale(main.StoredScore(7.0, 60, main.feature_hash([0.0] * 6)), features)
+    assert main.is_stale(main.StoredScore(7.0, 60, None), features)  # saved before hashes were kept
+    assert main.is_stale(main.StoredScore(7.0, 7200, fhash), features)
+    assert main.is_stale(main.StoredScore(7.0, None, fhash), features)  # never dated
+
+    monkeypatch.setattr(main, "RISK_SCORE_MAX_AGE", 0)
+    assert not main.is_stale(main.StoredScore(7.0, None, fhash), features)
+
+
+def test_without_the_hash_column_only_age_counts(features, monkeypatch):
+    monkeypatch.setattr(main, "RISK_SCORE_MAX_AGE", 3600)
+    monkeypatch.setattr(main, "_feature_hash_column", False)
+    assert not main.is_stale(main.StoredScore(7.0, 60, None), features)
+    assert main.is_stale(main.StoredScore(7.0, 7200, None), features)
+
+
+def test_stale_score_is_served_then_refreshed_in_the_background(api, fake_mysql, features, ridge_pipeline):
+    fake_mysql.respond = saved_score(9.9, 60, main.feature_hash([0.0] * 6))  # computed from other values
+    served = metric_value(metrics.RISK_STALE_SERVED)
+    req = {"features": features, "patient_id": 7}
+
+    first = api.post("/risk-dashboard", json=req).json()
+
+    assert (first["prediction"], first["cached"], first["stale"]) == (9.9, True, True)
+    assert first["risk_label"] == "Critical"
+    assert metric_value(metrics.RISK_STALE_SERVED) == served + 1
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 1)
+
+    (written,) = updates(fake_mysql)
+    fresh = float(ridge_pipeline.predict([features])[0])
+    assert written[-1] == 7 and written[1] == pytest.approx(fresh)  # CASE id WHEN 7 THEN <score>
+    assert main.feature_hash(features) in written
+    second = api.post("/risk-dashboard", json=req).json()
+    assert second["prediction"] == pytest.approx(fresh) and second["cached"] and not second["stale"]
+
+
+def test_old_scores_are_stale(api, fake_mysql, features, monkeypatch):
+    monkeypatch.setattr(main, "RISK_SCORE_MAX_AGE", 3600)
+    fake_mysql.respond = saved_score(6.0, 7200, main.feature_hash(features))
+
+    body = api.post("/risk-dashboard", json={"features": features, "patient_id": 8}).json()
+
+    assert body["stale"] and body["prediction"] == 6.0
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 1)
+
+
+def test_stale_scores_are_recomputed_inline_when_disabled(api, fake_mysql, features, monkeypatch, ridge_pipeline):
+    monkeypatch.setattr(main, "RISK_SWR_ENABLED", False)
+    fake_mysql.respond = saved_score(9.9, 60, None)
+
+    body = api.post("/risk-dashboard", json={"features": features, "patient_id": 9}).json()
+
+    assert not body["cached"] and not body["stale"]
+    assert body["prediction"] == pytest.approx(float(ridge_pipeline.predict([features])[0]))
+    assert len(updates(fake_mysql)) == 1 and main._risk_refresh_stats["scheduled"] == 0
+
+
+def test_bulk_refreshes_stale_rows_in_one_batch(api, fake_mysql, monkeypatch):
+    X = risk_rows(3, seed=4)
+    fake_mysql.respond = saved_score(8.0, 60, None)
+    batches = []
+    score = main._score_dashboard_items
+    monkeypatch.setattr(main, "_score_dashboard_items",
+                        lambda items, versions: batches.append([i.patient_id for i in items]) or score(items, versions))
+
+    items = [{"patient_id": 20 + i, "features": row.tolist()} for i, row in enumerate(X)]
+    results = api.post("/risk-dashboard-bulk", json={"items": items}).json()["results"]
+
+    assert all(r["stale"] and r["cached"] and r["prediction"] == 8.0 for r in results)
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 3)
+    assert batches == [[20, 21, 22]]
+    assert len(updates(fake_mysql)) == 1
+
+
+def item(pid: int, features) -> main.DashboardRequest:
+    return main.DashboardRequest(features=features, patient_id=pid)
+
+
+def test_patients_being_refreshed_are_not_scheduled_again(api, features, monkeypatch):
+    release = threading.Event()
+    calls = []
+
+    def slow(items, versions):
+        calls.append([i.patient_id for i in items])
+        release.wait(5)
+
+    monkeypatch.setattr(main, "_score_dashboard_items", slow)
+    main.schedule_risk_refresh([item(1, features)], ["risk_v1"])
+    main.schedule_risk_refresh([item(1, features), item(2, features)], ["risk_v1", "risk_v1"])
+    assert api.get("/health/risk-refresh").json()["in_flight"] == 2
+
+    release.set()
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 2)
+    assert sorted(calls) == [[1], [2]]
+    assert main._risk_refresh_stats["stale_served"] == 3
+
+
+def test_refreshed_patients_cool_down(api, features, monkeypatch):
+    monkeypatch.setattr(main, "_score_dashboard_items", lambda items, versions: None)
+    cooled = metric_value(metrics.RISK_REFRESHES, result="cooldown")
+
+    main.schedule_risk_refresh([item(1, features)], ["risk_v1"])
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 1)
+    # e.g. the refresh's write was dropped, so MySQL still holds the stale score
+    main.schedule_risk_refresh([item(1, features)], ["risk_v1"])
+    main.schedule_risk_refresh([item(1, features)], ["risk_v2"])  # other versions are separate
+
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 2)
+    assert main._risk_refresh_stats["cooldown_skipped"] == 1
+    assert metric_value(metrics.RISK_REFRESHES, result="cooldown") == cooled + 1
+
+    monkeypatch.setattr(main, "RISK_REFRESH_COOLDOWN", 0)
+    main.schedule_risk_refresh([item(1, features)], ["risk_v1"])
+    wait_for(lambda: main._risk_refresh_stats["refreshed"] == 3)
+
+
+def test_failed_refresh_is_counted_and_released(api, features, monkeypatch, capsys):
+    def fail(items, versions):
+        raise RuntimeError("MySQL unavailable")
+
+    monkeypatch.setattr(main, "_score_dashboard_items", fail)
+    failed = metric_value(metrics.RISK_REFRESHES, result="failed")
+
+    main.schedule_risk_refresh([item(1, features), item(None, features)], ["risk_v1", "risk_v1"])
+    wait_for(lambda: main._risk_refresh_stats["failed"] == 1)
+
+    stats = api.get("/health/risk-refresh").json()
+    assert stats["enabled"] and stats["in_flight"] == 0
+    assert stats["scheduled"] == 1 and stats["stale_served"] == 2  # rows without a patient are not refreshed
+    assert stats["cooldown_seconds"] == main.RISK_REFRESH_COOLDOWN and stats["write_behind_dropped"] == 0
+    assert metric_value(metrics.RISK_REFRESHES, result="failed") == failed + 1
+    assert "Background refresh failed: MySQL unavailable" in capsys.readouterr().out
@@ -0,0 +1,172 @@
+import datetime
+import random
+
+import numpy as np
+import pytest
+
+import main
+from conftest import risk_rows
+from risk_summary import UNASSIGNED, RiskSummary
+
+
+def summary() -> RiskSummary:
+    return RiskSummary("risk_v1", main._risk_label, main.RISK_LABELS)
+
+
+def test_update_moves_a_patient_between_buckets():
+    s = summary()
+    s.update(1, 5.0, doctor_id=7, name="Ana")
+    s.update(2, 9.5, doctor_id=7)
+    s.update(3, 6.0)
+
+    s.update(1, 8.0)  # doctor and name are kept
+
+    snap = s.snapshot()
+    assert snap["total"] == 3
+    assert snap["distribution"] == {"Normal": 0, "At Risk": 1, "Moderate Risk": 0, "Risky": 1,
+                                    "Very Risky": 0, "Critical": 1}
+    assert snap["by_doctor"][7]["total"] == 2 and snap["by_doctor"][7]["mean_prediction"] == 8.75
+    assert snap["by_doctor"][UNASSIGNED]["distribution"]["At Risk"] == 1
+    assert snap["top_risk"][1] == {"patient_id": 1, "name": "Ana", "prediction": 8.0, "risk_label": "Risky",
+                                   "assigned_doctor_id": 7}
+    assert snap["top_risk"][2]["assigned_doctor_id"] is None
+
+
+def test_discard_drops_empty_doctor_buckets():
+    s = summary()
+    s.update(1, 5.0, doctor_id=7)
+    s.update(2, 6.0)
+
+    s.discard(1)
+    s.discard(99)
+
+    assert 1 not in s and 2 in s
+    assert list(s.snapshot()["by_doctor"]) == [UNASSIGNED]
+
+
+def test_snapshot_for_one_doctor_with_scores():
+    s = summary()
+    for pid, score, doctor in ((1, 5.0, 7), (2, 9.5, 7), (3, 9.9, 8), (4, 6.0, 7)):
+        s.update(pid, score, doctor_id=doctor)
+
+    snap = s.snapshot(top_n=2, doctor_id=7, include_scores=True)
+
+    assert [p["patient_id"] for p in snap["top_risk"]] == [2, 4]
+    assert snap["total"] == 3 and list(snap["by_doctor"]) == [7]
+    assert sorted(zip(snap["scores"]["patient_id"], snap["scores"]["risk_label"])) == [
+        (1, "Normal"), (2, "Critical"), (4, "At Risk")]
+    assert s.snapshot(doctor_id=99)["total"] == 0
+
+
+def test_incremental_updates_match_a_rebuild():
+    rng = random.Random(0)
+    s = summary()
+    final = {}
+    for _ in range(2000):
+        pid = rng.randrange(200)
+        if rng.random() < 0.1:
+            s.discard(pid)
+            final.pop(pid, None)
+            continue
+        doctor = final[pid][1] if pid in final else rng.choice([None, 1, 2, 3])
+        score = rng.uniform(4, 12)
+        s.update(pid, score, doctor_id=doctor)
+        final[pid] = (score, doctor)
+
+    rebuilt = summary()
+    for pid, (score, doctor) in final.items():
+        rebuilt.update(pid, score, doctor_id=doctor)
+
+    got, want = s.snapshot(top_n=20), rebuilt.snapshot(top_n=20)
+    assert got["distribution"] == want["distribution"] and got["top_risk"] == want["top_risk"]
+    assert got["by_doctor"].keys() == want["by_doctor"].keys()
+    for doctor, bucket in want["by_doctor"].items():
+        assert got["by_doctor"][doctor]["distribution"] == bucket["distribution"]
+        assert got["by_doctor"][doctor]["mean_prediction"] == pytest.approx(bucket["mean_prediction"])
+
+
+NOW = datetime.datetime(2026, 10, 18, 12, 0, 0)
+
+
+@pytest.fixture
+def cohort(fake_mysql):
+    """Six patients: 1-2 with fresh saved scores, 3-4 without, 5 saved from other values, 6 incomplete."""
+    X = risk_rows(6, seed=9)
+    saved = {1: 9.4, 2: 5.1, 5: 8.8}
+    rows = []
+    for pid, features in enumerate(X, start=1):
+        fhash = main.feature_hash(features.tolist()) if pid != 5 else "other"
+        stored = (saved[pid], "risk_v1", 60, fhash) if pid in saved else (None, None, None, None)
+        values = [None] + features.tolist()[1:] if pid == 6 else features.tolist()
+        rows.append((pid, f"Patient {pid}", 7 if pid % 2 else None, *values, *stored))
+
+    def respond(query, params):
+        if query == "SELECT NOW()":
+            return [(NOW,)]
+        if query.startswith("SELECT id, name, assigned_doctor_id"):
+            return rows
+        return []
+
+    fake_mysql.respond = respond
+    return X
+
+
+def test_summary_is_built_in_one_scan(api, fake_mysql, cohort, ridge_pipeline):
+    body = api.get("/risk-summary?scores=true").json()
+
+    fresh = ridge_pipeline.predict(cohort[[2, 3, 4]])
+    scores = dict(zip(body["scores"]["patient_id"], body["scores"]["prediction"]))
+    assert scores[1] == 9.4 and scores[2] == 5.1
+    np.testing.assert_allclose([scores[3], scores[4], scores[5]], fresh)
+    assert body["total"] == 5 and body["unscored"] == 1
+    assert body["top_risk"][0] == {"patient_id": 1, "name": "Patient 1", "prediction": 9.4,
+                                   "risk_label": "Critical", "assigned_doctor_id": 7}
+    assert set(body["by_doctor"]) == {"7", UNASSIGNED}
+
+    queries = [q for q, _ in fake_mysql.queries]
+    assert queries[0] == "SELECT NOW()"
+    assert queries[1] == ("SELECT id, name, assigned_doctor_id, " + ", ".join(main.patient_features.RISK_COLUMNS)
+                          + ", last_risk_score, risk_model_version, TIMESTAMPDIFF(SECOND, last_predicted_at, NOW()),"
+                          " risk_feature_hash FROM patients")
+    ((update, params),) = [(q, p) for q, p in fake_mysql.queries if q.startswith("UPDATE patients")]
+    assert set(params[-3:]) == {3, 4, 5}  # only the patients scored fresh are saved
+    assert main._risk_summaries["risk_v1"].db_watermark == NOW
+
+
+def test_summary_is_served_from_memory_until_refreshed(api, fake_mysql, cohort):
+    api.get("/risk-summary")
+    fake_mysql.queries.clear()
+
+    assert api.get("/risk-summary?doctor_id=7").json()["total"] == 3  # patients 1, 3 and 5
+    assert fake_mysql.queries == []
+
+    api.get("/risk-summary?refresh=true")
+    assert len([q for q, _ in fake_mysql.queries if q.startswith("SELECT id, name, assigned_doctor_id")]) == 1
+
+
+def test_new_scores_update_the_summary(api, cohort):
+    api.get("/risk-summary")
+    features = risk_rows(1, seed=10)[0].tolist()
+
+    prediction = api.post("/predict", json={"features": features, "patient_id": 1}).json()["prediction"]
+    api.post("/predict", json={"features": features, "patient_id": 42})  # not in the cohort yet
+
+    body = api.get("/risk-summary?scores=true").json()
+    scores = dict(zip(body["scores"]["patient_id"], body["scores"]["prediction"]))
+    assert scores[1] == prediction and 42 not in scores
+    assert body["by_doctor"]["7"]["distribution"][main._risk_label(prediction)] >= 1
+
+
+def test_note_risk_scores_ignores_other_versions(api, cohort):
+    api.get("/risk-summary")
+    main.note_risk_scores([(1, 5.0, "Normal", "risk_v2", None)])
+    assert main._risk_summaries["risk_v1"].snapshot(include_scores=True)["scores"]["prediction"][0] == 9.4
+
+
+def test_mysql_failure_is_a_500(api, monkeypatch):
+    def unavailable():
+        raise RuntimeError("MySQL unavailable")
+
+    monkeypatch.setattr(main, "load_risk_cohort", unavailable)
+    response = api.get("/risk-summary")
+    assert response.status_code == 500 and "MySQL unavailable" in response.json()["detail"]
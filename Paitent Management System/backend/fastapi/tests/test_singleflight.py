@@ -0,0 +1,177 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import main
+import metrics
+from conftest import FakeAsyncGroq, FakeGroq, metric_value, risk_rows, therapy_payloads
+from singleflight import SingleFlight, digest
+
+
+def together(n: int, fn) -> list:
+    """Call ``fn()`` from ``n`` threads at once."""
+    barrier = threading.Barrier(n)
+
+    def one(_):
+        barrier.wait()
+        try:
+            return fn()
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(n) as pool:
+        return list(pool.map(one, range(n)))
+
+
+def test_followers_get_the_leaders_result():
+    flight = SingleFlight()
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"score": 7.1}
+
+    leaders = metric_value(metrics.SINGLEFLIGHT_REQUESTS, endpoint="sf-test", role="leader")
+    results = together(6, lambda: flight.do(("sf-test", 1), work))
+
+    assert calls == [1]
+    assert all(r is results[0] for r in results)
+    assert flight.stats() == {"in_flight": 0, "leaders": 1, "followers": 5}
+    assert metric_value(metrics.SINGLEFLIGHT_REQUESTS, endpoint="sf-test", role="leader") == leaders + 1
+
+
+def test_followers_get_the_leaders_exception():
+    flight = SingleFlight()
+
+    def work():
+        time.sleep(0.2)
+        raise RuntimeError("MySQL unavailable")
+
+    results = together(4, lambda: flight.do(("sf-test", 2), work))
+
+    assert all(isinstance(r, RuntimeError) and str(r) == "MySQL unavailable" for r in results)
+    assert flight.stats()["leaders"] == 1
+
+
+def test_nothing_is_kept_after_the_call():
+    flight = SingleFlight()
+    calls = []
+    flight.do(("sf-test", 3), lambda: calls.append(1))
+    flight.do(("sf-test", 3), lambda: calls.append(1))
+    flight.do(("sf-test", 4), lambda: calls.append(1))
+    assert len(calls) == 3 and flight.stats()["followers"] == 0
+
+
+def test_digest_ignores_dict_order():
+    assert digest({"a": 1, "b": 2}, [1.0]) == digest({"b": 2, "a": 1}, [1.0])
+    assert digest([1.0, 2.0]) != digest([2.0, 1.0])
+
+
+class Job:
+    """A coroutine factory that records runs and cancellations."""
+
+    def __init__(self, delay=0.1, result="done"):
+        self.delay, self.result = delay, result
+        self.runs = 0
+        self.cancelled = 0
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+
+def test_async_callers_share_one_run():
+    flight, job = SingleFlight(), Job()
+
+    async def run():
+        return await asyncio.gather(*(flight.do_async(("sf-test", 5), job) for _ in range(5)))
+
+    assert asyncio.run(run()) == ["done"] * 5
+    assert job.runs == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_one_cancelled_waiter_does_not_cancel_the_others():
+    flight, job = SingleFlight(), Job()
+
+    async def run():
+        gone = asyncio.ensure_future(flight.do_async(("sf-test", 6), job))
+        stays = asyncio.ensure_future(flight.do_async(("sf-test", 6), job))
+        await asyncio.sleep(0.01)
+        gone.cancel()
+        return await stays, gone.cancelled()
+
+    assert asyncio.run(run()) == ("done", True)
+    assert (job.runs, job.cancelled) == (1, 0)
+
+
+def test_work_is_cancelled_when_every_waiter_is_gone():
+    flight, job = SingleFlight(), Job(delay=5)
+
+    async def run():
+        waiters = [asyncio.ensure_future(flight.do_async(("sf-test", 7), job)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        for w in waiters:
+            w.cancel()
+        await asyncio.gather(*waiters, return_exceptions=True)
+        await asyncio.sleep(0.01)  # let the cancellation reach the shared task
+
+    asyncio.run(run())
+    assert job.cancelled == 1 and flight.stats()["in_flight"] == 0
+
+
+def test_double_clicked_recalculate_predicts_and_saves_once(api, fake_mysql, monkeypatch):
+    predicts = []
+    predict = main.predict_risk_row
+
+    def slow_predict(features, version):
+        predicts.append(version)
+        time.sleep(0.2)
+        return predict(features, version)
+
+    monkeypatch.setattr(main, "predict_risk_row", slow_predict)
+    req = {"features": risk_rows(1)[0].tolist(), "patient_id": 12}
+
+    results = together(4, lambda: main.risk_dashboard(main.DashboardRequest(**req), force=True))
+
+    assert len(predicts) == 1
+    assert len({r["prediction"] for r in results}) == 1
+    assert len([q for q, _ in fake_mysql.queries if q.startswith("UPDATE patients")]) == 1
+
+
+def test_identical_pathline_requests_share_one_llm_call(api, monkeypatch):
+    groq = FakeGroq("Stay the course.")
+    reply = groq.create
+    groq.create = lambda **kwargs: (time.sleep(0.2), reply(**kwargs))[1]
+    monkeypatch.setattr(main, "get_groq_client", lambda: groq)
+    data = therapy_payloads(1)[0]
+
+    results = together(3, lambda: main.predict_therapy_pathline(main.PatientData(**data)))
+
+    assert len(groq.calls) == 1
+    assert [r["insight"] for r in results] == ["Stay the course."] * 3
+
+
+def test_identical_rag_questions_share_one_pipeline(rag, monkeypatch):
+    groq = FakeAsyncGroq(delay=0.1)
+    monkeypatch.setattr(main, "_async_groq_client", groq)
+
+    async def run():
+        return await asyncio.gather(*(main.generate_rag_response_async("What lowers HbA1c?") for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert [r["response"] for r in results] == ["answer"] * 4
+    assert len(groq.calls) == 1 and len(rag.retriever.queries) == 1
+
+
+def test_coalescing_can_be_turned_off(monkeypatch):
+    monkeypatch.setattr(main, "SINGLEFLIGHT_ENABLED", False)
+    calls = []
+    together(3, lambda: main.coalesce(("sf-test", 8), lambda: (calls.append(1), time.sleep(0.05))))
+    assert len(calls) == 3
@@ -0,0 +1,59 @@
+import json
+import os
+import subprocess
+import sys
+
+import main
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_main(code: str, **env) -> dict:
+    """Import main in a fresh interpreter and return the JSON printed by ``code``."""
+    proc = subprocess.run([sys.executable, "-c", f"import json, sys, main\n{code}"], cwd=HERE,
+                          capture_output=True, text=True, env={**os.environ, **env}, check=True)
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def test_risk_only_instance_skips_the_other_feature_groups():
+    out = run_main(
+        "print(json.dumps({'paths': sorted(r.path for r in main.app.routes),"
+        " 'modules': [m for m in main.HEAVY_MODULES if m in sys.modules]}))",
+        FEATURES="risk",
+    )
+
+    assert "/predict" in out["paths"] and "/risk-summary" in out["paths"]
+    assert "/health" in out["paths"] and "/ready" in out["paths"]
+    for path in ("/chatbot-patient-query", "/rag", "/health/embedding-cache", "/predict-therapy-pathline"):
+        assert path not in out["paths"]
+    assert not {"groq", "openai", "pinecone", "torch", "sentence_transformers"} & set(out["modules"])
+
+
+def test_default_warmup_follows_the_enabled_features():
+    out = run_main("print(json.dumps(main._warmup_names()))", FEATURES="therapy,rag", WARMUP_RESOURCES="")
+    assert out == ["therapy"]
+
+
+def test_profile_reports_imports_and_resource_loads(api, monkeypatch):
+    monkeypatch.setattr(main, "_warmup", {"started": False, "done": False, "resources": {}})
+    report = main.profile_startup(top=5, resources=["ridge", "unknown"])
+
+    assert report["import_total_ms"] > 0
+    assert len(report["top_modules"]) == 5
+    assert {"module", "self_ms", "cumulative_ms"} <= set(report["top_modules"][0])
+    modules = [m["self_ms"] for m in report["top_modules"]]
+    assert modules == sorted(modules, reverse=True)
+    assert len(report["top_packages"]) == 5 and "package" in report["top_packages"][0]
+    assert report["resources"]["ridge"]["status"] == "ready"
+    assert "unknown" not in report["resources"]
+
+
+def test_boot_report_is_printed_after_warmup(api, monkeypatch, capsys):
+    monkeypatch.setattr(main, "_warmup", {"started": False, "done": False, "resources": {}})
+    monkeypatch.setenv("PROFILE_STARTUP", "1")
+
+    main.run_warmup(["ridge"])
+
+    out = capsys.readouterr().out
+    assert "[STARTUP] main.py import:" in out
+    assert "[STARTUP] load ridge" in out
@@ -0,0 +1,115 @@
+import json
+import random
+import re
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from conftest import FakeAsyncGroq, FakeGroq, therapy_payloads
+from main import ThinkStripper
+
+SAMPLES = [
+    "<think>plan the answer</think>\n\nHbA1c is **improving**.",
+    "No reasoning here, a < b and c > d.",
+    "Before <think>one</think> middle <think>two</think> after",
+    "<think>never closed",
+    "Answer with a trailing partial tag <thi",
+    "  <think></think>  padded  ",
+    "</think> stray close tag stays",
+]
+
+
+def non_streaming(text: str) -> str:
+    """What the non-streaming endpoints show for a full reply."""
+    text = re.sub(r"<think>.*?(</think>|$)", "", text, flags=re.S)
+    return text.strip()
+
+
+def stream(text: str, cuts) -> str:
+    stripper = ThinkStripper()
+    bounds = [0, *sorted(cuts), len(text)]
+    return "".join(stripper.feed(text[a:b]) for a, b in zip(bounds, bounds[1:])) + stripper.flush()
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_every_single_split_matches_the_full_reply(text):
+    expected = non_streaming(text)
+    for cut in range(len(text) + 1):
+        assert stream(text, [cut]) == expected, cut
+
+
+@pytest.mark.parametrize("text", SAMPLES)
+def test_character_by_character(text):
+    assert stream(text, range(1, len(text))) == non_streaming(text)
+
+
+def test_random_chunkings():
+    rng = random.Random(0)
+    for _ in range(200):
+        text = "".join(rng.choice(["<think>", "</think>", "<", ">", "think", " word", "\n"]) for _ in range(12))
+        cuts = rng.sample(range(1, len(text)), k=min(len(text) - 1, rng.randint(0, 6)))
+        assert stream(text, cuts) == non_streaming(text), (text, cuts)
+
+
+def sse_events(response) -> list[tuple[str, dict]]:
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_chatbot_stream_sends_visible_tokens_then_context(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client",
+                        FakeAsyncGroq(chunks=["<thi", "nk>hmm</th", "ink>\n\nHello", " there"]))
+
+    response = TestClient(main.app).post("/chatbot-patient-query/stream",
+                                         json={"patient": {"name": "A"}, "query": "How am I doing?"})
+
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = sse_events(response)
+    assert "".join(d["text"] for e, d in events if e == "token") == "Hello there"
+    assert [e for e, _ in events][-2:] == ["context", "done"]
+    assert "chunk one" in events[-2][1]["context_used"]
+
+
+def test_stream_failure_is_an_error_event_after_the_partial_answer(rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client",
+                        FakeAsyncGroq(chunks=["Partial"], fail=RuntimeError("connection reset")))
+
+    events = sse_events(TestClient(main.app).post(
+        "/treatment-recommendation/stream", json={"patient": {"name": "A"}, "question": "Next step?"}
+    ))
+
+    assert events[0] == ("token", {"text": "Partial"})
+    assert events[-1] == ("error", {"detail": "❌ AI backend error: connection reset"})
+    assert "done" not in [e for e, _ in events]
+
+
+def test_repeated_question_is_streamed_from_the_answer_cache(rag, monkeypatch):
+    groq = FakeAsyncGroq(chunks=["Hello", " there"])
+    monkeypatch.setattr(main, "_async_groq_client", groq)
+    client = TestClient(main.app)
+    body = {"patient": {"name": "A"}, "query": "How am I doing?"}
+
+    client.post("/chatbot-patient-query/stream", json=body)
+    events = sse_events(client.post("/chatbot-patient-query/stream", json=body))
+
+    assert events[0] == ("token", {"text": "Hello there"})
+    assert events[-1] == ("done", {"cached": True})
+    assert len(groq.calls) == 1
+
+
+def test_therapy_stream_sends_the_prediction_first(api, rag, monkeypatch):
+    monkeypatch.setattr(main, "_async_groq_client", FakeAsyncGroq(chunks=["Looks ", "good"]))
+    payload = therapy_payloads(1)[0]
+    monkeypatch.setattr(main, "get_groq_client", lambda: FakeGroq("Looks good"))
+    expected = api.post("/predict-therapy-pathline", json=payload).json()["probabilities"]
+
+    events = sse_events(api.post("/predict-therapy-pathline/stream", json=payload))
+
+    assert events[0][0] == "prediction"
+    assert events[0][1]["probabilities"] == expected
+    assert "".join(d["text"] for e, d in events if e == "token") == "Looks good"
+    assert events[-1] == ("done", {})
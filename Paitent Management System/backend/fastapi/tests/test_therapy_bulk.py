@@ -0,0 +1,118 @@
+import numpy as np
+import pytest
+
+import main
+import metrics
+import patient_features
+from conftest import FakeAsyncGroq, therapy_payloads
+from therapy_model import THERAPY_INPUT_FIELDS, TherapyModel
+
+
+def pathlines(pipeline, payloads) -> np.ndarray:
+    return np.round(TherapyModel(pipeline).predict_pathlines([main.PatientData(**p) for p in payloads]), 3)
+
+
+def db_row(pid: int, payload: dict) -> dict:
+    """The patients row a payload corresponds to (``THERAPY_COLUMNS`` sources)."""
+    row = {"id": pid}
+    for col, src in patient_features.THERAPY_COLUMNS.items():
+        row[src] = payload[THERAPY_INPUT_FIELDS[col]]
+    return row
+
+
+@pytest.fixture
+def payloads():
+    out = therapy_payloads(6, seed=4)
+    for p in out:  # both inputs come from patients.reduction_a
+        p["hba1c_delta_1_2"] = p["reduction_percent"]
+    return out
+
+
+@pytest.fixture
+def no_llm(monkeypatch):
+    def fail():
+        raise AssertionError("the LLM must not be called")
+    monkeypatch.setattr(main, "get_async_groq_client", fail)
+    monkeypatch.setattr(main, "get_groq_client", fail)
+
+
+def test_inline_patients_are_scored_in_one_pass_without_the_llm(api, therapy_pipeline, payloads, no_llm, monkeypatch):
+    calls = []
+    predict_inputs = TherapyModel.predict_inputs
+    monkeypatch.setattr(TherapyModel, "predict_inputs",
+                        lambda self, inputs: calls.append(1) or predict_inputs(self, inputs))
+
+    body = api.post("/predict-therapy-bulk", json={"patients": payloads}).json()
+    assert calls == [1]
+
+    expected = pathlines(therapy_pipeline, payloads)
+    assert body["count"] == 6
+    assert body["index"] == list(range(6)) and body["patient_id"] == [None] * 6
+    assert body["model_version"] == ["therapy_v1"] * 6
+    assert np.column_stack([body["visit_1"], body["visit_2"], body["visit_3"]]).tolist() == expected.tolist()
+    assert body["skipped"] == [] and "insight" not in body
+
+
+def test_patients_are_loaded_from_mysql(api, fake_mysql, therapy_pipeline, payloads, no_llm):
+    rows = {10: db_row(10, payloads[0]), 11: db_row(11, payloads[1]), 12: db_row(12, payloads[2])}
+    rows[11]["hba1c_3rd_visit"] = None
+    rows[12]["insulin_regimen_type"] = None
+    fake_mysql.respond = lambda query, params: [rows[pid] for pid in params if pid in rows]
+
+    body = api.post("/predict-therapy-bulk",
+                    json={"patients": [payloads[3]], "patient_ids": [10, 11, 12, 13, 10]}).json()
+
+    assert body["patient_id"] == [None, 10] and body["index"] == [0, None]
+    assert body["visit_1"] == pathlines(therapy_pipeline, [payloads[3], payloads[0]])[:, 0].tolist()
+    assert body["skipped"] == [
+        {"patient_id": 13, "index": None, "reason": "not found"},
+        {"patient_id": 11, "index": None, "reason": "missing hba1c_3rd_visit"},
+        {"patient_id": 12, "index": None, "reason": "missing insulin_regimen_type"},
+    ]
+    selects = [params for query, params in fake_mysql.queries if query.startswith("SELECT id,")]
+    assert selects == [(10, 11, 12, 13)]
+
+
+def test_unknown_regimen_is_skipped(api, payloads, no_llm):
+    payloads[1]["insulin_regimen"] = "Pump"
+
+    body = api.post("/predict-therapy-bulk", json={"patients": payloads[:3]}).json()
+
+    assert body["index"] == [0, 2]
+    assert body["skipped"] == [{"patient_id": None, "index": 1, "reason": "unknown insulin regimen 'Pump'"}]
+
+
+def test_patients_can_pin_a_model_version(api, payloads, no_llm):
+    payloads[0]["model_version"] = "therapy_v2"
+
+    body = api.post("/predict-therapy-bulk", json={"patients": payloads[:2]}).json()
+    assert body["model_version"] == ["therapy_v2", "therapy_v1"]
+
+    unknown = api.post("/predict-therapy-bulk", json={"patients": payloads[1:2], "model_version": "therapy_v9"})
+    assert unknown.json()["model_version"] == ["therapy_v1"]  # served by the routed version
+
+
+def test_insight_on_request(api, rag, payloads, monkeypatch):
+    groq = FakeAsyncGroq(reply="<think>hmm</think> Keep going.")
+    monkeypatch.setattr(main, "_async_groq_client", groq)
+    timed = metrics.STAGE_LATENCY._values.get(("llm_completion",), {}).get("count", 0)
+
+    body = api.post("/predict-therapy-bulk", json={"patients": payloads[:2], "insight": True}).json()
+
+    assert body["insight"] == ["Keep going.", "Keep going."]
+    assert len(groq.calls) == 2
+    assert metrics.STAGE_LATENCY._values[("llm_completion",)]["count"] == timed + 2  # once per completion
+
+
+def test_mysql_failure_is_a_503(api, monkeypatch):
+    def unavailable(ids):
+        raise RuntimeError("MySQL unavailable")
+    monkeypatch.setattr(main, "load_therapy_inputs", unavailable)
+
+    response = api.post("/predict-therapy-bulk", json={"patient_ids": [1]})
+    assert response.status_code == 503 and "MySQL unavailable" in response.json()["detail"]
+
+
+def test_empty_request(api):
+    body = api.post("/predict-therapy-bulk", json={}).json()
+    assert body["count"] == 0 and body["visit_1"] == [] and body["skipped"] == []
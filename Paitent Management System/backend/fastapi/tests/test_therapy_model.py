@@ -0,0 +1,126 @@
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from conftest import FakeGroq, therapy_payloads
+from therapy_model import THERAPY_INPUT_FIELDS, THERAPY_VISITS, TherapyModel, patient_inputs
+
+
+def reference_pathlines(pipeline, payloads) -> np.ndarray:
+    """One sklearn row per visit with HbA1c1 set to that visit, as the per-visit loop did."""
+    rows = []
+    for p in payloads:
+        base = {col: p[attr] for col, attr in THERAPY_INPUT_FIELDS.items()}
+        for visit in ("hba1c1", "hba1c2", "hba1c3"):
+            rows.append({**base, "HbA1c1": p[visit]})
+    classifier = pipeline.named_steps["classifier"]
+    positive = int(np.flatnonzero(classifier.classes_ == 1)[0])
+    return pipeline.predict_proba(pd.DataFrame(rows))[:, positive].reshape(len(payloads), len(THERAPY_VISITS))
+
+
+@pytest.fixture
+def patients():
+    return [main.PatientData(**p) for p in therapy_payloads(20)]
+
+
+def test_pathlines_match_per_visit_predictions(therapy_pipeline, patients):
+    tm = TherapyModel(therapy_pipeline)
+    assert tm.layout is not None
+
+    got = tm.predict_pathlines(patients)
+
+    assert got.shape == (20, 3)
+    np.testing.assert_allclose(got, reference_pathlines(therapy_pipeline, [p.model_dump() for p in patients]))
+
+
+def test_dataframe_fallback_matches(therapy_pipeline, patients):
+    tm = TherapyModel(therapy_pipeline)
+    tm.layout = None
+    np.testing.assert_allclose(tm.predict_pathlines(patients),
+                               reference_pathlines(therapy_pipeline, [p.model_dump() for p in patients]))
+
+
+def test_visit_matrix_repeats_each_patient_per_visit(therapy_pipeline, patients):
+    tm = TherapyModel(therapy_pipeline)
+    X = tm.visit_matrix(patient_inputs(patients[:1]))
+    n_onehot = len(tm.layout["categories"])
+    hba1c1 = n_onehot + tm.layout["numeric_columns"].index("HbA1c1")
+    assert X.shape == (3, len(tm.feature_names))
+    assert X[:, :n_onehot].sum(axis=1).tolist() == [1, 1, 1]
+    assert X[:, hba1c1].tolist() == [patients[0].hba1c1, patients[0].hba1c2, patients[0].hba1c3]
+
+
+def test_no_patients(therapy_pipeline):
+    assert TherapyModel(therapy_pipeline).predict_pathlines([]).shape == (0, 3)
+
+
+def test_pathline_endpoint_scores_and_strips_reasoning(api, monkeypatch, therapy_pipeline):
+    groq = FakeGroq("<think>working it out</think>\n### 📋 Insights\n- ok")
+    monkeypatch.setattr(main, "get_groq_client", lambda: groq)
+    payload = therapy_payloads(1)[0]
+
+    body = api.post("/predict-therapy-pathline", json=payload).json()
+
+    expected = reference_pathlines(therapy_pipeline, [payload])[0]
+    assert body["probabilities"] == [round(float(p), 3) for p in expected]
+    assert body["insight"] == "### 📋 Insights\n- ok"
+    assert body["model_version"] == "therapy_v1"
+    assert len(groq.calls) == 1
+
+
+def test_importances_are_sorted_once_at_load(therapy_pipeline):
+    tm = TherapyModel(therapy_pipeline, top_n=3)
+    importances = therapy_pipeline.named_steps["classifier"].feature_importances_
+    names = [str(n) for n in therapy_pipeline.named_steps["preprocessor"].get_feature_names_out()]
+
+    assert [score for _, score in tm.sorted_importances] == sorted(importances, reverse=True)
+    assert dict(tm.sorted_importances) == dict(zip(names, importances))
+    assert tm.top_factors == [{"feature": n, "importance": round(s, 4)} for n, s in tm.sorted_importances[:3]]
+    assert tm.positive_index == 1
+
+
+def test_compiled_forest_carries_the_same_metadata(therapy_pipeline, model_dir):
+    from forest_model import CompiledForest
+
+    forest_only = TherapyModel(forest=CompiledForest(str(model_dir / "therapy_v2" / "forest")))
+    assert forest_only.top_factors == TherapyModel(therapy_pipeline).top_factors
+    assert forest_only.explain_unavailable() == "the therapy pickle is not loaded (THERAPY_LOAD_PICKLE=false)"
+    assert forest_only.local_factors(main.PatientData(**therapy_payloads(1)[0])) is None
+
+
+def test_local_factors_explain_the_latest_visit(therapy_pipeline, patients):
+    pytest.importorskip("shap")
+    tm = TherapyModel(therapy_pipeline)
+    assert tm.explain_unavailable() is None
+
+    factors = tm.local_factors(patients[0], top_n=4)
+
+    assert len(factors) == 4
+    assert {f["feature"] for f in factors} <= set(tm.feature_names)
+    magnitudes = [abs(f["shap"]) for f in factors]
+    assert magnitudes == sorted(magnitudes, reverse=True)
+    hba1c1 = next(f for f in tm.local_factors(patients[0], top_n=len(tm.feature_names))
+                  if f["feature"].endswith("HbA1c1"))
+    assert hba1c1["value"] == patients[0].hba1c3  # the latest visit's HbA1c is scored as HbA1c1
+
+
+def test_missing_shap_is_reported_once(therapy_pipeline, monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "shap", None)
+    tm = TherapyModel(therapy_pipeline)
+
+    assert tm.explain_unavailable() == "shap is not installed"
+    assert tm.explain_unavailable() == "shap is not installed"
+    assert capsys.readouterr().out.count("shap is not installed") == 1
+
+
+def test_explain_without_shap_says_why(api, monkeypatch):
+    monkeypatch.setitem(sys.modules, "shap", None)
+    monkeypatch.setattr(main, "get_groq_client", lambda: FakeGroq("insight"))
+
+    body = api.post("/predict-therapy-pathline?explain=true", json=therapy_payloads(1)[0]).json()
+
+    assert body["local_factors"] is None
+    assert body["local_factors_unavailable"] == "shap is not installed"
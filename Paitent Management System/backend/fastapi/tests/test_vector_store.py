@@ -0,0 +1,156 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import main
+import vector_store
+from vector_store import LocalVectorIndex, PineconeRetriever, write_index
+
+MODEL = "text-embedding-3-small"
+
+
+def clustered(n: int = 3000, dim: int = 48, clusters: int = 30, seed: int = 0) -> np.ndarray:
+    """Vectors around a few directions, like embeddings of chunks from a handful of topics."""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim))
+    return (centres[rng.integers(clusters, size=n)] + 0.35 * rng.standard_normal((n, dim))).astype(np.float32)
+
+
+def brute_force(vectors: np.ndarray, q: np.ndarray, k: int) -> np.ndarray:
+    v = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(v @ (q / np.linalg.norm(q))), kind="stable")[:k]
+
+
+def build(path, vectors, model=MODEL, ivf_lists=0):
+    ids = [f"doc-{i}" for i in range(len(vectors))]
+    write_index(str(path), ids, vectors, [{"text": f"text {i}"} for i in range(len(vectors))], model, ivf_lists)
+    return str(path)
+
+
+def test_exact_search_matches_brute_force(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "SEARCH_BATCH_ROWS", 97)  # several blocks to merge
+    vectors = clustered(1000)
+    index = LocalVectorIndex(build(tmp_path / "idx", vectors), model=MODEL)
+    queries = clustered(5, seed=1)
+
+    for q, (rows, scores) in zip(queries, index.search(queries, top_k=10)):
+        assert rows.tolist() == brute_force(vectors, q, 10).tolist()
+        assert np.all(np.diff(scores) <= 0)
+
+
+def test_ivf_recall(tmp_path):
+    vectors = clustered()
+    exact = LocalVectorIndex(build(tmp_path / "exact", vectors))
+    ivf = LocalVectorIndex(build(tmp_path / "ivf", vectors, ivf_lists=32), nprobe=6)
+    queries = clustered(50, seed=2)
+    assert ivf.manifest["ivf_lists"] == 32
+
+    truth = [set(rows.tolist()) for rows, _ in exact.search(queries, top_k=10)]
+    found = [set(rows.tolist()) for rows, _ in ivf.search(queries, top_k=10)]
+    recall = np.mean([len(t & f) / 10 for t, f in zip(truth, found)])
+    assert recall >= 0.9
+
+    # Probing every list is exact search
+    every = ivf.search(queries, top_k=10, nprobe=32)
+    assert [set(rows.tolist()) for rows, _ in every] == truth
+
+
+def test_query_returns_pinecone_shaped_matches(tmp_path):
+    vectors = clustered(200)
+    index = LocalVectorIndex(build(tmp_path / "idx", vectors))
+
+    result = index.query(vectors[7].tolist(), top_k=2)
+
+    assert result["matches"][0] == {"id": "doc-7", "score": pytest.approx(1.0, abs=1e-5),
+                                    "metadata": {"text": "text 7"}}
+    assert len(result["matches"]) == 2
+    assert "metadata" not in index.query(vectors[7], top_k=1, include_metadata=False)["matches"][0]
+
+
+def test_wrong_query_dimension_is_rejected(tmp_path):
+    index = LocalVectorIndex(build(tmp_path / "idx", clustered(50)))
+    with pytest.raises(ValueError, match="dimension"):
+        index.query([0.1] * 10)
+
+
+def test_index_built_with_another_model_is_refused(tmp_path):
+    path = build(tmp_path / "idx", clustered(50), model="text-embedding-ada-002")
+    with pytest.raises(ValueError, match="text-embedding-ada-002"):
+        LocalVectorIndex(path, model=MODEL)
+    assert LocalVectorIndex(path).model == "text-embedding-ada-002"
+
+
+def test_index_without_recorded_model_loads_with_a_warning(tmp_path, capsys):
+    path = build(tmp_path / "idx", clustered(50), model=None)
+    LocalVectorIndex(path, model=MODEL)
+    assert "does not record its embedding model" in capsys.readouterr().out
+
+
+def test_rebuild_replaces_the_index_atomically(tmp_path):
+    path = build(tmp_path / "idx", clustered(50))
+    vectors = clustered(80, seed=3)
+    np.save(tmp_path / "staged.npy", vectors)
+    staged = np.load(tmp_path / "staged.npy", mmap_mode="r")
+
+    write_index(path, ["a", "b"], staged, [{"text": "a"}, {"text": "b"}], MODEL, rows=[5, 9])
+
+    index = LocalVectorIndex(path)
+    assert len(index) == 2 and index.ids == ["a", "b"]
+    np.testing.assert_allclose(index.vectors[1], vectors[9] / np.linalg.norm(vectors[9]), rtol=1e-6)
+    assert sorted(os.listdir(tmp_path)) == ["idx", "staged.npy"]
+
+
+def test_failed_rebuild_keeps_the_old_index(tmp_path):
+    path = build(tmp_path / "idx", clustered(50))
+    with pytest.raises(ValueError, match="matching lengths"):
+        write_index(path, ["only-one"], clustered(3), [{}], MODEL)
+    assert len(LocalVectorIndex(path)) == 50
+    assert sorted(os.listdir(tmp_path)) == ["idx"]
+
+
+def test_build_command_reads_jsonl(tmp_path):
+    vectors = clustered(40)
+    with open(tmp_path / "chunks.jsonl", "w") as f:
+        for i, v in enumerate(vectors):
+            f.write(json.dumps({"id": f"c{i}", "text": f"chunk {i}", "embedding": v.tolist()}) + "\n")
+
+    vector_store.main(["build", "--jsonl", str(tmp_path / "chunks.jsonl"), "--out", str(tmp_path / "idx")])
+
+    index = LocalVectorIndex(str(tmp_path / "idx"), model=MODEL)
+    assert index.query(vectors[3], top_k=1)["matches"][0]["metadata"] == {"text": "chunk 3"}
+
+
+def test_pinecone_adapter_passes_the_namespace():
+    class Index:
+        def query(self, **kwargs):
+            self.kwargs = kwargs
+            return {"matches": []}
+
+    index = Index()
+    PineconeRetriever(index, namespace="books-v2").query([0.1], top_k=4)
+    assert index.kwargs == {"vector": [0.1], "top_k": 4, "include_metadata": True, "namespace": "books-v2"}
+    PineconeRetriever(index).query([0.1])
+    assert "namespace" not in index.kwargs
+
+
+def test_service_uses_the_local_backend(tmp_path, monkeypatch):
+    vectors = clustered(100, dim=1536)
+    monkeypatch.setenv("RETRIEVER_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_INDEX_DIR", build(tmp_path / "idx", vectors))
+    monkeypatch.setattr(main, "_retriever", None)
+
+    retriever = main.get_retriever()
+
+    assert isinstance(retriever, LocalVectorIndex) and not retriever.blocking
+    assert retriever.query(vectors[0], top_k=1)["matches"][0]["id"] == "doc-0"
+
+
+def test_service_refuses_a_local_index_for_another_model(tmp_path, monkeypatch):
+    monkeypatch.setenv("RETRIEVER_BACKEND", "local")
+    monkeypatch.setenv("LOCAL_INDEX_DIR", build(tmp_path / "idx", clustered(20), model="text-embedding-3-large"))
+    monkeypatch.setattr(main, "_retriever", None)
+
+    with pytest.raises(ValueError, match="text-embedding-3-large"):
+        main.get_retriever()
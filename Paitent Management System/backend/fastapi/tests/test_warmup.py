@@ -0,0 +1,99 @@
+import threading
+import time
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def warmup(monkeypatch):
+    """Fresh warm-up state; ``loaders`` adds fake resources to WARMUP_LOADERS."""
+    monkeypatch.setattr(main, "_warmup", {"started": False, "done": False, "resources": {}})
+    monkeypatch.delenv("WARMUP_RESOURCES", raising=False)
+    monkeypatch.delenv("WARMUP_OPTIONAL", raising=False)
+
+    def loaders(**fns):
+        for name, fn in fns.items():
+            monkeypatch.setitem(main.WARMUP_LOADERS, name, fn)
+
+    return loaders
+
+
+def boom():
+    raise RuntimeError("no credentials")
+
+
+def test_resources_load_in_parallel(warmup):
+    barrier = threading.Barrier(2, timeout=5)  # a serial warm-up would time out here
+    warmup(a=barrier.wait, b=barrier.wait)
+
+    main.run_warmup(["a", "b"], parallel=True)
+
+    resources = main._warmup["resources"]
+    assert [r["status"] for r in resources.values()] == ["ready", "ready"]
+    assert all(r["seconds"] >= 0 for r in resources.values())
+    assert main._warmup["done"]
+
+
+def test_failed_load_is_recorded_and_the_rest_still_load(warmup):
+    loaded = []
+    warmup(a=boom, b=lambda: loaded.append("b"))
+
+    main.run_warmup(["a", "b"], parallel=False)
+
+    failed = main._warmup["resources"]["a"]
+    assert (failed["status"], failed["error"]) == ("failed", "no credentials")
+    assert loaded == ["b"]
+
+
+def test_ready_waits_for_warmup(api, warmup):
+    assert api.get("/ready").status_code == 503  # not started
+    warmup(slow=lambda: time.sleep(0.2))
+    worker = threading.Thread(target=main.run_warmup, args=(["slow"],))
+    worker.start()
+    time.sleep(0.05)
+
+    warming = api.get("/ready")
+    assert (warming.status_code, warming.json()["status"]) == (503, "warming")
+    assert warming.json()["resources"]["slow"]["status"] == "loading"
+    assert api.get("/health").status_code == 200
+
+    worker.join()
+    assert api.get("/ready").json()["status"] == "ready"
+
+
+def test_failed_resource_blocks_readiness_unless_optional(api, warmup, monkeypatch):
+    warmup(groq=boom)
+    main.run_warmup(["ridge", "groq"])
+
+    failed = api.get("/ready")
+    assert (failed.status_code, failed.json()["status"]) == (503, "failed")
+    assert failed.json()["resources"]["ridge"]["status"] == "ready"
+
+    monkeypatch.setenv("WARMUP_OPTIONAL", "groq")
+    assert api.get("/ready").status_code == 200
+
+
+def test_resource_names(warmup, monkeypatch):
+    monkeypatch.setattr(main, "ENABLED_FEATURES", {"risk"})
+    assert main._warmup_names() == ["ridge"]
+
+    monkeypatch.setenv("WARMUP_RESOURCES", "therapy, nope ,mysql")
+    assert main._warmup_names() == ["therapy", "mysql"]
+
+
+def test_startup_warms_up_in_the_background(api, warmup, monkeypatch):
+    started = threading.Event()
+    release = threading.Event()
+    warmup(slow=lambda: (started.set(), release.wait(5)))
+    monkeypatch.setenv("WARMUP_RESOURCES", "slow")
+
+    with api:  # runs the startup hooks
+        assert started.wait(5)
+        assert api.get("/ready").status_code == 503
+        release.set()
+        deadline = time.monotonic() + 5
+        while not main._warmup["done"] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert api.get("/ready").status_code == 200
@@ -0,0 +1,182 @@
+import threading
+import time
+
+import pytest
+
+import main
+import metrics
+from conftest import metric_value, risk_rows
+from write_behind import WriteBehindQueue
+
+
+class Sink:
+    """``flush_fn`` that records batches; the first ``fail`` calls raise."""
+
+    def __init__(self, fail: int = 0):
+        self.batches = []
+        self.attempts = 0
+        self.fail = fail
+
+    def __call__(self, rows):
+        self.attempts += 1
+        if self.attempts <= self.fail:
+            raise RuntimeError("Lost connection to MySQL server")
+        self.batches.append(list(rows))
+
+
+def wait_for(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def row(pid: int, score: float = 5.0) -> tuple:
+    return (pid, score, "Moderate", "risk_v1", None)
+
+
+def test_rows_are_written_in_batches():
+    sink = Sink()
+    writer = WriteBehindQueue(sink, batch_size=3, flush_interval=0.2)
+
+    for pid in range(7):
+        writer.put(row(pid))
+    wait_for(lambda: writer.stats()["written"] == 7)
+
+    assert [len(b) for b in sink.batches] == [3, 3, 1]
+    assert writer.stats()["flushes"] == 3
+
+
+def test_only_the_newest_score_per_patient_is_written():
+    sink = Sink()
+    writer = WriteBehindQueue(sink, flush_interval=0.1)
+
+    writer.put(row(1, 5.0))
+    writer.put(row(2, 6.0))
+    writer.put(row(1, 7.0))
+    wait_for(lambda: sink.batches)
+
+    assert [sorted(b) for b in sink.batches] == [[row(1, 7.0), row(2, 6.0)]]
+
+
+def test_failed_flush_is_retried_with_backoff():
+    sink = Sink(fail=2)
+    writer = WriteBehindQueue(sink, flush_interval=0.01, backoff=0.05)
+    retried = metric_value(metrics.WRITE_BEHIND_ROWS, result="retried")
+
+    start = time.monotonic()
+    writer.put(row(1))
+    wait_for(lambda: sink.batches)
+
+    assert time.monotonic() - start >= 0.05 + 0.1  # 0.05s, then 0.1s
+    assert writer.stats()["retries"] == 2 and writer.stats()["dropped"] == 0
+    assert metric_value(metrics.WRITE_BEHIND_ROWS, result="retried") == retried + 2
+
+
+def test_batch_is_dropped_after_the_last_retry(capsys):
+    sink = Sink(fail=100)
+    writer = WriteBehindQueue(sink, flush_interval=0.01, max_retries=2, backoff=0.01)
+    dropped = metric_value(metrics.WRITE_BEHIND_ROWS, result="dropped")
+
+    writer.put(row(1))
+    writer.put(row(2))
+    wait_for(lambda: writer.stats()["dropped"] == 2)
+
+    assert sink.attempts == 3
+    assert metric_value(metrics.WRITE_BEHIND_ROWS, result="dropped") == dropped + 2
+    assert "Dropping 2 risk scores after 3 attempt(s)" in capsys.readouterr().out
+
+
+def test_full_queue_writes_synchronously():
+    entered, release = threading.Event(), threading.Event()
+    written = []
+
+    def flush(rows):
+        if not entered.is_set():
+            entered.set()
+            release.wait(5)  # the worker is stuck on a slow database
+        written.extend(rows)
+
+    writer = WriteBehindQueue(flush, max_size=1, flush_interval=0.01)
+    writer.put(row(1))
+    assert entered.wait(5)
+    writer.put(row(2))  # fills the queue
+    threading.Timer(0.1, release.set).start()
+
+    writer.put(row(3))  # waits for the database instead of being lost
+
+    assert writer.stats()["sync_writes"] == 1
+    writer.close()
+    assert sorted(r[0] for r in written) == [1, 2, 3]
+
+
+def test_synchronous_write_is_not_overwritten_by_older_rows():
+    db = {}
+    sink = Sink(fail=1)  # the worker's first flush fails and waits out a backoff
+    writer = WriteBehindQueue(lambda rows: sink(rows) or db.update((r[0], r[1]) for r in rows),
+                              max_size=1, flush_interval=0.01, backoff=0.2)
+
+    writer.put(row(1, 5.0))
+    wait_for(lambda: sink.attempts == 1)  # 5.0 is held for a retry
+    writer.put(row(1, 6.0))  # fills the queue
+    writer.put(row(1, 9.0))  # written synchronously
+    assert db == {1: 9.0}
+
+    wait_for(lambda: writer.stats()["retries"] == 1 and writer.stats()["depth"] == 0)
+    writer.close()
+    assert db == {1: 9.0}  # neither older score landed after it
+    assert writer.stats()["sync_writes"] == 1 and writer.stats()["written"] == 1
+
+
+def test_close_flushes_what_is_queued():
+    sink = Sink()
+    writer = WriteBehindQueue(sink, flush_interval=30)
+    for pid in range(4):
+        writer.put(row(pid))
+
+    start = time.monotonic()
+    writer.close()
+    assert time.monotonic() - start < 1  # without waiting out the flush interval
+    writer.put(row(9))  # after shutdown rows are written directly
+
+    assert sorted(r[0] for b in sink.batches for r in b) == [0, 1, 2, 3, 9]
+    assert metric_value(metrics.WRITE_BEHIND_DEPTH) == 0
+
+
+def updates(conn) -> list:
+    return [(q, p) for q, p in conn.queries if q.startswith("UPDATE patients")]
+
+
+def test_fresh_scores_are_saved_in_one_update_on_shutdown(api, fake_mysql, monkeypatch):
+    monkeypatch.setattr(main, "WRITE_BEHIND_ENABLED", True)
+    monkeypatch.setenv("WRITE_BEHIND_FLUSH_SECONDS", "0.3")
+    X = risk_rows(3)
+
+    with api:  # the shutdown hook closes the writer
+        for pid, features in zip((31, 32, 33), X):
+            response = api.post("/risk-dashboard", json={"features": features.tolist(), "patient_id": pid})
+            assert response.status_code == 200
+
+    ((query, params),) = updates(fake_mysql)
+    assert params[-3:] == (31, 32, 33) and fake_mysql.commits == 1
+    assert main._score_writer.stats()["written"] == 3
+
+
+@pytest.mark.parametrize("column", [True, False])
+def test_feature_hash_column_is_optional(api, fake_mysql, monkeypatch, column, capsys):
+    monkeypatch.setattr(main, "_feature_hash_column", None)
+    fake_mysql.respond = lambda query, params: (
+        [("risk_feature_hash",)] if column and query.startswith("SHOW COLUMNS") else []
+    )
+
+    main.write_latest_many_to_mysql([row(1, 5.0), row(2, 6.0)])
+    main.latest_get(1)
+
+    ((query, params),) = updates(fake_mysql)
+    select = next(q for q, _ in fake_mysql.queries if q.startswith("SELECT last_risk_score"))
+    assert ("risk_feature_hash = CASE" in query) is column
+    assert len(params) == query.count("%s")
+    assert select.endswith(("risk_feature_hash FROM patients WHERE id = %s" if column
+                            else "NULL FROM patients WHERE id = %s"))
+    assert len([q for q, _ in fake_mysql.queries if q.startswith("SHOW COLUMNS")]) == 1  # checked once
+    assert ("risk_feature_hash is missing" in capsys.readouterr().out) is not column
@@ -0,0 +1,182 @@
+"""The therapy-effectiveness model as served: pipeline and/or compiled forest.
+
+``TherapyModel`` wraps the sklearn pipeline (``therapy_effectiveness_model.pkl``)
+and/or its compiled forest (forest_model.py) and scores whole visit pathlines
+from the input columns built by patient_features.
+"""
+import os
+import threading
+
+import numpy as np
+
+import patient_features
+
+# Therapy pipeline input columns (training order) -> PatientData attribute
+THERAPY_INPUT_FIELDS = {
+    'INSULIN REGIMEN': 'insulin_regimen',
+    'HbA1c1': 'hba1c1',
+    'HbA1c2': 'hba1c2',
+    'HbA1c3': 'hba1c3',
+    'HbA1c_Delta_1_2': 'hba1c_delta_1_2',
+    'Gap from initial visit (days)': 'gap_initial_visit',
+    'Gap from first clinical visit (days)': 'gap_first_clinical',
+    'eGFR': 'egfr',
+    'Reduction (%)': 'reduction_percent',
+    'FVG1': 'fvg1',
+    'FVG2': 'fvg2',
+    'FVG3': 'fvg3',
+    'FVG_Delta_1_2': 'fvg_delta_1_2',
+    'DDS1': 'dds1',
+    'DDS3': 'dds3',
+    'DDS_Trend_1_3': 'dds_trend_1_3',
+}
+THERAPY_VISITS = patient_features.THERAPY_VISITS
+
+
+def patient_inputs(patients: list["PatientData"]) -> dict[str, np.ndarray]:
+    """Therapy pipeline input columns for request payloads (see patient_features.therapy_inputs)."""
+    return {
+        col: np.array([getattr(p, attr) for p in patients],
+                      dtype=object if col == patient_features.THERAPY_CATEGORY else float)
+        for col, attr in THERAPY_INPUT_FIELDS.items()
+    }
+
+
+class TherapyModel:
+    """Loaded therapy pipeline plus everything derived from it at load time.
+
+    Feature names, the positive-class index, the sorted global importances and
+    the array layout used to bypass pandas/ColumnTransformer never change
+    between requests, so they are computed once here. ``feature_importances_``
+    in particular is re-averaged over all trees on every attribute access.
+
+    With a compiled ``forest`` (see forest_model.py) probabilities come from
+    the vectorised NumPy evaluator; the sklearn ``pipeline`` is then optional
+    and only needed for SHAP explanations.
+    """
+
+    def __init__(self, pipeline=None, top_n: int = 5, forest=None):
+        if pipeline is None and forest is None:
+            raise ValueError("TherapyModel needs a pipeline or a compiled forest")
+        self.pipeline = pipeline
+        self.forest = forest
+        self.preprocessor = pipeline.named_steps['preprocessor'] if pipeline is not None else None
+        self.classifier = pipeline.named_steps['classifier'] if pipeline is not None else None
+        source = forest if forest is not None else self.classifier
+        if forest is not None:
+            self.input_columns = list(forest.manifest["input_columns"])
+            self.feature_names = list(forest.feature_names)
+        else:
+            self.input_columns = list(self.preprocessor.feature_names_in_)
+            self.feature_names = [str(n) for n in self.preprocessor.get_feature_names_out()]
+        self.positive_index = int(np.flatnonzero(source.classes_ == 1)[0])
+
+        importances = np.asarray(source.feature_importances_, dtype=float)
+        order = np.argsort(importances)[::-1]
+        self.sorted_importances = [(self.feature_names[i], float(importances[i])) for i in order]
+        self.top_factors = [
+            {"feature": name, "importance": round(score, 4)} for name, score in self.sorted_importances[:top_n]
+        ]
+
+        self.layout = self._array_layout()
+        # Large batches go back to sklearn when it is loaded (see forest_model.BATCH_CROSSOVER_ROWS)
+        self.forest_max_rows = int(os.getenv("THERAPY_FOREST_MAX_ROWS", "512"))
+        self._explainer = None
+        self._explainer_lock = threading.Lock()
+        self._warned_no_shap = False
+
+    def _array_layout(self) -> dict | None:
+        """Reproduce ColumnTransformer(OneHotEncoder, remainder='passthrough').
+
+        A category -> column map plus a fixed numeric column order lets a batch
+        be a single float matrix handed straight to the classifier. Returns None
+        if the pipeline does not have that shape (the DataFrame path is used).
+        """
+        try:
+            if self.forest is not None:
+                spec = self.forest.layout
+            else:
+                from forest_model import onehot_layout
+                spec = onehot_layout(self.preprocessor)
+            if spec["column"] != patient_features.THERAPY_CATEGORY:
+                raise ValueError("unexpected therapy preprocessor layout")
+            return {"categories": list(spec["categories"]), "numeric_columns": list(spec["numeric_columns"])}
+        except Exception as e:
+            if self.forest is not None:
+                raise
+            print("[THERAPY] Falling back to DataFrame input path:", e)
+            return None
+
+    def visit_matrix(self, inputs: dict[str, np.ndarray]) -> np.ndarray:
+        """Model-ready rows for every visit of every patient (``n * 3`` rows)."""
+        return patient_features.therapy_visit_matrix(inputs, self.layout)
+
+    def predict_pathlines(self, patients: list["PatientData"]) -> np.ndarray:
+        """Probabilities for every visit of every patient, shape ``(n, 3)``."""
+        return self.predict_inputs(patient_inputs(patients))
+
+    def predict_inputs(self, inputs: dict[str, np.ndarray]) -> np.ndarray:
+        """``predict_pathlines`` for input columns, e.g. from patient_features.therapy_inputs.
+
+        All visit rows are built up front and scored with a single
+        ``predict_proba`` call.
+        """
+        n_visits = len(THERAPY_VISITS)
+        n = len(inputs[patient_features.THERAPY_CATEGORY])
+        if not n:
+            return np.zeros((0, n_visits))
+        if self.forest is not None and (self.classifier is None or n * n_visits <= self.forest_max_rows):
+            proba = self.forest.predict_proba(self.visit_matrix(inputs))[:, self.positive_index]
+        elif self.layout is not None:
+            proba = self.classifier.predict_proba(self.visit_matrix(inputs))[:, self.positive_index]
+        else:
+            import pandas as pd
+            frame = pd.DataFrame({col: np.repeat(inputs[col], n_visits) for col in THERAPY_INPUT_FIELDS})
+            frame['HbA1c1'] = np.column_stack([inputs[v] for v in THERAPY_VISITS]).reshape(-1)
+            proba = self.pipeline.predict_proba(frame)[:, self.positive_index]
+        return proba.reshape(n, n_visits)
+
+    def get_explainer(self):
+        """shap.TreeExplainer over the forest, built once (None if shap is not installed)."""
+        if self._explainer is None and self.classifier is not None:
+            with self._explainer_lock:
+                if self._explainer is None:
+                    try:
+                        import shap
+                    except ImportError:
+                        if not self._warned_no_shap:
+                            self._warned_no_shap = True
+                            print("[THERAPY] shap is not installed; explain=true returns local_factors_unavailable")
+                        return None
+                    self._explainer = shap.TreeExplainer(self.classifier)
+        return self._explainer
+
+    def explain_unavailable(self) -> str | None:
+        """Why ``local_factors`` cannot run in this process, or None if it can."""
+        if self.classifier is None:
+            return "the therapy pickle is not loaded (THERAPY_LOAD_PICKLE=false)"
+        if self.layout is None:
+            return "the therapy pipeline has no array layout"
+        if self.get_explainer() is None:
+            return "shap is not installed"
+        return None
+
+    def local_factors(self, patient: "PatientData", top_n: int = 5) -> list[dict] | None:
+        """SHAP contributions toward the positive class for the patient's latest visit.
+
+        None when explanations are unavailable; ``explain_unavailable`` says why.
+        """
+        explainer = self.get_explainer()
+        if explainer is None or self.layout is None:
+            return None
+        row = self.visit_matrix(patient_inputs([patient]))[-1:]
+        values = explainer.shap_values(row)
+        if isinstance(values, list):  # older shap: one array per class
+            contrib = np.asarray(values[self.positive_index])[0]
+        else:  # newer shap: (n_samples, n_features, n_classes)
+            contrib = np.asarray(values)[0, :, self.positive_index]
+        order = np.argsort(np.abs(contrib))[::-1][:top_n]
+        return [
+            {"feature": self.feature_names[i], "value": float(row[0, i]), "shap": round(float(contrib[i]), 4)}
+            for i in order
+        ]
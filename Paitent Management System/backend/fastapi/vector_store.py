@@ -0,0 +1,308 @@
+"""Local vector index for RAG retrieval.
+
+An alternative to the hosted Pinecone ``medicalbooks-1536`` index. The book
+chunk embeddings live in a directory on disk:
+
+    manifest.json     dimension, count, embedding model, IVF settings
+    vectors.npy       float32 (count, dim), L2-normalised rows; memory-mapped
+    metadata.jsonl    one {"id": ..., "metadata": {...}} object per row
+    ivf_centroids.npy optional (n_lists, dim) coarse quantiser
+    ivf_order.npy     optional row ids grouped by list
+    ivf_offsets.npy   optional (n_lists + 1) start offsets into ivf_order
+
+Exact search is a batched dot product over the memory-mapped matrix; with an
+IVF index only the ``nprobe`` closest lists are scanned. ``query`` returns the
+same shape as ``pinecone.Index.query`` so callers do not care which backend
+answered.
+
+Build an index from a JSONL export ({"id", "text", "embedding"} per line):
+
+    python vector_store.py build --jsonl chunks.jsonl --out vector_index --ivf-lists 64
+
+or copy the current Pinecone index:
+
+    python vector_store.py export-pinecone --index medicalbooks-1536 --out vector_index
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SEARCH_BATCH_ROWS = 65536  # rows scored per matmul; bounds peak memory on large corpora
+
+
+def _normalise(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return x / norms
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the ``k`` largest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    idx = np.argpartition(-scores, k - 1)[:k]
+    return idx[np.argsort(-scores[idx], kind="stable")]
+
+
+def train_ivf(vectors: np.ndarray, n_lists: int, iters: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means; returns ``(centroids, assignment)``."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    n_lists = max(1, min(n_lists, n))
+    centroids = np.array(vectors[rng.choice(n, n_lists, replace=False)], dtype=np.float32)
+    assign = np.zeros(n, dtype=np.int32)
+    for _ in range(iters):
+        for start in range(0, n, SEARCH_BATCH_ROWS):
+            block = np.asarray(vectors[start:start + SEARCH_BATCH_ROWS], dtype=np.float32)
+            assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        for c in range(n_lists):
+            members = np.flatnonzero(assign == c)
+            if len(members):
+                centroids[c] = np.asarray(vectors[members], dtype=np.float32).sum(axis=0)
+            else:  # re-seed empty lists
+                centroids[c] = vectors[rng.integers(n)]
+        centroids = _normalise(centroids)
+    return centroids, assign
+
+
+def write_index(path: str, ids: list[str], vectors, metadatas, model: str, ivf_lists: int = 0,
+                rows=None) -> None:
+    """Write a complete index to ``path``, replacing any existing one atomically.
+
+    ``vectors`` may be a memory map: it is normalised into the new
+    ``vectors.npy`` block by block, so the corpus never has to fit in memory.
+    ``rows`` selects (in order) the rows of ``vectors`` to keep; ``ids`` and
+    ``metadatas`` are aligned with the kept rows and may be iterators.
+    """
+    if np.ndim(vectors) != 2:
+        raise ValueError("vectors must be a 2-D array")
+    rows = np.arange(vectors.shape[0]) if rows is None else np.asarray(rows, dtype=np.int64)
+    count, dimension = len(rows), int(vectors.shape[1])
+
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".vector_index-", dir=parent)
+    try:
+        out = np.lib.format.open_memmap(os.path.join(tmp, "vectors.npy"), mode="w+", dtype=np.float32,
+                                        shape=(count, dimension))
+        for start in range(0, count, SEARCH_BATCH_ROWS):
+            out[start:start + SEARCH_BATCH_ROWS] = _normalise(vectors[rows[start:start + SEARCH_BATCH_ROWS]])
+        out.flush()
+        written = 0
+        with open(os.path.join(tmp, "metadata.jsonl"), "w", encoding="utf-8") as f:
+            for id_, meta in zip(ids, metadatas):
+                f.write(json.dumps({"id": id_, "metadata": meta}, ensure_ascii=False) + "\n")
+                written += 1
+        if written != count:
+            raise ValueError("ids, vectors and metadatas must have matching lengths")
+
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "dimension": dimension,
+            "count": count,
+            "model": model,
+            "metric": "cosine",
+            "ivf_lists": 0,
+        }
+        if ivf_lists and count > ivf_lists:
+            centroids, assign = train_ivf(out, ivf_lists)
+            order = np.argsort(assign, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(assign[order], np.arange(len(centroids) + 1)).astype(np.int64)
+            np.save(os.path.join(tmp, "ivf_centroids.npy"), centroids)
+            np.save(os.path.join(tmp, "ivf_order.npy"), order)
+            np.save(os.path.join(tmp, "ivf_offsets.npy"), offsets)
+            manifest["ivf_lists"] = int(len(centroids))
+        with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.isdir(path):
+            old = path + ".old"
+            shutil.rmtree(old, ignore_errors=True)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old, ignore_errors=True)
+        else:
+            os.replace(tmp, path)
+    except Exception:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+class LocalVectorIndex:
+    """Read-only, memory-mapped vector index (see module docstring for the format).
+
+    ``model`` is the embedding model queries will be embedded with; an index
+    built with a different one is refused, since its scores would be
+    meaningless. Indexes that do not record their model load with a warning.
+    """
+
+    blocking = False  # in-process and fast; no need to offload to a thread
+
+    def __init__(self, path: str, nprobe: int = 8, model: str | None = None):
+        self.path = path
+        with open(os.path.join(path, "manifest.json"), encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector index format in {path}")
+        self.dimension = int(self.manifest["dimension"])
+        self.model = self.manifest.get("model")
+        if model is not None:
+            if not self.model:
+                print(f"⚠️ [VECTOR] {path} does not record its embedding model; assuming {model}")
+            elif self.model != model:
+                raise ValueError(
+                    f"{path} was built with embedding model {self.model!r} but queries use {model!r}; "
+                    "rebuild the index (ingest_books.py / vector_store.py) with the serving model"
+                )
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+
+        self.ids: list[str] = []
+        self.metadata: list[dict] = []
+        with open(os.path.join(path, "metadata.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                self.ids.append(row["id"])
+                self.metadata.append(row.get("metadata") or {})
+
+        self.nprobe = nprobe
+        self.centroids = self.order = self.offsets = None
+        if self.manifest.get("ivf_lists"):
+            self.centroids = np.load(os.path.join(path, "ivf_centroids.npy"))
+            self.order = np.load(os.path.join(path, "ivf_order.npy"), mmap_mode="r")
+            self.offsets = np.load(os.path.join(path, "ivf_offsets.npy"))
+
+    def __len__(self) -> int:
+        return int(self.vectors.shape[0])
+
+    def _exact(self, q: np.ndarray, top_k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Exact top-k for each row of ``q`` (already normalised), scanning in blocks."""
+        best_idx = [np.empty(0, dtype=np.int64)] * len(q)
+        best_score = [np.empty(0, dtype=np.float32)] * len(q)
+        for start in range(0, len(self), SEARCH_BATCH_ROWS):
+            block = self.vectors[start:start + SEARCH_BATCH_ROWS]
+            scores = q @ block.T  # (n_queries, block_rows)
+            for i in range(len(q)):
+                local = _top_k(scores[i], top_k)
+                cand_idx = np.concatenate([best_idx[i], local + start])
+                cand_score = np.concatenate([best_score[i], scores[i, local]])
+                keep = _top_k(cand_score, top_k)
+                best_idx[i], best_score[i] = cand_idx[keep], cand_score[keep]
+        return list(zip(best_idx, best_score))
+
+    def _ivf(self, q: np.ndarray, top_k: int, nprobe: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        results = []
+        lists = np.argsort(-(q @ self.centroids.T), axis=1)[:, :nprobe]
+        for qi, probe in zip(q, lists):
+            rows = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+            if rows.size == 0:
+                results.append((rows.astype(np.int64), np.empty(0, dtype=np.float32)))
+                continue
+            rows.sort()  # sequential reads from the memory map
+            scores = self.vectors[rows] @ qi
+            keep = _top_k(scores, top_k)
+            results.append((rows[keep].astype(np.int64), scores[keep]))
+        return results
+
+    def search(self, queries, top_k: int = 3, nprobe: int | None = None) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Top-k ``(row_indices, scores)`` for one query vector or a batch of them."""
+        q = _normalise(np.atleast_2d(queries))
+        if q.shape[1] != self.dimension:
+            raise ValueError(f"Query dimension {q.shape[1]} does not match index dimension {self.dimension}")
+        if self.centroids is not None:
+            return self._ivf(q, top_k, nprobe or self.nprobe)
+        return self._exact(q, top_k)
+
+    def query(self, vector, top_k: int = 3, include_metadata: bool = True, **_) -> dict:
+        """Pinecone-compatible single query."""
+        (rows, scores), = self.search(vector, top_k=top_k)
+        return {
+            "matches": [
+                {
+                    "id": self.ids[r],
+                    "score": float(s),
+                    **({"metadata": self.metadata[r]} if include_metadata else {}),
+                }
+                for r, s in zip(rows, scores)
+            ]
+        }
+
+
+class PineconeRetriever:
+    """Thin adapter so the hosted index exposes the same interface as LocalVectorIndex."""
+
+    blocking = True  # network call; run it off the event loop
+
+    def __init__(self, index, namespace: str = ""):
+        self.index = index
+        self.namespace = namespace
+
+    def query(self, vector, top_k: int = 3, include_metadata: bool = True, **kwargs) -> dict:
+        if self.namespace:
+            kwargs.setdefault("namespace", self.namespace)
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=include_metadata, **kwargs)
+
+
+def _cmd_build(args) -> None:
+    ids, vectors, metadatas = [], [], []
+    with open(args.jsonl, encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            row = json.loads(line)
+            ids.append(str(row.get("id", f"chunk-{i}")))
+            vectors.append(row["embedding"])
+            metadatas.append(row.get("metadata") or {"text": row["text"]})
+    write_index(args.out, ids, np.asarray(vectors, dtype=np.float32), metadatas, args.model, args.ivf_lists)
+    print(f"Wrote {len(ids)} vectors to {args.out}")
+
+
+def _cmd_export_pinecone(args) -> None:
+    from pinecone import Pinecone
+
+    api_key = os.getenv("PINECONE_API_KEY")
+    if not api_key:
+        raise SystemExit("PINECONE_API_KEY not set")
+    index = Pinecone(api_key=api_key).Index(args.index)
+    ids, vectors, metadatas = [], [], []
+    for id_batch in index.list(namespace=args.namespace):
+        fetched = index.fetch(ids=list(id_batch), namespace=args.namespace).vectors
+        for id_ in id_batch:
+            v = fetched.get(id_)
+            if v is None:
+                continue
+            ids.append(id_)
+            vectors.append(v.values)
+            metadatas.append(dict(v.metadata or {}))
+    write_index(args.out, ids, np.asarray(vectors, dtype=np.float32), metadatas, args.model, args.ivf_lists)
+    print(f"Exported {len(ids)} vectors from {args.index} to {args.out}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build a local vector index for RAG retrieval.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="build from a JSONL file of {id, text, embedding}")
+    build.add_argument("--jsonl", required=True)
+    build.set_defaults(func=_cmd_build)
+
+    export = sub.add_parser("export-pinecone", help="copy an existing Pinecone index")
+    export.add_argument("--index", default="medicalbooks-1536")
+    export.add_argument("--namespace", default="")
+    export.set_defaults(func=_cmd_export_pinecone)
+
+    for p in (build, export):
+        p.add_argument("--out", default="vector_index")
+        p.add_argument("--model", default="text-embedding-3-small")
+        p.add_argument("--ivf-lists", type=int, default=0, help="0 = exact search only")
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Write-behind persistence of fresh risk scores.
+
+Request handlers ``put()`` rows whose first element is the patient id, e.g.
+``(patient_id, score, label, model_version, feature_hash)``, and return
+immediately; a background thread drains the bounded queue and hands
+``flush_fn`` one batch at a time (``write_latest_many_to_mysql`` writes a
+batch as a single multi-row UPDATE). A batch is written once it has
+``batch_size`` rows or ``flush_interval`` seconds after its first row. A row
+is only written while it is the newest one put for its patient, so an older
+score that is still queued (or waiting out a retry) never overwrites a newer
+one written synchronously.
+
+A failing ``flush_fn`` is retried with exponential backoff up to
+``max_retries`` times before the batch is dropped (and counted). When the
+queue is full ``put()`` writes the row synchronously instead, so a slow
+database applies back-pressure rather than losing scores. ``close()``
+flushes whatever is queued, one attempt per batch; it runs on application
+shutdown.
+"""
+import os
+import queue
+import threading
+import time
+
+import metrics
+
+
+class WriteBehindQueue:
+    def __init__(self, flush_fn, max_size: int = 10000, batch_size: int = 500, flush_interval: float = 0.5,
+                 max_retries: int = 5, backoff: float = 0.5, max_backoff: float = 30.0):
+        self.flush_fn = flush_fn
+        self.max_size = max(1, max_size)
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._queue: queue.Queue = queue.Queue(self.max_size)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._closed = False
+        self._seq = 0
+        self._newest: dict = {}  # patient id -> sequence number of its newest unwritten row
+        self._stats = {"queued": 0, "written": 0, "flushes": 0, "retries": 0, "dropped": 0, "sync_writes": 0}
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive fork; start one per process on first use
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(self.max_size)
+                self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def put(self, row: tuple) -> None:
+        with self._lock:
+            self._seq += 1
+            item = (self._seq, row)
+            self._newest[row[0]] = self._seq
+        if self._closed:
+            self._write([item])
+            return
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats["sync_writes"] += 1
+            self._write([item])
+            return
+        with self._lock:
+            self._stats["queued"] += 1
+        metrics.WRITE_BEHIND_DEPTH.set(self._queue.qsize())
+
+    def _take(self, block: bool) -> list:
+        """Next batch: waits for a first row (if ``block``) then up to flush_interval for more."""
+        try:
+            first = self._queue.get(timeout=1.0) if block else self._queue.get_nowait()
+        except queue.Empty:
+            return []
+        batch = [first]
+        deadline = time.monotonic() + (self.flush_interval if block else 0)
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0 and not self._closed:
+                    # Short waits, so close() does not sit out a long flush interval
+                    batch.append(self._queue.get(timeout=min(remaining, 0.05)))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                if remaining <= 0 or self._closed:
+                    break
+        metrics.WRITE_BEHIND_DEPTH.set(self._queue.qsize())
+        return batch
+
+    def _run(self) -> None:
+        while not self._closed:
+            batch = self._take(block=True)
+            if batch:
+                self._write(batch, retry=True)
+
+    def _current(self, batch: list) -> list:
+        """``(seq, row)`` items of ``batch`` that are still their patient's newest row."""
+        with self._lock:
+            return [(seq, row) for seq, row in batch if self._newest.get(row[0]) == seq]
+
+    def _settle(self, items: list) -> None:
+        with self._lock:
+            for seq, row in items:
+                if self._newest.get(row[0]) == seq:
+                    del self._newest[row[0]]
+
+    def _write(self, batch: list, retry: bool = False) -> None:
+        """Write ``(seq, row)`` items; checked and flushed under one lock so writes land in put() order."""
+        attempt = 0
+        while True:
+            try:
+                with self._flush_lock:
+                    items = self._current(batch)
+                    if not items:
+                        return
+                    self.flush_fn([row for _, row in items])
+            except Exception as e:
+                attempt += 1
+                if not retry or attempt > self.max_retries or self._closed:
+                    print(f"[WRITE-BEHIND] Dropping {len(items)} risk scores after {attempt} attempt(s): {e}")
+                    metrics.WRITE_BEHIND_ROWS.inc(len(items), result="dropped")
+                    self._settle(items)
+                    with self._lock:
+                        self._stats["dropped"] += len(items)
+                    return
+                metrics.WRITE_BEHIND_ROWS.inc(len(items), result="retried")
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(min(self.backoff * 2 ** (attempt - 1), self.max_backoff))
+                continue
+            metrics.WRITE_BEHIND_ROWS.inc(len(items), result="written")
+            self._settle(items)
+            with self._lock:
+                self._stats["written"] += len(items)
+                self._stats["flushes"] += 1
+            return
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Stop the worker and write everything still queued (one attempt per batch)."""
+        self._closed = True
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        while True:
+            batch = self._take(block=False)
+            if not batch:
+                break
+            self._write(batch)
+        metrics.WRITE_BEHIND_DEPTH.set(0)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "depth": self._queue.qsize(),
+                "max_size": self.max_size,
+                "batch_size": self.batch_size,
+                "flush_interval": self.flush_interval,
+                **self._stats,
+            }
@@ -0,0 +1,37 @@
+const fastApiBaseURL = import.meta.env.VITE_FASTAPI_URL || 'http://127.0.0.1:5000';
+
+// POST a JSON body to a FastAPI streaming endpoint and call onEvent(event, data)
+// for every Server-Sent Event received. Resolves when the stream ends.
+export async function postSse(path, body, onEvent, { signal } = {}) {
+  const res = await fetch(`${fastApiBaseURL}${path}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+    body: JSON.stringify(body),
+    signal,
+  });
+  if (!res.ok || !res.body) {
+    throw new Error(`Stream request failed: ${res.status}`);
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    let sep;
+    while ((sep = buffer.indexOf('\n\n')) !== -1) {
+      const raw = buffer.slice(0, sep);
+      buffer = buffer.slice(sep + 2);
+      let event = 'message';
+      let data = '';
+      raw.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) event = line.slice(6).trim();
+        else if (line.startsWith('data:')) data += line.slice(5).trim();
+      });
+      onEvent(event, data ? JSON.parse(data) : {});
+    }
+  }
+}
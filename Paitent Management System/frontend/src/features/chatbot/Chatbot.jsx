@@ -11,6 +11,7 @@ import {
     Legend
 } from 'chart.js';
 import Card from '@/components/Card.jsx';
+import { postSse } from '@/api/sse';
 import {
     Bot,
     Loader2,
@@ -176,8 +177,11 @@ function Chatbot() {
         setInput("");
         setLoading(true);
 
+        // Set once the placeholder bot message exists, so a failure fills it in rather than adding another
+        let updateAnswer = null;
+        let answer = '';
+
         try {
-            const fastApiUrl = import.meta.env.VITE_FASTAPI_URL || "http://127.0.0.1:5000";
             const payload = {
                 patient,
                 query: trimmedQuery,
@@ -187,28 +191,40 @@ function Chatbot() {
                 payload.context = trimmedContext;
             }
 
-            const res = await fetch(`${fastApiUrl}/chatbot-patient-query`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify(payload)
-            });
-
-            const data = await res.json();
-            const cleanedText = typeof data.response === 'string'
-                ? data.response.replace(/<think>[\s\S]*?<\/think>/g, '').trim()
-                : data.response;
-
+            // Stream the answer into a placeholder bot message as tokens arrive
             setMessages(prev => [
                 ...prev,
                 {
-                    text: cleanedText,
+                    text: '',
                     user: false,
                     contextSummary: trimmedContext || undefined,
                 },
             ]);
+            updateAnswer = (text) => setMessages(prev => [
+                ...prev.slice(0, -1),
+                { ...prev[prev.length - 1], text },
+            ]);
+
+            await postSse('/chatbot-patient-query/stream', payload, (event, data) => {
+                if (event === 'token') {
+                    answer += data.text;
+                    updateAnswer(answer);
+                } else if (event === 'error') {
+                    throw new Error(data.detail || "AI is currently unavailable.");
+                }
+            });
+            if (!answer) {
+                throw new Error("The answer stream ended without any text.");
+            }
         } catch (error) {
             console.error("Error:", error);
-            setMessages(prev => [...prev, { text: "⚠️ AI is currently unavailable.", user: false }]);
+            const notice = "⚠️ AI is currently unavailable.";
+            if (updateAnswer) {
+                // Keep whatever part of the answer arrived before the failure
+                updateAnswer(answer ? `${answer}\n\n${notice}` : notice);
+            } else {
+                setMessages(prev => [...prev, { text: notice, user: false }]);
+            }
         } finally {
             setLoading(false);
             if (trimmedContext) {
@@ -63,46 +63,32 @@ const RiskDashboard = () => {
   };
 
   useEffect(() => {
+    // Patients and the cohort summary load in parallel; the summary carries
+    // every score, so the first paint needs no per-patient scoring requests.
     patientsApi.getAll().then((data) => {
       setPatients(data);
       setFiltered(data);
-      runPredictions(data); // Trigger prediction API
     });
+    runPredictions();
   }, []);
 
-  const runPredictions = (data) => {
-    // Reset results and fire all requests in parallel; update as each completes
-    setRiskResults({});
-    data.forEach((patient) => {
-      const features = [
-        parseFloat(patient.hba1c_1st_visit),
-        parseFloat(patient.hba1c_2nd_visit),
-        parseFloat(patient.fvg_1),
-        parseFloat(patient.fvg_2),
-        parseFloat(patient.avg_fvg_1_2),
-        parseFloat(patient.reduction_a),
-      ];
-
-      if (features.some((val) => isNaN(val))) return; // skip invalid
-
-      fastApiClient
-        .post('/risk-dashboard?force=false', {
-          features,
-          patient_id: Number(patient.id),
-          model_version: 'risk_v1',
-          patient,
-        })
-        .then((res) => {
-          const rawValue = parseFloat(res.data.prediction);
+  const runPredictions = (refresh = false) => {
+    fastApiClient
+      .get('/risk-summary', { params: { scores: true, top: 0, refresh } })
+      .then((res) => {
+        const { patient_id: ids = [], prediction = [], risk_label: labels = [] } = res.data.scores || {};
+        const next = {};
+        ids.forEach((id, i) => {
+          const rawValue = parseFloat(prediction[i]);
           const value = Number.isFinite(rawValue) ? rawValue.toFixed(2) : '—';
-          const label = res.data.risk_label || mapNumericRisk(rawValue);
-          setRiskResults((prev) => ({ ...prev, [patient.id]: { value, label } }));
-        })
-        .catch(() => {
-          // eslint-disable-next-line no-console
-          console.error(`Prediction failed for ${patient.name}`);
+          next[id] = { value, label: labels[i] || mapNumericRisk(rawValue) };
         });
-    });
+        setRiskResults(next);
+      })
+      .catch(() => {
+        // eslint-disable-next-line no-console
+        console.error('Risk summary failed');
+      });
   };
 
   useEffect(() => {
@@ -232,7 +218,7 @@ const RiskDashboard = () => {
                 />
               </div>
               <button
-                onClick={() => runPredictions(patients)}
+                onClick={() => runPredictions(true)}
                 className="inline-flex items-center justify-center gap-1.5 text-sm px-3 py-2 rounded-full border border-emerald-200 bg-emerald-50 text-emerald-700 hover:bg-emerald-100 focus-visible:outline-none focus-visible:ring-2 focus-visible:ring-emerald-400"
                 type="button"
               >
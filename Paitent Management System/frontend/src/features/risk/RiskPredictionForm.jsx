@@ -26,50 +26,16 @@ function RiskPredictionForm() {
         if (cancelled) return;
         setPatientData(data);
 
-        const features = [
-          parseFloat(data.hba1c_1st_visit),
-          parseFloat(data.hba1c_2nd_visit),
-          parseFloat(data.fvg_1),
-          parseFloat(data.fvg_2),
-          parseFloat(data.avg_fvg_1_2),
-          parseFloat(data.reduction_a)
-        ];
-
-        if (features.some(val => isNaN(val))) {
-          setError('Invalid or missing input data.');
-          setLoading(false); // stop page skeleton
-          return;
-        }
-
         // Show page immediately; risk fetch runs in background
         setLoading(false);
 
         const doFetchRisk = async () => {
           if (cancelled) return;
-          // 1) Try Laravel DB first for instant UI
-          const apiBase = (import.meta.env.VITE_LARAVEL_URL || 'http://127.0.0.1:8000').replace(/\/$/, '');
-          try {
-            const pRes = await fetch(`${apiBase}/api/patients/${id}`);
-            if (pRes.ok) {
-              const p = await pRes.json();
-              if (p && p.last_risk_score != null) {
-                const numericRisk = parseFloat(p.last_risk_score);
-                const riskLabel = p.last_risk_label || mapNumericRisk(numericRisk);
-                const riskColor = getRiskColor(riskLabel);
-                setResult({ value: numericRisk.toFixed(2), label: riskLabel, color: riskColor, raw: numericRisk });
-                setLastUpdated(p.last_predicted_at ? new Date(p.last_predicted_at).toLocaleString() : new Date().toLocaleString());
-                setRiskStale(false);
-                pollAttemptsRef.current = 0;
-                return; // Served from DB cache; skip FastAPI
-              }
-            }
-          } catch (_) {
-            // ignore, fall through to FastAPI
-          }
-
-          // 2) No DB value yet -> compute via FastAPI
+          // The service builds the model features from the patient record and answers
+          // from its cache / the saved score when it can; a stale saved score comes
+          // back immediately with stale=true and is recomputed in the background,
+          // so poll briefly for the refreshed value
           const predictionRes = await fastApiClient.post('/risk-dashboard?force=false', {
-            features,
             patient_id: Number(id),
             model_version: 'risk_v1',
             patient: data,
@@ -82,46 +48,27 @@ function RiskPredictionForm() {
           
           setResult({ value: numericRisk.toFixed(2), label: riskLabel, color: riskColor, raw: numericRisk });
           setLastUpdated(new Date().toLocaleString());
-          setRiskStale(false); // No longer using stale logic
+          setRiskStale(Boolean(predictionRes.data.stale));
+          if (predictionRes.data.stale && pollAttemptsRef.current < 5) {
+            pollAttemptsRef.current += 1;
+            setTimeout(doFetchRisk, 1500);
+            return;
+          }
           
-          // Persist to Laravel if this was a fresh calculation (not cached)
-          if (!isCached && Number.isFinite(numericRisk)) {
-            console.log('💾 Saving risk to Laravel database...', {
-              patient_id: id,
-              score: numericRisk,
-              label: riskLabel,
-            });
-            try {
-              const saveResponse = await fetch(`${apiBase}/api/patients/${id}/risk`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({
-                  score: numericRisk,
-                  label: riskLabel,
-                  model_version: predictionRes.data.model_version || 'risk_v1',
-                  predicted_at: new Date().toISOString(),
-                }),
-              });
-              
-              if (!saveResponse.ok) {
-                const errorText = await saveResponse.text();
-                console.error('❌ Laravel save failed:', saveResponse.status, errorText);
-              } else {
-                const saveData = await saveResponse.json();
-                console.log('✅ Risk saved to database:', saveData);
-              }
-            } catch (e) {
-              console.error('❌ Failed to persist risk to Laravel:', e);
-            }
-          } else if (isCached) {
+          // Fresh scores are persisted by FastAPI itself (batched write-behind), so no
+          // separate POST /api/patients/{id}/risk is needed here
+          if (isCached) {
             console.log('✅ Risk loaded from database cache (patient_id:', id, ')');
           }
           
           pollAttemptsRef.current = 0;
         };
 
-        // initial risk fetch (non-blocking)
-        doFetchRisk();
+        // initial risk fetch (non-blocking); 422 = incomplete visit data
+        doFetchRisk().catch((err) => {
+          if (cancelled) return;
+          setError(err?.response?.status === 422 ? 'Invalid or missing input data.' : 'Failed to fetch or predict.');
+        });
       } catch (err) {
         setError('Failed to fetch or predict.');
         setLoading(false);
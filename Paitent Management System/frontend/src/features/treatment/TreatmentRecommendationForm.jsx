@@ -27,6 +27,7 @@ import {
 ChartJS.register(CategoryScale, LinearScale, PointElement, LineElement, Tooltip, Legend);
 import { useParams } from 'react-router-dom';
 import { patientsApi } from '@/api/patients';
+import { postSse } from '@/api/sse';
 
 const TreatmentRecommendation = () => {
   const { id } = useParams();
@@ -45,11 +46,12 @@ const TreatmentRecommendation = () => {
     if (!patient) return;
     setLoading(true);
     try {
-      const fastApiUrl = import.meta.env.VITE_FASTAPI_URL || "http://localhost:5000";
-      const response = await fetch(`${fastApiUrl}/treatment-recommendation`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({
+      // Stream the report so text appears as soon as the first tokens arrive
+      let report = "";
+      setAiResponse("");
+      await postSse(
+        "/treatment-recommendation/stream",
+        {
           patient,
           question: `
 Please analyze the following diabetic patient's data and return a structured treatment report using markdown headers (##) with the following sections:
@@ -78,12 +80,19 @@ Instructions:
 - Lifestyle Advice must be short bullets (≤ 15 words per point).
 - Do not fabricate or generalize outside of context.
 `
-        })
-      });
-      const data = await response.json();
-      setAiResponse(data.response);
-      setRagContext(data.context || "");
-      localStorage.setItem(`report-${id}`, data.response);
+        },
+        (event, data) => {
+          if (event === "token") {
+            report += data.text;
+            setAiResponse(report);
+          } else if (event === "context") {
+            setRagContext(data.context_used || "");
+          } else if (event === "error") {
+            throw new Error(data.detail);
+          }
+        }
+      );
+      localStorage.setItem(`report-${id}`, report);
     } catch (err) {
       setAiResponse("⚠️ Failed to retrieve AI-generated recommendation.");
     } finally {